@@ -0,0 +1,44 @@
+"""Chunker fingerprints and per-chunk triage results
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19
+
+Triage used to record only a document-level priority. Chunks of documents
+already triaged are given their document's priority, so a later re-chunk
+keeps them as triaged instead of billing them again; it is the best value
+on record and an upper bound, which keeps the pre-filter conservative when
+it trains on them. Anomalies recorded before this revision keep a NULL
+chunk_id and are kept when the document's chunks are replaced, since
+they cannot be traced to the chunk that produced them.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "002"
+down_revision: Union[str, None] = "001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("documents", sa.Column("chunk_fingerprint", sa.String(64)))
+    op.add_column("chunks", sa.Column("priority_score", sa.Float))
+    op.add_column("anomalies", sa.Column("chunk_id", sa.String(36), sa.ForeignKey("chunks.id")))
+    op.create_index("ix_anomalies_chunk_id", "anomalies", ["chunk_id"])
+    op.execute(
+        """
+        UPDATE chunks SET priority_score = d.priority_score
+        FROM documents d
+        WHERE chunks.document_id = d.id AND d.status = 'triaged' AND d.priority_score IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_anomalies_chunk_id", table_name="anomalies")
+    op.drop_column("anomalies", "chunk_id")
+    op.drop_column("chunks", "priority_score")
+    op.drop_column("documents", "chunk_fingerprint")
@@ -0,0 +1,49 @@
+"""HNSW index over half-precision or binary-quantized chunk embeddings
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+
+Only the index VECTOR_SEARCH_MODE searches is built, and none for "exact".
+To switch modes, downgrade to 003 and upgrade again with the new setting;
+a request whose vector_mode has no index falls back to a sequential scan.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from watchdog.config import settings
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Expression indexes: no extra columns are stored, only the index is compact.
+    # halfvec halves index memory, bit(384) cuts it 32x. Queries must use the
+    # same expressions (see watchdog.services.search.coarse_distance).
+    if settings.vector_search_mode == "halfvec":
+        index_sql = (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_halfvec "
+            "ON chunks USING hnsw ((embedding::halfvec(384)) halfvec_cosine_ops)"
+        )
+    elif settings.vector_search_mode == "binary":
+        index_sql = (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_binary "
+            "ON chunks USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops)"
+        )
+    elif settings.vector_search_mode == "exact":
+        return
+    else:
+        raise ValueError(f"Unknown vector search mode: {settings.vector_search_mode}")
+
+    with op.get_context().autocommit_block():
+        op.execute(index_sql)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_embedding_binary")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_embedding_halfvec")
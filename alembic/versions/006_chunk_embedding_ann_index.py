@@ -0,0 +1,49 @@
+"""ANN index on full-precision chunk embeddings
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+Skipped when VECTOR_SEARCH_MODE is a compact mode: those search the index
+from 004 and rerank candidates by id, so a full-precision graph would only
+add memory.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from watchdog.config import settings
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Build parameters come from Settings (VECTOR_INDEX_TYPE, HNSW_M, ...).
+    # To rebuild with different parameters, downgrade to 005 and upgrade again.
+    if settings.vector_search_mode != "exact":
+        return
+    if settings.vector_index_type == "ivfflat":
+        index_sql = (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_ann "
+            "ON chunks USING ivfflat (embedding vector_cosine_ops) "
+            f"WITH (lists = {int(settings.ivfflat_lists)})"
+        )
+    elif settings.vector_index_type == "hnsw":
+        index_sql = (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_ann "
+            "ON chunks USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)})"
+        )
+    else:
+        raise ValueError(f"Unknown vector index type: {settings.vector_index_type}")
+
+    with op.get_context().autocommit_block():
+        op.execute(index_sql)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_embedding_ann")
@@ -0,0 +1,40 @@
+"""Stored tsvector with a GIN index for lexical chunk search
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+
+Unlike the index builds in this series, adding a STORED generated column
+rewrites the whole chunks table under an ACCESS EXCLUSIVE lock: search,
+embedding and triage all block until it finishes, which takes as long as
+computing every chunk's tsvector. Run it in a maintenance window. The GIN
+index is then built concurrently.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Generated from the redacted text when present, matching what search returns.
+    # The 'english' config must match FTS_CONFIG in watchdog.services.search.
+    op.execute(
+        "ALTER TABLE chunks ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(filtered_text, text))) STORED"
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_search_vector "
+            "ON chunks USING gin (search_vector)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chunks_search_vector")
+    op.drop_column("chunks", "search_vector")
@@ -0,0 +1,37 @@
+"""Indexes backing structured filters on chunk search
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns); the composite indexes let the filter subqueries in
+# watchdog.services.search run as index-only scans.
+INDEXES = [
+    ("ix_documents_status", "documents", "status"),
+    ("ix_documents_priority_score", "documents", "priority_score"),
+    ("ix_documents_source_type", "documents", "source_type"),
+    ("ix_anomalies_severity_document", "anomalies", "severity, document_id"),
+    ("ix_entity_mentions_entity_chunk", "entity_mentions", "entity_id, chunk_id"),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
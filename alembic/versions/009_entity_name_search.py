@@ -0,0 +1,35 @@
+"""Trigram index on entity names for fuzzy lookup
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        # Serves the similarity (%) operator used by /entities/search
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_entities_name_trgm "
+            "ON entities USING gin (name gin_trgm_ops)"
+        )
+        # Lets the in-process prefix index load only recently changed entities
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_entities_updated_at ON entities (updated_at)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_entities_updated_at")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_entities_name_trgm")
@@ -0,0 +1,43 @@
+"""Message Batches triage bookkeeping
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "triage_batches",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("batch_id", sa.String(100), unique=True),
+        sa.Column("model", sa.String(100), nullable=False),
+        sa.Column("status", sa.String(50), nullable=False, server_default="pending", index=True),
+        sa.Column("request_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("succeeded_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("failed_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("ended_at", sa.DateTime(timezone=True)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.add_column(
+        "chunks",
+        sa.Column("triage_batch_id", sa.String(36), sa.ForeignKey("triage_batches.id")),
+    )
+    op.create_index("ix_chunks_triage_batch_id", "chunks", ["triage_batch_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunks_triage_batch_id", table_name="chunks")
+    op.drop_column("chunks", "triage_batch_id")
+    op.drop_table("triage_batches")
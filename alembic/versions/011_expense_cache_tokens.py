@@ -0,0 +1,26 @@
+"""Prompt-cache token counts on expenses
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("expenses", sa.Column("cache_read_tokens", sa.Integer, nullable=False, server_default="0"))
+    op.add_column("expenses", sa.Column("cache_write_tokens", sa.Integer, nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    op.drop_column("expenses", "cache_write_tokens")
+    op.drop_column("expenses", "cache_read_tokens")
@@ -0,0 +1,68 @@
+"""Unique (name, entity_type) on entities for bulk upserts
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19
+
+Duplicates left by the old select-then-insert path are merged into the
+oldest row of each (name, entity_type): mentions and relationships are
+repointed and mention counts summed. Stop triage while this runs, or a
+new duplicate can make the unique index build fail.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "013"
+down_revision: Union[str, None] = "012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TEMP TABLE entity_merge ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, first_value(id) OVER (
+                PARTITION BY name, entity_type ORDER BY created_at, id
+            ) AS keep_id
+            FROM entities
+        ) ranked
+        WHERE id <> keep_id
+        """
+    )
+    op.execute(
+        "UPDATE entity_mentions m SET entity_id = e.keep_id FROM entity_merge e WHERE m.entity_id = e.id"
+    )
+    op.execute(
+        "UPDATE entity_relationships r SET source_entity_id = e.keep_id "
+        "FROM entity_merge e WHERE r.source_entity_id = e.id"
+    )
+    op.execute(
+        "UPDATE entity_relationships r SET target_entity_id = e.keep_id "
+        "FROM entity_merge e WHERE r.target_entity_id = e.id"
+    )
+    op.execute(
+        """
+        UPDATE entities k SET mention_count = k.mention_count + s.total, updated_at = now()
+        FROM (
+            SELECT e.keep_id, sum(d.mention_count) AS total
+            FROM entity_merge e JOIN entities d ON d.id = e.id
+            GROUP BY e.keep_id
+        ) s
+        WHERE k.id = s.keep_id
+        """
+    )
+    op.execute("DELETE FROM entities WHERE id IN (SELECT id FROM entity_merge)")
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_entities_name_type "
+            "ON entities (name, entity_type)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_entities_name_type")
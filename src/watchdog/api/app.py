@@ -1,6 +1,37 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import structlog
 from fastapi import FastAPI
 
 from watchdog.api.routes import anomalies, documents, entities, pipeline, search, stats
+from watchdog.config import settings
+from watchdog.database import init_db
+
+log = structlog.get_logger()
+
+
+async def warm_up_embeddings() -> None:
+    from watchdog.services.embedding import get_thread_pool, warm_up_model
+
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(get_thread_pool(), warm_up_model)
+    except Exception as e:
+        # Search will retry the load on first use
+        log.error("embedding_warmup_failed", error=str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await init_db()
+    # Warm the embedding model in the background so startup and /health
+    # aren't blocked while it loads
+    warmup = asyncio.create_task(warm_up_embeddings()) if settings.embedding_warmup else None
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
 
 
 def create_app() -> FastAPI:
@@ -8,6 +39,7 @@ def create_app() -> FastAPI:
         title="Watchdog Pipeline",
         description="Automated document analysis pipeline — ingest, OCR, chunk, embed, and triage large document dumps",
         version="0.1.0",
+        lifespan=lifespan,
     )
 
     # Mount all route modules under /api/v1
@@ -1,8 +1,13 @@
+import numpy as np
 from fastapi import APIRouter, HTTPException, Query
-from sqlalchemy import func, select
+from sqlalchemy import case, func, select
 
 from watchdog.api.deps import DbSession
+from watchdog.database import is_sqlite
 from watchdog.models.document import Chunk, Document
+from watchdog.services.search import apply_ann_settings
+from watchdog.services.snippets import preview
+from watchdog.services.vector_index import top_k
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
@@ -46,18 +51,25 @@ async def list_documents(
 
 
 @router.get("/{document_id}")
-async def get_document(document_id: str, db: DbSession):
+async def get_document(document_id: str, db: DbSession, include_text: bool = False):
     result = await db.execute(select(Document).where(Document.id == document_id))
     doc = result.scalar_one_or_none()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
     chunk_result = await db.execute(
-        select(Chunk)
+        select(
+            Chunk.id,
+            Chunk.chunk_index,
+            func.coalesce(Chunk.filtered_text, Chunk.text).label("text"),
+            Chunk.token_count,
+            Chunk.page_start,
+            Chunk.page_end,
+        )
         .where(Chunk.document_id == document_id)
         .order_by(Chunk.chunk_index)
     )
-    chunks = chunk_result.scalars().all()
+    chunks = chunk_result.all()
 
     return {
         "id": doc.id,
@@ -73,7 +85,8 @@ async def get_document(document_id: str, db: DbSession):
             {
                 "id": c.id,
                 "chunk_index": c.chunk_index,
-                "text": c.filtered_text or c.text,
+                "snippet": preview(c.text),
+                **({"text": c.text} if include_text else {}),  # full text only on request
                 "token_count": c.token_count,
                 "page_start": c.page_start,
                 "page_end": c.page_end,
@@ -81,3 +94,66 @@ async def get_document(document_id: str, db: DbSession):
             for c in chunks
         ],
     }
+
+
+@router.get("/{document_id}/similar")
+async def similar_documents(
+    document_id: str,
+    db: DbSession,
+    limit: int = Query(default=10, le=50),
+):
+    result = await db.execute(
+        select(Document.id, Document.embedding).where(Document.id == document_id)
+    )
+    row = result.one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if row.embedding is None:
+        raise HTTPException(status_code=409, detail="Document has not been embedded yet")
+
+    columns = (Document.id, Document.filename, Document.source_type, Document.status, Document.priority_score)
+    if is_sqlite():
+        # Embedded backend: exact scan over the (few) document centroids
+        centroids = (
+            await db.execute(
+                select(Document.id, Document.embedding)
+                .where(Document.embedding.isnot(None), Document.id != document_id)
+            )
+        ).all()
+        if not centroids:
+            return {"document_id": document_id, "similar": []}
+        idx, distances = top_k(np.stack([c.embedding for c in centroids]), row.embedding, limit)
+        distance = case(
+            {centroids[i].id: float(d) for i, d in zip(idx, distances)}, value=Document.id
+        ).label("distance")
+        similar_result = await db.execute(
+            select(*columns, distance)
+            .where(Document.id.in_([centroids[i].id for i in idx]))
+            .order_by(distance)
+        )
+    else:
+        # One ANN lookup over the document centroid index; ef_search must cover
+        # the document itself, which the index returns and the filter drops
+        await apply_ann_settings(db, min_candidates=limit + 1)
+        distance = Document.embedding.cosine_distance(row.embedding).label("distance")
+        similar_result = await db.execute(
+            select(*columns, distance)
+            .where(Document.embedding.isnot(None), Document.id != document_id)
+            .order_by(distance)
+            .limit(limit)
+        )
+
+    return {
+        "document_id": document_id,
+        "similar": [
+            {
+                "id": d.id,
+                "filename": d.filename,
+                "source_type": d.source_type,
+                "status": d.status,
+                "priority_score": d.priority_score,
+                "distance": float(d.distance),
+            }
+            for d in similar_result.all()
+        ],
+    }
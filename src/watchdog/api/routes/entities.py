@@ -3,6 +3,7 @@ from sqlalchemy import func, select
 
 from watchdog.api.deps import DbSession
 from watchdog.models.document import Entity, EntityMention, EntityRelationship
+from watchdog.services.entity_index import search_entities
 
 router = APIRouter(prefix="/entities", tags=["entities"])
 
@@ -41,6 +42,19 @@ async def list_entities(
     }
 
 
+# Declared before /{entity_id} so "search" is not taken as an id
+@router.get("/search")
+async def entity_search(
+    db: DbSession,
+    q: str = Query(..., min_length=1, max_length=200),
+    entity_type: str | None = None,
+    limit: int = Query(default=10, le=50),
+    fuzzy: bool = True,
+):
+    results = await search_entities(db, q, limit=limit, entity_type=entity_type, fuzzy=fuzzy)
+    return {"query": q, "results": results, "count": len(results)}
+
+
 @router.get("/{entity_id}")
 async def get_entity(entity_id: str, db: DbSession):
     result = await db.execute(select(Entity).where(Entity.id == entity_id))
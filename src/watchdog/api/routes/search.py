@@ -1,18 +1,79 @@
+from typing import Annotated, Literal
+
 from pydantic import BaseModel, Field
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 
 from watchdog.api.deps import DbSession
-from watchdog.services.embedding import search_similar
+from watchdog.database import is_sqlite
+from watchdog.services.search import search_hybrid, search_similar, search_similar_batch
 
 router = APIRouter(prefix="/search", tags=["search"])
 
 
+class SearchFilters(BaseModel):
+    status: list[str] | None = None  # document status, e.g. ["triaged"]
+    source_type: list[str] | None = None
+    min_priority: float | None = Field(default=None, ge=0, le=1)
+    max_priority: float | None = Field(default=None, ge=0, le=1)
+    entity_id: str | None = None  # only chunks that mention this entity
+    anomaly_severity: list[Literal["low", "medium", "high", "critical"]] | None = None
+
+
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=1000)
     limit: int = Field(default=10, le=50)
+    # "hybrid" fuses full-text and vector rankings; better for exact names and IDs
+    mode: Literal["vector", "hybrid"] = "vector"
+    # Compact-index search with full-precision rerank; defaults to VECTOR_SEARCH_MODE
+    vector_mode: Literal["exact", "halfvec", "binary"] | None = None
+    # Per-query recall/latency knobs; default to HNSW_EF_SEARCH / IVFFLAT_PROBES
+    ef_search: int | None = Field(default=None, ge=1, le=1000)
+    probes: int | None = Field(default=None, ge=1)
+    filters: SearchFilters | None = None
+    # Hits carry a snippet; the full chunk text is only returned on request
+    include_text: bool = False
+
+
+class BatchSearchRequest(BaseModel):
+    # Embedded in one model call; vector lookups run concurrently
+    queries: list[Annotated[str, Field(min_length=1, max_length=1000)]] = Field(
+        ..., min_length=1, max_length=500
+    )
+    limit: int = Field(default=10, le=50)
+    vector_mode: Literal["exact", "halfvec", "binary"] | None = None
+    ef_search: int | None = Field(default=None, ge=1, le=1000)
+    probes: int | None = Field(default=None, ge=1)
+    filters: SearchFilters | None = None
+    include_text: bool = False
 
 
 @router.post("")
 async def semantic_search(request: SearchRequest, db: DbSession):
-    results = await search_similar(request.query, db, limit=request.limit)
-    return {"query": request.query, "results": results, "count": len(results)}
+    if request.mode == "hybrid" and is_sqlite():
+        raise HTTPException(status_code=400, detail="Hybrid search requires the Postgres backend")
+    search = search_hybrid if request.mode == "hybrid" else search_similar
+    results = await search(
+        request.query,
+        db,
+        limit=request.limit,
+        mode=request.vector_mode,
+        ef_search=request.ef_search,
+        probes=request.probes,
+        filters=request.filters.model_dump(exclude_none=True) if request.filters else None,
+        include_text=request.include_text,
+    )
+    return {"query": request.query, "mode": request.mode, "results": results, "count": len(results)}
+
+
+@router.post("/batch")
+async def batch_search(request: BatchSearchRequest):
+    results = await search_similar_batch(
+        request.queries,
+        limit=request.limit,
+        mode=request.vector_mode,
+        ef_search=request.ef_search,
+        probes=request.probes,
+        filters=request.filters.model_dump(exclude_none=True) if request.filters else None,
+        include_text=request.include_text,
+    )
+    return {"results": results, "count": len(results)}
@@ -3,6 +3,7 @@ from sqlalchemy import func, select
 
 from watchdog.api.deps import DbSession
 from watchdog.models.document import Anomaly, Chunk, Document, Entity, Expense
+from watchdog.services.embedding import query_cache
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
@@ -24,6 +25,9 @@ async def get_stats(db: DbSession):
     total_cost = (await db.execute(select(func.sum(Expense.cost_usd)))).scalar() or 0.0
     total_input = (await db.execute(select(func.sum(Expense.input_tokens)))).scalar() or 0
     total_output = (await db.execute(select(func.sum(Expense.output_tokens)))).scalar() or 0
+    cache_read, cache_write = (
+        await db.execute(select(func.sum(Expense.cache_read_tokens), func.sum(Expense.cache_write_tokens)))
+    ).one()
 
     # Top entities
     top_entities_result = await db.execute(
@@ -52,7 +56,10 @@ async def get_stats(db: DbSession):
             "total_usd": round(float(total_cost), 4),
             "input_tokens": int(total_input),
             "output_tokens": int(total_output),
+            "cache_read_tokens": int(cache_read or 0),
+            "cache_write_tokens": int(cache_write or 0),
         },
         "top_entities": top_entities,
         "anomaly_severity": severity_breakdown,
+        "query_embedding_cache": query_cache.stats(),
     }
@@ -1,13 +1,69 @@
 from collections.abc import AsyncGenerator
+from pathlib import Path
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
 from watchdog.config import settings
 
-engine = create_async_engine(settings.database_url, echo=False, pool_size=10, max_overflow=20)
+
+def is_sqlite(url: str = settings.database_url) -> bool:
+    """True for the embedded single-node backend (sqlite+aiosqlite:///path.db)."""
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def engine_options(url: str) -> dict:
+    if is_sqlite(url):
+        # SQLite connections are cheap; a busy timeout covers the single-writer lock
+        return {"connect_args": {"timeout": 30}}
+    return {"pool_size": 10, "max_overflow": 20}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # Let SQLAlchemy emit BEGIN itself so SAVEPOINTs (session.begin_nested) work
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _begin_sqlite(conn) -> None:
+    conn.exec_driver_sql("BEGIN")
+
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url, echo=False, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+        event.listen(engine.sync_engine, "begin", _begin_sqlite)
+    return engine
+
+
+engine = create_engine(settings.database_url)
 async_session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+async def init_db() -> None:
+    """Create the schema on the embedded backend; Postgres is managed by alembic."""
+    if not is_sqlite():
+        return
+    from watchdog.models import Base
+
+    database = make_url(settings.database_url).database
+    if database and database != ":memory:":
+        Path(database).parent.mkdir(parents=True, exist_ok=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_factory() as session:
         yield session
@@ -9,6 +9,8 @@ from watchdog.models.document import (
     Expense,
     Image,
     ProcessingJob,
+    TriageBatch,
+    TriageSkip,
     Video,
 )
 
@@ -21,6 +23,8 @@ __all__ = [
     "EntityRelationship",
     "Anomaly",
     "ProcessingJob",
+    "TriageBatch",
+    "TriageSkip",
     "Expense",
     "Image",
     "Video",
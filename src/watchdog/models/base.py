@@ -1,8 +1,11 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, func
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import DateTime, LargeBinary, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.types import TypeDecorator
 
 
 class Base(DeclarativeBase):
@@ -18,5 +21,31 @@ class TimestampMixin:
     )
 
 
+class VectorBlob(TypeDecorator):
+    """float32 embedding stored as raw bytes, for databases without pgvector."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dim: int):
+        super().__init__()
+        self.dim = dim
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype=np.float32).tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.float32)
+
+
+def embedding_type(dim: int):
+    """pgvector column on Postgres, a float32 blob on the embedded SQLite backend."""
+    return Vector(dim).with_variant(VectorBlob(dim), "sqlite")
+
+
 def new_uuid() -> str:
     return str(uuid.uuid4())
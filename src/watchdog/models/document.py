@@ -1,11 +1,11 @@
 from datetime import datetime
 
-from pgvector.sqlalchemy import Vector
 from sqlalchemy import (
     Boolean,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -13,7 +13,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from watchdog.models.base import Base, TimestampMixin, new_uuid
+from watchdog.models.base import Base, TimestampMixin, embedding_type, new_uuid
 
 
 class Document(Base, TimestampMixin):
@@ -21,15 +21,18 @@ class Document(Base, TimestampMixin):
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
     source_url: Mapped[str | None] = mapped_column(Text)
-    source_type: Mapped[str] = mapped_column(String(50))  # "doj" or "huggingface"
+    source_type: Mapped[str] = mapped_column(String(50), index=True)  # "doj" or "huggingface"
     filename: Mapped[str] = mapped_column(String(500))
     file_path: Mapped[str | None] = mapped_column(Text)
     sha256: Mapped[str] = mapped_column(String(64), unique=True, index=True)
     page_count: Mapped[int | None] = mapped_column(Integer)
     ocr_text: Mapped[str | None] = mapped_column(Text)
     ocr_method: Mapped[str | None] = mapped_column(String(50))  # "pymupdf", "tesseract"
-    status: Mapped[str] = mapped_column(String(50), default="downloaded")  # downloaded, ocr_done, chunked, privacy_filtered, triaged
-    priority_score: Mapped[float | None] = mapped_column(Float)
+    status: Mapped[str] = mapped_column(String(50), default="downloaded", index=True)  # downloaded, ocr_done, chunked, privacy_filtered, triaged
+    priority_score: Mapped[float | None] = mapped_column(Float, index=True)
+    chunk_fingerprint: Mapped[str | None] = mapped_column(String(64))  # chunker version + settings
+    # Token-weighted mean of chunk embeddings; deferred so document listings don't load it
+    embedding: Mapped[list[float] | None] = mapped_column(embedding_type(384), deferred=True)
 
     chunks: Mapped[list["Chunk"]] = relationship(back_populates="document", cascade="all, delete-orphan")
     images: Mapped[list["Image"]] = relationship(back_populates="document", cascade="all, delete-orphan")
@@ -46,10 +49,13 @@ class Chunk(Base, TimestampMixin):
     token_count: Mapped[int] = mapped_column(Integer)
     page_start: Mapped[int | None] = mapped_column(Integer)
     page_end: Mapped[int | None] = mapped_column(Integer)
-    embedding: Mapped[list[float] | None] = mapped_column(Vector(384))
+    embedding: Mapped[list[float] | None] = mapped_column(embedding_type(384))
     privacy_filtered: Mapped[bool] = mapped_column(Boolean, default=False)
     pii_found: Mapped[str | None] = mapped_column(Text)  # JSON list of PII types found
     filtered_text: Mapped[str | None] = mapped_column(Text)  # text after PII redaction
+    priority_score: Mapped[float | None] = mapped_column(Float)  # set once the chunk is triaged
+    # Set while the chunk waits in a Message Batches triage request
+    triage_batch_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("triage_batches.id"), index=True)
 
     document: Mapped["Document"] = relationship(back_populates="chunks")
     entity_mentions: Mapped[list["EntityMention"]] = relationship(back_populates="chunk", cascade="all, delete-orphan")
@@ -57,6 +63,12 @@ class Chunk(Base, TimestampMixin):
 
 class Entity(Base, TimestampMixin):
     __tablename__ = "entities"
+    __table_args__ = (
+        # Incremental refresh of the autocomplete index reads rows by updated_at
+        Index("ix_entities_updated_at", "updated_at"),
+        # Conflict target of the bulk entity upsert during triage
+        Index("uq_entities_name_type", "name", "entity_type", unique=True),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
     name: Mapped[str] = mapped_column(String(500), index=True)
@@ -75,6 +87,8 @@ class Entity(Base, TimestampMixin):
 
 class EntityMention(Base, TimestampMixin):
     __tablename__ = "entity_mentions"
+    # Index-only lookup of an entity's chunks for filtered search
+    __table_args__ = (Index("ix_entity_mentions_entity_chunk", "entity_id", "chunk_id"),)
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
     entity_id: Mapped[str] = mapped_column(String(36), ForeignKey("entities.id"), index=True)
@@ -105,9 +119,13 @@ class EntityRelationship(Base, TimestampMixin):
 
 class Anomaly(Base, TimestampMixin):
     __tablename__ = "anomalies"
+    # Index-only lookup of documents with anomalies of a given severity
+    __table_args__ = (Index("ix_anomalies_severity_document", "severity", "document_id"),)
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
     document_id: Mapped[str] = mapped_column(String(36), ForeignKey("documents.id"), index=True)
+    # NULL for anomalies recorded before per-chunk triage; those stay until the document is deleted
+    chunk_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("chunks.id"), index=True)
     anomaly_type: Mapped[str] = mapped_column(String(200))
     description: Mapped[str] = mapped_column(Text)
     severity: Mapped[str] = mapped_column(String(50))  # low, medium, high, critical
@@ -131,6 +149,31 @@ class ProcessingJob(Base, TimestampMixin):
     document: Mapped["Document | None"] = relationship()
 
 
+class TriageBatch(Base, TimestampMixin):
+    __tablename__ = "triage_batches"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
+    batch_id: Mapped[str | None] = mapped_column(String(100), unique=True)  # Anthropic message batch id
+    model: Mapped[str] = mapped_column(String(100))
+    status: Mapped[str] = mapped_column(String(50), default="pending", index=True)  # pending, submitted, applied, failed
+    request_count: Mapped[int] = mapped_column(Integer, default=0)
+    succeeded_count: Mapped[int] = mapped_column(Integer, default=0)
+    failed_count: Mapped[int] = mapped_column(Integer, default=0)
+    ended_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class TriageSkip(Base, TimestampMixin):
+    __tablename__ = "triage_skips"
+    # Audit trail of chunks the local pre-filter kept from triage; delete a row to re-queue the chunk
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_uuid)
+    chunk_id: Mapped[str] = mapped_column(String(36), ForeignKey("chunks.id"), unique=True)
+    document_id: Mapped[str] = mapped_column(String(36), ForeignKey("documents.id"), index=True)
+    score: Mapped[float] = mapped_column(Float)  # predicted probability the chunk is relevant
+    threshold: Mapped[float] = mapped_column(Float)
+    model_version: Mapped[str] = mapped_column(String(64))
+
+
 class Expense(Base, TimestampMixin):
     __tablename__ = "expenses"
 
@@ -140,6 +183,9 @@ class Expense(Base, TimestampMixin):
     operation: Mapped[str] = mapped_column(String(200))  # "privacy_filter", "triage"
     input_tokens: Mapped[int] = mapped_column(Integer, default=0)
     output_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    # Prompt-cache tokens, billed apart from input_tokens
+    cache_read_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    cache_write_tokens: Mapped[int] = mapped_column(Integer, default=0)
     cost_usd: Mapped[float] = mapped_column(Float, default=0.0)
     document_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("documents.id"))
 
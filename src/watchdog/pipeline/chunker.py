@@ -2,16 +2,23 @@ import re
 
 import structlog
 import tiktoken
-from sqlalchemy import select
+from sqlalchemy import case, delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from watchdog.config import settings
 from watchdog.database import async_session_factory
-from watchdog.models.document import Chunk, Document
+from watchdog.models.document import Anomaly, Chunk, Document, Entity, EntityMention, TriageSkip
+from watchdog.utils.hashing import sha256_bytes
 
 log = structlog.get_logger()
 
-_encoder = tiktoken.get_encoding("cl100k_base")
+TOKENIZER_NAME = "cl100k_base"
+
+# Bump whenever chunk_text() changes in a way that alters its output for the
+# same input and settings, so existing documents are picked up by re-chunking.
+CHUNKER_VERSION = 1
+
+_encoder = tiktoken.get_encoding(TOKENIZER_NAME)
 
 
 def count_tokens(text: str) -> int:
@@ -137,8 +144,122 @@ def estimate_page(char_offset: int, text: str, page_count: int) -> int:
     return min(max(1, int((char_offset / total_chars) * page_count) + 1), page_count)
 
 
+def chunker_fingerprint(
+    max_tokens: int = settings.chunk_size_tokens,
+    overlap_tokens: int = settings.chunk_overlap_tokens,
+) -> str:
+    """Identify the chunker version and settings that produced a document's chunks."""
+    config = f"v{CHUNKER_VERSION}:{TOKENIZER_NAME}:{max_tokens}:{overlap_tokens}"
+    return sha256_bytes(config.encode("utf-8"))[:16]
+
+
+def build_chunk_rows(doc: Document) -> list[dict]:
+    """Chunk a document's OCR text and attach estimated page ranges."""
+    chunks = chunk_text(doc.ocr_text or "")
+    page_count = doc.page_count or 1
+    char_offset = 0
+
+    rows = []
+    for i, chunk_data in enumerate(chunks):
+        page_start = estimate_page(char_offset, doc.ocr_text, page_count)
+        char_offset += len(chunk_data["text"])
+        page_end = estimate_page(char_offset, doc.ocr_text, page_count)
+        rows.append({
+            "chunk_index": i,
+            "text": chunk_data["text"],
+            "token_count": chunk_data["token_count"],
+            "page_start": page_start,
+            "page_end": page_end,
+        })
+    return rows
+
+
+def match_chunks(existing: list[dict], new_rows: list[dict]) -> tuple[dict[int, str], list[str]]:
+    """Pair freshly computed chunks with existing ones that have the same text and span.
+
+    Returns (kept, removed): kept maps new row index -> existing chunk id,
+    removed lists existing chunk ids with no unchanged counterpart.
+    """
+    by_key: dict[tuple, list[str]] = {}
+    for row in existing:
+        key = (row["text"], row["page_start"], row["page_end"])
+        by_key.setdefault(key, []).append(row["id"])
+
+    kept: dict[int, str] = {}
+    for i, row in enumerate(new_rows):
+        candidates = by_key.get((row["text"], row["page_start"], row["page_end"]))
+        if candidates:
+            kept[i] = candidates.pop(0)
+
+    removed = [chunk_id for ids in by_key.values() for chunk_id in ids]
+    return kept, removed
+
+
+async def delete_chunks(session: AsyncSession, chunk_ids: list[str]) -> None:
+    """Delete chunks along with the triage output attached to them."""
+    if not chunk_ids:
+        return
+
+    # Give back the mention counts contributed by the chunks being dropped
+    counts = await session.execute(
+        select(EntityMention.entity_id, func.count(EntityMention.id))
+        .where(EntityMention.chunk_id.in_(chunk_ids))
+        .group_by(EntityMention.entity_id)
+    )
+    for entity_id, n in counts.all():
+        await session.execute(
+            update(Entity)
+            .where(Entity.id == entity_id)
+            .values(mention_count=case((Entity.mention_count > n, Entity.mention_count - n), else_=0))
+        )
+
+    await session.execute(delete(EntityMention).where(EntityMention.chunk_id.in_(chunk_ids)))
+    await session.execute(delete(Anomaly).where(Anomaly.chunk_id.in_(chunk_ids)))
+    await session.execute(delete(TriageSkip).where(TriageSkip.chunk_id.in_(chunk_ids)))
+    await session.execute(delete(Chunk).where(Chunk.id.in_(chunk_ids)))
+
+
+async def rechunk_document(session: AsyncSession, doc: Document) -> dict[str, int]:
+    """Regenerate a document's chunks with the current settings.
+
+    Chunks whose text and page span are unchanged keep their row, embedding
+    and triage results; everything else is replaced.
+    """
+    result = await session.execute(
+        select(Chunk.id, Chunk.text, Chunk.page_start, Chunk.page_end)
+        .where(Chunk.document_id == doc.id)
+    )
+    existing = [row._asdict() for row in result.all()]
+
+    new_rows = build_chunk_rows(doc)
+    kept, removed = match_chunks(existing, new_rows)
+
+    await delete_chunks(session, removed)
+
+    if kept:
+        await session.execute(
+            update(Chunk),
+            [{"id": chunk_id, "chunk_index": i} for i, chunk_id in kept.items()],
+        )
+
+    created = 0
+    for i, row in enumerate(new_rows):
+        if i in kept:
+            continue
+        session.add(Chunk(document_id=doc.id, **row))
+        created += 1
+
+    if removed or created:
+        # Recomputed by the embed step once the new chunks are embedded
+        doc.embedding = None
+    doc.chunk_fingerprint = chunker_fingerprint()
+    return {"kept": len(kept), "created": created, "removed": len(removed)}
+
+
 async def run_chunking(limit: int | None = None) -> int:
     """Chunk all OCR'd documents that haven't been chunked yet."""
+    fingerprint = chunker_fingerprint()
+
     async with async_session_factory() as session:
         query = select(Document).where(Document.status == "ocr_done")
         if limit:
@@ -155,37 +276,72 @@ async def run_chunking(limit: int | None = None) -> int:
 
             # Check if already chunked
             existing = await session.execute(
-                select(Chunk).where(Chunk.document_id == doc.id).limit(1)
+                select(Chunk.id).where(Chunk.document_id == doc.id).limit(1)
             )
             if existing.scalar_one_or_none():
-                log.info("already_chunked", document_id=doc.id)
+                if doc.chunk_fingerprint != fingerprint:
+                    counts = await rechunk_document(session, doc)
+                    total_chunks += counts["created"]
+                    log.info("stale_chunks_regenerated", document_id=doc.id, **counts)
+                else:
+                    log.info("already_chunked", document_id=doc.id)
                 doc.status = "chunked"
                 continue
 
-            chunks = chunk_text(doc.ocr_text)
-            page_count = doc.page_count or 1
-            char_offset = 0
-
-            for i, chunk_data in enumerate(chunks):
-                page_start = estimate_page(char_offset, doc.ocr_text, page_count)
-                char_offset += len(chunk_data["text"])
-                page_end = estimate_page(char_offset, doc.ocr_text, page_count)
-
-                chunk = Chunk(
-                    document_id=doc.id,
-                    chunk_index=i,
-                    text=chunk_data["text"],
-                    token_count=chunk_data["token_count"],
-                    page_start=page_start,
-                    page_end=page_end,
-                )
-                session.add(chunk)
+            rows = build_chunk_rows(doc)
+            for row in rows:
+                session.add(Chunk(document_id=doc.id, **row))
 
+            doc.chunk_fingerprint = fingerprint
             doc.status = "chunked"
-            total_chunks += len(chunks)
-            log.info("document_chunked", document_id=doc.id, chunks=len(chunks))
+            total_chunks += len(rows)
+            log.info("document_chunked", document_id=doc.id, chunks=len(rows))
 
         await session.commit()
 
     log.info("chunking_complete", total_chunks=total_chunks)
     return total_chunks
+
+
+async def run_rechunking(limit: int | None = None) -> dict[str, int]:
+    """Re-chunk already chunked documents whose chunker fingerprint is stale.
+
+    Documents that gain new chunks go back to "chunked" so the embed and
+    triage steps only pick up the chunks that actually changed.
+    """
+    fingerprint = chunker_fingerprint()
+    totals = {"documents_rechunked": 0, "kept": 0, "created": 0, "removed": 0}
+
+    async with async_session_factory() as session:
+        query = select(Document).where(
+            Document.status.in_(["chunked", "triaged"]),
+            Document.ocr_text.isnot(None),
+            (Document.chunk_fingerprint.is_(None)) | (Document.chunk_fingerprint != fingerprint),
+        )
+        if limit:
+            query = query.limit(limit)
+
+        result = await session.execute(query)
+        documents = result.scalars().all()
+
+        for doc in documents:
+            counts = await rechunk_document(session, doc)
+            if counts["created"]:
+                doc.status = "chunked"
+            elif counts["removed"]:
+                doc.priority_score = (
+                    await session.execute(
+                        select(func.max(Chunk.priority_score)).where(Chunk.document_id == doc.id)
+                    )
+                ).scalar()
+
+            totals["documents_rechunked"] += 1
+            for key in ("kept", "created", "removed"):
+                totals[key] += counts[key]
+            log.info("document_rechunked", document_id=doc.id, **counts)
+
+            # Commit per document so an interrupted run keeps its progress
+            await session.commit()
+
+    log.info("rechunking_complete", **totals)
+    return totals
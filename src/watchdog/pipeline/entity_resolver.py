@@ -0,0 +1,94 @@
+from collections import Counter
+
+from sqlalchemy import case, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from watchdog.models.document import Entity
+
+EntityKey = tuple[str, str]  # (normalized name, entity type)
+
+
+def normalize_entity_name(name: str) -> str:
+    return name.strip().title()
+
+
+def _insert(session: AsyncSession):
+    dialect = session.bind.dialect.name
+    return sqlite.insert if dialect == "sqlite" else postgresql.insert
+
+
+def entity_upsert(insert, rows: list[dict]):
+    """INSERT ... ON CONFLICT (name, entity_type) DO UPDATE adding to mention_count, returning ids."""
+    stmt = insert(Entity).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[Entity.name, Entity.entity_type],
+        set_={
+            "mention_count": Entity.mention_count + stmt.excluded.mention_count,
+            "description": func.coalesce(Entity.description, stmt.excluded.description),
+            "updated_at": func.now(),
+        },
+    ).returning(Entity.id, Entity.name, Entity.entity_type)
+
+
+class EntityResolver:
+    """Per-run (name, entity_type) -> entity id map with batched upserts.
+
+    Each call costs at most two statements however many entities it names:
+    one UPDATE incrementing the mention counts of entities already seen this
+    run, and one INSERT ... ON CONFLICT DO UPDATE for the rest, which relies
+    on the unique (name, entity_type) index and is safe against concurrent
+    writers. Counts are added in the database, never read-modify-written.
+    """
+
+    def __init__(self):
+        self._ids: dict[EntityKey, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def forget(self, keys) -> None:
+        """Drop ids learned in a transaction or savepoint that was rolled back."""
+        for key in keys:
+            self._ids.pop(key, None)
+
+    async def resolve(
+        self,
+        session: AsyncSession,
+        counts: Counter[EntityKey],
+        descriptions: dict[EntityKey, str | None] | None = None,
+    ) -> tuple[dict[EntityKey, str], list[EntityKey]]:
+        """Add counts to each entity's mention_count, creating missing entities.
+
+        Returns the ids of all keys, and the keys whose ids were learned by
+        this call (to forget() if the caller rolls back).
+        """
+        descriptions = descriptions or {}
+        known = {key: n for key, n in counts.items() if key in self._ids}
+        missing = sorted(key for key in counts if key not in self._ids)
+
+        if known:
+            increments = {self._ids[key]: n for key, n in known.items()}
+            await session.execute(
+                update(Entity)
+                .where(Entity.id.in_(list(increments)))
+                .values(mention_count=Entity.mention_count + case(increments, value=Entity.id, else_=0))
+                .execution_options(synchronize_session=False)
+            )
+
+        if missing:
+            # Sorted rows take row locks in a consistent order across writers
+            rows = [
+                {
+                    "name": name,
+                    "entity_type": entity_type,
+                    "description": descriptions.get((name, entity_type)),
+                    "mention_count": counts[(name, entity_type)],
+                }
+                for name, entity_type in missing
+            ]
+            stmt = entity_upsert(_insert(session), rows)
+            for entity_id, name, entity_type in (await session.execute(stmt)).all():
+                self._ids[(name, entity_type)] = entity_id
+
+        return {key: self._ids[key] for key in counts}, missing
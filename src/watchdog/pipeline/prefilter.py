@@ -0,0 +1,235 @@
+import asyncio
+import os
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import structlog
+from sqlalchemy import func, select
+
+from watchdog.config import settings
+from watchdog.database import async_session_factory
+from watchdog.models.document import Chunk, Document, TriageSkip
+
+log = structlog.get_logger()
+
+# Shares of triaged chunks held out from fitting: one set picks the skip
+# threshold, the other measures the recall and skip rate it gives
+CALIBRATION_FRACTION = 0.15
+EVALUATION_FRACTION = 0.15
+
+
+def not_skipped():
+    """Condition on Chunk excluding chunks the pre-filter kept from triage."""
+    return ~select(TriageSkip.id).where(TriageSkip.chunk_id == Chunk.id).exists()
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def fit_logistic(
+    X: np.ndarray, y: np.ndarray, l2: float = 1e-3, epochs: int = 300, lr: float = 0.5
+) -> tuple[np.ndarray, float]:
+    """Class-balanced L2 logistic regression by full-batch gradient descent on standardized X."""
+    n = len(y)
+    positives = max(float(y.sum()), 1.0)
+    sample_weight = np.where(y == 1, n / (2 * positives), n / (2 * max(n - positives, 1.0)))
+    weights = np.zeros(X.shape[1], dtype=np.float64)
+    bias = 0.0
+    for _ in range(epochs):
+        gradient = (_sigmoid(X @ weights + bias) - y) * sample_weight / n
+        weights -= lr * (X.T @ gradient + l2 * weights)
+        bias -= lr * float(gradient.sum())
+    return weights, bias
+
+
+class RelevanceModel:
+    """Logistic regression over chunk embeddings predicting whether triage finds a chunk relevant.
+
+    Chunks scoring below threshold are skipped; the threshold is set on
+    held-out calibration chunks so that at most 1 - prefilter_min_recall of
+    the relevant ones would have been skipped.
+    """
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        bias: float,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        threshold: float,
+        version: str,
+    ):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.scale = scale
+        self.threshold = threshold
+        self.version = version
+
+    def scores(self, embeddings: np.ndarray) -> np.ndarray:
+        """Probability that each chunk is relevant."""
+        X = (np.asarray(embeddings, dtype=np.float64) - self.mean) / self.scale
+        return _sigmoid(X @ self.weights + self.bias)
+
+    def save(self, path: Path) -> None:
+        """Write the model atomically, so a running pipeline never loads half a file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            weights=self.weights,
+            bias=self.bias,
+            mean=self.mean,
+            scale=self.scale,
+            threshold=self.threshold,
+            version=self.version,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RelevanceModel | None":
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return cls(
+                weights=data["weights"],
+                bias=float(data["bias"]),
+                mean=data["mean"],
+                scale=data["scale"],
+                threshold=float(data["threshold"]),
+                version=str(data["version"]),
+            )
+
+
+def train_relevance_model(
+    embeddings: np.ndarray,
+    priorities: np.ndarray,
+    relevant_score: float = settings.prefilter_relevant_score,
+    min_recall: float = settings.prefilter_min_recall,
+    seed: int = 0,
+) -> tuple[RelevanceModel, dict]:
+    """Fit a RelevanceModel on triaged chunks and calibrate its skip threshold on held-out ones.
+
+    The threshold is picked on a calibration set and the reported recall and
+    skip rate come from a separate evaluation set, so they show how the
+    threshold does on chunks it was not chosen for.
+    """
+    X = np.asarray(embeddings, dtype=np.float64)
+    y = (np.asarray(priorities) >= relevant_score).astype(np.float64)
+    if y.min() == y.max():
+        raise ValueError("Training data needs both relevant and boilerplate chunks")
+
+    order = np.random.default_rng(seed).permutation(len(y))
+    n_calibration = max(1, int(len(y) * CALIBRATION_FRACTION))
+    n_evaluation = max(1, int(len(y) * EVALUATION_FRACTION))
+    calibration = order[:n_calibration]
+    evaluation = order[n_calibration : n_calibration + n_evaluation]
+    train = order[n_calibration + n_evaluation :]
+
+    mean = X[train].mean(axis=0)
+    scale = X[train].std(axis=0) + 1e-6
+    weights, bias = fit_logistic((X[train] - mean) / scale, y[train])
+    version = datetime.now(UTC).strftime("%Y%m%dT%H%M%SZ")
+    model = RelevanceModel(weights, bias, mean, scale, threshold=0.0, version=version)
+
+    relevant = model.scores(X[calibration])[y[calibration] == 1]
+    if len(relevant):
+        model.threshold = float(np.quantile(relevant, 1 - min_recall, method="lower"))
+    skipped = model.scores(X[evaluation]) < model.threshold
+    evaluation_relevant = y[evaluation] == 1
+    metrics = {
+        "samples": len(y),
+        "relevant_share": round(float(y.mean()), 4),
+        "threshold": round(model.threshold, 6),
+        "evaluation_samples": len(evaluation),
+        "evaluation_recall": (
+            round(float(1 - skipped[evaluation_relevant].mean()), 4) if evaluation_relevant.any() else None
+        ),
+        "evaluation_skip_rate": round(float(skipped.mean()), 4),
+    }
+    return model, metrics
+
+
+async def run_prefilter_training() -> dict:
+    """Retrain the pre-filter from the triage outcomes stored in the database."""
+    async with async_session_factory() as session:
+        rows = (
+            await session.execute(
+                select(Chunk.embedding, Chunk.priority_score)
+                .where(Chunk.embedding.isnot(None), Chunk.priority_score.isnot(None))
+                .order_by(func.random())
+                .limit(settings.prefilter_max_samples)
+            )
+        ).all()
+
+    if len(rows) < settings.prefilter_min_samples:
+        log.warning("prefilter_not_trained", samples=len(rows), needed=settings.prefilter_min_samples)
+        return {"trained": False, "samples": len(rows)}
+
+    embeddings = np.stack([np.asarray(r.embedding, dtype=np.float32) for r in rows])
+    priorities = np.array([r.priority_score for r in rows])
+    model, metrics = await asyncio.to_thread(train_relevance_model, embeddings, priorities)
+    await asyncio.to_thread(model.save, settings.prefilter_model_path)
+    log.info("prefilter_trained", version=model.version, **metrics)
+    return {"trained": True, "model_version": model.version, **metrics}
+
+
+async def run_prefilter(limit: int | None = None, batch_size: int = settings.embedding_page_size) -> dict:
+    """Score the pending chunks of chunked documents and record those too unlikely to matter.
+
+    Skipped chunks get a TriageSkip row, which triage excludes; without a
+    trained model this step does nothing.
+    """
+    stats = {"chunks_scored": 0, "chunks_skipped": 0, "model_version": None}
+    model = RelevanceModel.load(settings.prefilter_model_path)
+    if model is None:
+        log.info("prefilter_no_model", path=str(settings.prefilter_model_path))
+        return stats
+    stats["model_version"] = model.version
+
+    document_ids = select(Document.id).where(Document.status == "chunked").order_by(Document.id)
+    if limit:
+        document_ids = document_ids.limit(limit)
+
+    last_id = ""
+    async with async_session_factory() as session:
+        while True:
+            rows = (
+                await session.execute(
+                    select(Chunk.id, Chunk.document_id, Chunk.embedding)
+                    .where(
+                        Chunk.document_id.in_(document_ids),
+                        Chunk.priority_score.is_(None),
+                        Chunk.embedding.isnot(None),
+                        Chunk.triage_batch_id.is_(None),
+                        Chunk.id > last_id,
+                        not_skipped(),
+                    )
+                    .order_by(Chunk.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not rows:
+                break
+
+            scores = model.scores(np.stack([np.asarray(r.embedding, dtype=np.float32) for r in rows]))
+            for row, score in zip(rows, scores):
+                if score < model.threshold:
+                    session.add(
+                        TriageSkip(
+                            chunk_id=row.id,
+                            document_id=row.document_id,
+                            score=float(score),
+                            threshold=model.threshold,
+                            model_version=model.version,
+                        )
+                    )
+                    stats["chunks_skipped"] += 1
+            await session.commit()
+            stats["chunks_scored"] += len(rows)
+            last_id = rows[-1].id
+
+    log.info("prefilter_complete", **stats)
+    return stats
@@ -7,17 +7,30 @@ from pathlib import Path
 import structlog
 
 from watchdog.config import settings
+from watchdog.database import init_db
 from watchdog.logging import setup_logging
 
 log = structlog.get_logger()
 
-STEPS = ["download", "ocr", "chunk", "embed", "triage"]
+STEPS = ["download", "ocr", "chunk", "embed", "prefilter", "triage"]
+
+# Steps that can be run on their own but are not part of "all"
+MAINTENANCE_STEPS = [
+    "rechunk",
+    "export-onnx",
+    "build-index",
+    "invalidate-triage-cache",
+    "prefilter-train",
+]
 
 
 async def run_step(
     step: str,
     limit: int | None = None,
     archive_path: Path | None = None,
+    batch_mode: bool = False,
+    prompt_version: str | None = None,
+    cascade: bool = False,
 ) -> dict:
     """Run a single pipeline step."""
     log.info("step_starting", step=step, limit=limit)
@@ -40,14 +53,43 @@ async def run_step(
         count = await run_chunking(limit=limit)
         result = {"chunks_created": count}
 
+    elif step == "rechunk":
+        from watchdog.pipeline.chunker import run_rechunking
+        result = await run_rechunking(limit=limit)
+
     elif step == "embed":
         from watchdog.services.embedding import run_embeddings
         count = await run_embeddings()
         result = {"embeddings_created": count}
 
+    elif step == "export-onnx":
+        from watchdog.services.onnx_embedding import run_onnx_export
+        result = await asyncio.to_thread(run_onnx_export)
+
+    elif step == "build-index":
+        from watchdog.services.vector_index import run_vector_index_build
+        count = await run_vector_index_build()
+        result = {"chunks_indexed": count}
+
+    elif step == "prefilter":
+        from watchdog.pipeline.prefilter import run_prefilter
+        result = await run_prefilter(limit=limit)
+
+    elif step == "prefilter-train":
+        from watchdog.pipeline.prefilter import run_prefilter_training
+        result = await run_prefilter_training()
+
+    elif step == "invalidate-triage-cache":
+        from watchdog.pipeline.triage import invalidate_triage_cache
+        result = await asyncio.to_thread(invalidate_triage_cache, prompt_version)
+
+    elif step == "triage" and batch_mode:
+        from watchdog.pipeline.triage_batch import run_batch_triage
+        result = await run_batch_triage(limit=limit)
+
     elif step == "triage":
         from watchdog.pipeline.triage import run_triage
-        result = await run_triage(limit=limit)
+        result = await run_triage(limit=limit, cascade=cascade)
 
     else:
         raise ValueError(f"Unknown step: {step}")
@@ -61,17 +103,28 @@ async def run_pipeline(
     steps: list[str] | None = None,
     limit: int | None = None,
     archive_path: Path | None = None,
+    batch_mode: bool = False,
+    prompt_version: str | None = None,
+    cascade: bool = False,
 ) -> list[dict]:
     """Run the full pipeline or specific steps."""
     steps = steps or STEPS
     results = []
+    await init_db()
 
     for step in steps:
-        if step not in STEPS:
-            log.error("unknown_step", step=step, valid=STEPS)
+        if step not in STEPS + MAINTENANCE_STEPS:
+            log.error("unknown_step", step=step, valid=STEPS + MAINTENANCE_STEPS)
             continue
         try:
-            result = await run_step(step, limit=limit, archive_path=archive_path)
+            result = await run_step(
+                step,
+                limit=limit,
+                archive_path=archive_path,
+                batch_mode=batch_mode,
+                prompt_version=prompt_version,
+                cascade=cascade,
+            )
             results.append(result)
         except Exception as e:
             log.error("step_failed", step=step, error=str(e))
@@ -84,7 +137,7 @@ def main():
     parser = argparse.ArgumentParser(description="Watchdog Document Analysis Pipeline")
     parser.add_argument(
         "--step",
-        choices=STEPS + ["all"],
+        choices=STEPS + MAINTENANCE_STEPS + ["all"],
         default="all",
         help="Pipeline step to run (default: all)",
     )
@@ -100,6 +153,24 @@ def main():
         default=None,
         help="Path to local document archive (overrides ARCHIVE_DIR in .env)",
     )
+    parser.add_argument(
+        "--batch-mode",
+        action="store_true",
+        help="Triage through the Message Batches API (half price, results within 24h; resumable)",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help=(
+            "Screen chunks with the cheap model and re-triage only significant ones "
+            "with CLAUDE_MODEL (not with --batch-mode)"
+        ),
+    )
+    parser.add_argument(
+        "--prompt-version",
+        default=None,
+        help="Triage prompt version for invalidate-triage-cache (default: every version but the current one)",
+    )
 
     args = parser.parse_args()
     setup_logging()
@@ -107,7 +178,16 @@ def main():
     steps = STEPS if args.step == "all" else [args.step]
 
     log.info("pipeline_starting", steps=steps, limit=args.limit, archive_path=str(args.archive_path))
-    results = asyncio.run(run_pipeline(steps=steps, limit=args.limit, archive_path=args.archive_path))
+    results = asyncio.run(
+        run_pipeline(
+            steps=steps,
+            limit=args.limit,
+            archive_path=args.archive_path,
+            batch_mode=args.batch_mode,
+            prompt_version=args.prompt_version,
+            cascade=args.cascade,
+        )
+    )
 
     print("\n=== Pipeline Results ===")
     for r in results:
@@ -1,10 +1,11 @@
 import asyncio
 import json
 import re
+from collections import Counter
 from pathlib import Path
 
 import structlog
-from sqlalchemy import func, select
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from watchdog.config import settings
@@ -13,18 +14,25 @@ from watchdog.models.document import (
     Anomaly,
     Chunk,
     Document,
-    Entity,
     EntityMention,
     EntityRelationship,
 )
+from watchdog.pipeline.entity_resolver import EntityResolver, normalize_entity_name
+from watchdog.pipeline.prefilter import not_skipped
 from watchdog.services.claude_client import call_claude
+from watchdog.services.triage_cache import get_triage_cache
+from watchdog.utils.hashing import sha256_bytes
 
 log = structlog.get_logger()
 
+# Output budget for one chunk's triage JSON
+TRIAGE_MAX_TOKENS = 2000
+
 _prompt_template: str | None = None
 
 
 def get_prompt_template() -> str:
+    """Static triage instructions, sent as the cached system prompt of every triage call."""
     global _prompt_template
     if _prompt_template is None:
         prompt_path = Path(__file__).parent / "prompts" / "triage_analysis.txt"
@@ -32,171 +40,373 @@ def get_prompt_template() -> str:
     return _prompt_template
 
 
-async def get_or_create_entity(session: AsyncSession, name: str, entity_type: str, description: str | None = None) -> Entity:
-    """Get existing entity or create new one."""
-    # Normalize name for matching
-    normalized = name.strip().title()
-    result = await session.execute(
-        select(Entity).where(Entity.name == normalized, Entity.entity_type == entity_type)
-    )
-    entity = result.scalar_one_or_none()
+def triage_prompt_version() -> str:
+    """Version of the triage prompt in cache keys; editing the prompt file starts a new one."""
+    return settings.triage_prompt_version or sha256_bytes(get_prompt_template().encode("utf-8"))[:12]
 
-    if entity:
-        entity.mention_count += 1
-        return entity
 
-    entity = Entity(
-        name=normalized,
-        entity_type=entity_type,
-        description=description,
-        mention_count=1,
-    )
-    session.add(entity)
-    await session.flush()
-    return entity
+def build_triage_prompt(text: str) -> str:
+    """The per-chunk user message; everything else in a triage request is cacheable."""
+    return f"DOCUMENT CHUNK:\n{text[:6000]}"
 
 
-async def triage_chunk(chunk: Chunk, session: AsyncSession) -> dict | None:
-    """Run Claude triage analysis on a single chunk."""
-    text = chunk.filtered_text or chunk.text
-    prompt = get_prompt_template().replace("{chunk_text}", text[:6000])
+def parse_triage_response(response: str) -> dict:
+    """Extract the JSON object from a triage response; raises json.JSONDecodeError if absent or invalid."""
+    json_match = re.search(r"\{[\s\S]*\}", response)
+    if not json_match:
+        raise json.JSONDecodeError("No JSON object in response", response, 0)
+    return json.loads(json_match.group())
+
 
+async def cached_triage(prompt: str, model: str) -> dict | None:
+    """A previously stored triage result for this exact chunk, prompt version and model."""
+    cache = get_triage_cache()
+    if cache is None:
+        return None
+    response = await asyncio.to_thread(cache.get, prompt, triage_prompt_version(), model)
+    if response is None:
+        return None
+    return parse_triage_response(response)
+
+
+async def store_triage(prompt: str, model: str, response: str) -> None:
+    cache = get_triage_cache()
+    if cache is not None:
+        await asyncio.to_thread(cache.put, prompt, triage_prompt_version(), model, response)
+
+
+def invalidate_triage_cache(prompt_version: str | None = None) -> dict:
+    """Drop cached triage results of prompt_version, or of every version but the current one."""
+    cache = get_triage_cache()
+    if cache is None:
+        return {"deleted": 0, "prompt_versions": []}
+    if prompt_version:
+        versions = [prompt_version]
+    else:
+        versions = [v for v in cache.versions() if v != triage_prompt_version()]
+    deleted = sum(cache.invalidate(v) for v in versions)
+    return {"deleted": deleted, "prompt_versions": versions}
+
+
+async def analyze_chunk(
+    chunk_id: str,
+    document_id: str,
+    text: str,
+    model: str | None = None,
+    operation: str = "triage",
+) -> dict | None:
+    """Ask Claude to triage one chunk's text; returns the parsed result or None on failure.
+
+    Results already in the triage cache are replayed without an API call.
+    Touches no database session, so many calls can be in flight at once.
+    """
+    prompt = build_triage_prompt(text)
+    model = model or settings.claude_model
     try:
+        cached = await cached_triage(prompt, model)
+        if cached is not None:
+            log.debug("triage_cache_hit", chunk_id=chunk_id)
+            return cached
         response = await call_claude(
             prompt=prompt,
-            operation="triage",
-            document_id=chunk.document_id,
-            max_tokens=2000,
+            system=get_prompt_template(),
+            operation=operation,
+            document_id=document_id,
+            max_tokens=TRIAGE_MAX_TOKENS,
+            model=model,
         )
+        result = parse_triage_response(response)
+    except json.JSONDecodeError as e:
+        log.warning("triage_json_error", chunk_id=chunk_id, error=str(e))
+        return None
+    except Exception as e:
+        log.error("triage_error", chunk_id=chunk_id, error=str(e))
+        return None
+    # Only responses that parsed are cached, so a bad one is retried next run
+    await store_triage(prompt, model, response)
+    return result
 
-        # Parse JSON
-        json_match = re.search(r"\{[\s\S]*\}", response)
-        if not json_match:
-            log.warning("triage_no_json", chunk_id=chunk.id)
-            return None
-
-        result = json.loads(json_match.group())
-
-        # Process entities
-        for entity_data in result.get("entities", []):
-            entity = await get_or_create_entity(
-                session,
-                name=entity_data["name"],
-                entity_type=entity_data.get("type", "unknown"),
-                description=entity_data.get("context"),
-            )
-            mention = EntityMention(
-                entity_id=entity.id,
-                chunk_id=chunk.id,
-                context_snippet=entity_data.get("context", "")[:500],
-            )
-            session.add(mention)
-
-        # Process relationships
-        for rel_data in result.get("relationships", []):
-            source_entity = await get_or_create_entity(
-                session,
-                name=rel_data["source"],
-                entity_type="unknown",
-            )
-            target_entity = await get_or_create_entity(
-                session,
-                name=rel_data["target"],
-                entity_type="unknown",
-            )
-            relationship = EntityRelationship(
-                source_entity_id=source_entity.id,
-                target_entity_id=target_entity.id,
-                relationship_type=rel_data.get("type", "associated"),
-                description=rel_data.get("description"),
-                confidence=float(rel_data.get("confidence", 0.5)),
+
+def needs_escalation(result: dict, threshold: float = settings.cascade_escalation_threshold) -> bool:
+    """Whether a screening result is worth a second look from the stronger model."""
+    return float(result.get("priority_score", 0.0)) >= threshold or bool(result.get("anomalies"))
+
+
+async def cascade_analyze_chunk(chunk_id: str, document_id: str, text: str) -> tuple[dict | None, bool]:
+    """Screen a chunk with the cheap model and re-triage it with claude_model if it looks significant.
+
+    Returns the result to persist and whether escalation was attempted. A
+    failed escalation returns None so the chunk stays pending and its
+    document is not finalized; the next run replays the screening result
+    from the triage cache and retries the escalation.
+    """
+    result = await analyze_chunk(
+        chunk_id, document_id, text, model=settings.claude_screening_model, operation="triage_screen"
+    )
+    if result is None or not needs_escalation(result, settings.cascade_escalation_threshold):
+        return result, False
+    return await analyze_chunk(chunk_id, document_id, text), True
+
+
+async def apply_triage_result(
+    session: AsyncSession,
+    chunk_id: str,
+    document_id: str,
+    result: dict,
+    resolver: EntityResolver | None = None,
+) -> None:
+    """Persist a chunk's triage result: priority, entities, relationships and anomalies.
+
+    Entities are upserted in bulk through resolver; pass one resolver per run
+    so entities seen earlier in the run are resolved without a lookup.
+    """
+    if resolver is None:
+        resolver = EntityResolver()
+    await session.execute(
+        update(Chunk)
+        .where(Chunk.id == chunk_id)
+        .values(priority_score=float(result.get("priority_score", 0.0)))
+    )
+
+    entities = result.get("entities", [])
+    relationships = result.get("relationships", [])
+
+    # Every entity and both ends of every relationship count as a mention
+    counts: Counter[tuple[str, str]] = Counter()
+    descriptions: dict[tuple[str, str], str | None] = {}
+    entity_keys = []
+    for entity_data in entities:
+        key = (normalize_entity_name(entity_data["name"]), entity_data.get("type", "unknown"))
+        entity_keys.append(key)
+        counts[key] += 1
+        descriptions.setdefault(key, entity_data.get("context"))
+    relationship_keys = []
+    for rel_data in relationships:
+        ends = [(normalize_entity_name(rel_data[end]), "unknown") for end in ("source", "target")]
+        relationship_keys.append(ends)
+        counts.update(ends)
+
+    learned: list[tuple[str, str]] = []
+    try:
+        ids: dict[tuple[str, str], str] = {}
+        if counts:
+            ids, learned = await resolver.resolve(session, counts, descriptions)
+
+        if entities:
+            await session.execute(
+                insert(EntityMention),
+                [
+                    {
+                        "entity_id": ids[key],
+                        "chunk_id": chunk_id,
+                        "context_snippet": (entity_data.get("context") or "")[:500],
+                    }
+                    for key, entity_data in zip(entity_keys, entities)
+                ],
             )
-            session.add(relationship)
-
-        # Process anomalies
-        for anomaly_data in result.get("anomalies", []):
-            anomaly = Anomaly(
-                document_id=chunk.document_id,
-                anomaly_type=anomaly_data.get("type", "unknown"),
-                description=anomaly_data.get("description", ""),
-                severity=anomaly_data.get("severity", "low"),
-                confidence=float(anomaly_data.get("confidence", 0.5)),
-                evidence=anomaly_data.get("evidence", "")[:1000],
+
+        if relationships:
+            await session.execute(
+                insert(EntityRelationship),
+                [
+                    {
+                        "source_entity_id": ids[source],
+                        "target_entity_id": ids[target],
+                        "relationship_type": rel_data.get("type", "associated"),
+                        "description": rel_data.get("description"),
+                        "confidence": float(rel_data.get("confidence", 0.5)),
+                    }
+                    for (source, target), rel_data in zip(relationship_keys, relationships)
+                ],
             )
-            session.add(anomaly)
+    except Exception:
+        # Entities created here vanish if the caller rolls back
+        resolver.forget(learned)
+        raise
+
+    # Process anomalies
+    for anomaly_data in result.get("anomalies", []):
+        anomaly = Anomaly(
+            document_id=document_id,
+            chunk_id=chunk_id,
+            anomaly_type=anomaly_data.get("type", "unknown"),
+            description=anomaly_data.get("description", ""),
+            severity=anomaly_data.get("severity", "low"),
+            confidence=float(anomaly_data.get("confidence", 0.5)),
+            evidence=anomaly_data.get("evidence", "")[:1000],
+        )
+        session.add(anomaly)
 
-        return result
 
-    except json.JSONDecodeError as e:
-        log.warning("triage_json_error", chunk_id=chunk.id, error=str(e))
+async def triage_chunk(chunk: Chunk, session: AsyncSession) -> dict | None:
+    """Run Claude triage analysis on a single chunk and persist the result."""
+    result = await analyze_chunk(chunk.id, chunk.document_id, chunk.filtered_text or chunk.text)
+    if result is None:
         return None
+    try:
+        await apply_triage_result(session, chunk.id, chunk.document_id, result)
     except Exception as e:
         log.error("triage_error", chunk_id=chunk.id, error=str(e))
         return None
+    return result
 
 
-async def run_triage(limit: int | None = None) -> dict:
-    """Run triage on all chunked documents."""
-    async with async_session_factory() as session:
-        query = (
-            select(Document)
-            .where(Document.status == "chunked")
-        )
-        if limit:
-            query = query.limit(limit)
-
-        doc_result = await session.execute(query)
-        documents = doc_result.scalars().all()
+def has_untriaged_chunks(document_id):
+    """Condition on a document id: some chunk still lacks a triage result and was not pre-filtered."""
+    return (
+        select(Chunk.id)
+        .where(Chunk.document_id == document_id, Chunk.priority_score.is_(None), not_skipped())
+        .exists()
+    )
 
-        total_chunks = 0
-        total_entities = 0
-        total_anomalies = 0
-        max_priority = 0.0
 
-        for doc in documents:
-            chunk_result = await session.execute(
-                select(Chunk).where(
-                    Chunk.document_id == doc.id,
-                )
+async def finalize_document(session: AsyncSession, document_id: str) -> float | None:
+    """Mark a document triaged with the max of its chunk priorities."""
+    doc_priority = (
+        await session.execute(
+            select(func.max(Chunk.priority_score)).where(Chunk.document_id == document_id)
+        )
+    ).scalar()
+    values = {"status": "triaged"}
+    if doc_priority is not None:
+        values["priority_score"] = doc_priority
+    await session.execute(update(Document).where(Document.id == document_id).values(**values))
+    return doc_priority
+
+
+async def run_triage(limit: int | None = None, cascade: bool = False) -> dict:
+    """Run triage on all chunked documents with up to max_concurrent_api_calls in flight.
+
+    A feeder streams pending chunks document by document into a bounded
+    queue, a pool of workers calls Claude concurrently, and a single writer
+    applies results to one session in arrival order. When the last chunk of
+    a document lands, the writer sets its priority and commits; a document
+    with a chunk that failed stays "chunked" so the next run retries it.
+
+    With cascade, every chunk is screened by claude_screening_model and only
+    those at or above cascade_escalation_threshold, or with anomalies, are
+    re-triaged by claude_model.
+    """
+    concurrency = max(1, settings.max_concurrent_api_calls)
+    todo: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done: asyncio.Queue = asyncio.Queue()
+    remaining: dict[str, int] = {}
+    failed: dict[str, int] = {}
+    stats = {
+        "documents_triaged": 0,
+        "documents_incomplete": 0,
+        "chunks_analyzed": 0,
+        "chunks_failed": 0,
+        "entities_found": 0,
+        "anomalies_found": 0,
+        "max_priority": 0.0,
+    }
+    if cascade:
+        stats["chunks_escalated"] = 0
+        stats["escalations_failed"] = 0
+
+    async def feed() -> None:
+        async with async_session_factory() as session:
+            # Documents with chunks in a pending message batch are left to --batch-mode
+            in_batch = select(Chunk.id).where(
+                Chunk.document_id == Document.id, Chunk.triage_batch_id.isnot(None)
             )
-            chunks = chunk_result.scalars().all()
-
-            doc_priority_scores = []
-
-            for chunk in chunks:
-                result = await triage_chunk(chunk, session)
-                if result:
-                    priority = float(result.get("priority_score", 0.0))
-                    doc_priority_scores.append(priority)
-                    total_entities += len(result.get("entities", []))
-                    total_anomalies += len(result.get("anomalies", []))
-
-                total_chunks += 1
-
-                # Rate limiting: don't overwhelm the API
-                await asyncio.sleep(0.5)
-
-            # Update document priority (max of chunk priorities)
-            if doc_priority_scores:
-                doc.priority_score = max(doc_priority_scores)
-                max_priority = max(max_priority, doc.priority_score)
-
-            doc.status = "triaged"
-            log.info(
-                "document_triaged",
-                document_id=doc.id,
-                chunks=len(chunks),
-                priority=doc.priority_score,
+            query = (
+                select(Document.id)
+                .where(Document.status == "chunked", ~in_batch.exists())
+                .order_by(Document.id)
             )
+            if limit:
+                query = query.limit(limit)
+            document_ids = (await session.execute(query)).scalars().all()
+
+            for document_id in document_ids:
+                # Chunks kept across a re-chunk already carry their triage result;
+                # chunks the pre-filter skipped are left out
+                chunk_result = await session.execute(
+                    select(Chunk.id, func.coalesce(Chunk.filtered_text, Chunk.text))
+                    .where(Chunk.document_id == document_id, Chunk.priority_score.is_(None), not_skipped())
+                    .order_by(Chunk.chunk_index)
+                )
+                chunks = chunk_result.all()
+                remaining[document_id] = len(chunks)
+                if not chunks:
+                    await done.put((document_id, None, None))
+                for chunk_id, text in chunks:
+                    await todo.put((document_id, chunk_id, text))
+
+    async def work() -> None:
+        while True:
+            item = await todo.get()
+            if item is None:
+                return
+            document_id, chunk_id, text = item
+            if cascade:
+                result, escalated = await cascade_analyze_chunk(chunk_id, document_id, text)
+                if escalated:
+                    # A failed escalation is retried next run and counted then
+                    stats["chunks_escalated" if result is not None else "escalations_failed"] += 1
+            else:
+                result = await analyze_chunk(chunk_id, document_id, text)
+            await done.put((document_id, chunk_id, result))
+
+    async def write() -> None:
+        resolver = EntityResolver()
+        async with async_session_factory() as session:
+            while True:
+                item = await done.get()
+                if item is None:
+                    return
+                document_id, chunk_id, result = item
+                if chunk_id is not None:
+                    remaining[document_id] -= 1
+                    applied = False
+                    if result:
+                        try:
+                            # A savepoint keeps one bad result from discarding the
+                            # uncommitted work of other documents in flight
+                            async with session.begin_nested():
+                                await apply_triage_result(session, chunk_id, document_id, result, resolver)
+                            applied = True
+                            stats["entities_found"] += len(result.get("entities", []))
+                            stats["anomalies_found"] += len(result.get("anomalies", []))
+                        except Exception as e:
+                            log.error("triage_error", chunk_id=chunk_id, error=str(e))
+                    if applied:
+                        stats["chunks_analyzed"] += 1
+                    else:
+                        stats["chunks_failed"] += 1
+                        failed[document_id] = failed.get(document_id, 0) + 1
+                if remaining[document_id] == 0:
+                    del remaining[document_id]
+                    if failed.pop(document_id, 0):
+                        # Left "chunked": the next run picks up the chunks still pending
+                        await session.commit()
+                        stats["documents_incomplete"] += 1
+                        log.warning("document_incomplete", document_id=document_id)
+                        continue
+                    priority = await finalize_document(session, document_id)
+                    await session.commit()
+                    stats["documents_triaged"] += 1
+                    stats["max_priority"] = max(stats["max_priority"], priority or 0.0)
+                    log.info("document_triaged", document_id=document_id, priority=priority)
 
-        await session.commit()
-
-    stats = {
-        "documents_triaged": len(documents),
-        "chunks_analyzed": total_chunks,
-        "entities_found": total_entities,
-        "anomalies_found": total_anomalies,
-        "max_priority": max_priority,
-    }
-    log.info("triage_complete", **stats)
+    try:
+        # A failure anywhere cancels the rest, so workers stop calling Claude
+        # as soon as the writer can no longer save their results
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(write())
+            workers = [tasks.create_task(work()) for _ in range(concurrency)]
+            await feed()
+            for _ in workers:
+                await todo.put(None)
+            await asyncio.gather(*workers)
+            await done.put(None)
+    except ExceptionGroup as group:
+        raise group.exceptions[0] from None
+
+    if cascade:
+        analyzed = stats["chunks_analyzed"]
+        stats["escalation_rate"] = round(stats["chunks_escalated"] / analyzed, 4) if analyzed else 0.0
+    log.info("triage_complete", concurrency=concurrency, **stats)
     return stats
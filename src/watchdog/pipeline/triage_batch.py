@@ -0,0 +1,371 @@
+import asyncio
+import json
+
+import structlog
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from watchdog.config import settings
+from watchdog.database import async_session_factory
+from watchdog.models.document import Chunk, Document, Expense, TriageBatch
+from watchdog.pipeline.entity_resolver import EntityResolver
+from watchdog.pipeline.prefilter import not_skipped
+from watchdog.pipeline.triage import (
+    TRIAGE_MAX_TOKENS,
+    apply_triage_result,
+    build_triage_prompt,
+    cached_triage,
+    finalize_document,
+    get_prompt_template,
+    has_untriaged_chunks,
+    parse_triage_response,
+    store_triage,
+)
+from watchdog.services.claude_client import cached_system, get_client
+from watchdog.services.cost_tracker import calculate_cost
+
+log = structlog.get_logger()
+
+# Applied results are committed this often while streaming a batch's results
+COMMIT_EVERY = 200
+
+# What a malformed result or a failed write can raise while a result is applied
+APPLY_ERRORS = (SQLAlchemyError, AttributeError, KeyError, TypeError, ValueError)
+
+# Ids bound per IN list; asyncpg allows at most 32,767 parameters in one query
+IN_LIST_SIZE = 10_000
+
+
+def build_batch_request(chunk_id: str, text: str, model: str) -> dict:
+    """One Message Batches request triaging a chunk; the custom_id maps the result back to it."""
+    return {
+        "custom_id": chunk_id,
+        "params": {
+            "model": model,
+            "max_tokens": TRIAGE_MAX_TOKENS,
+            "system": cached_system(get_prompt_template()),
+            "messages": [{"role": "user", "content": build_triage_prompt(text)}],
+        },
+    }
+
+
+def _in_batch(document_id, except_batches: list[str] | None = None):
+    query = select(Chunk.id).where(Chunk.document_id == document_id, Chunk.triage_batch_id.isnot(None))
+    if except_batches:
+        query = query.where(Chunk.triage_batch_id.not_in(except_batches))
+    return query.exists()
+
+
+def _slices(ids: list[str]):
+    for start in range(0, len(ids), IN_LIST_SIZE):
+        yield ids[start : start + IN_LIST_SIZE]
+
+
+async def release_chunks(session: AsyncSession, batch_id: str, chunk_ids: list[str] | None = None) -> None:
+    """Return a batch's chunks (or the given ones) to the pending queue."""
+    query = update(Chunk).where(Chunk.triage_batch_id == batch_id)
+    if chunk_ids is None:
+        await session.execute(query.values(triage_batch_id=None))
+        return
+    for ids in _slices(chunk_ids):
+        await session.execute(query.where(Chunk.id.in_(ids)).values(triage_batch_id=None))
+
+
+async def finalize_ready_documents(session: AsyncSession, scope) -> list[float | None]:
+    """Finalize chunked documents in scope whose chunks all have a result; returns their priorities.
+
+    scope is a condition on Document. Documents with a failed request keep
+    status "chunked", so the next run submits their remaining chunks again.
+    """
+    ready = (
+        await session.execute(
+            select(Document.id)
+            .where(
+                scope,
+                Document.status == "chunked",
+                ~_in_batch(Document.id),
+                ~has_untriaged_chunks(Document.id),
+            )
+            .order_by(Document.id)
+        )
+    ).scalars().all()
+    priorities = []
+    for document_id in ready:
+        priority = await finalize_document(session, document_id)
+        priorities.append(priority)
+        log.info("document_triaged", document_id=document_id, priority=priority)
+    return priorities
+
+
+async def replay_cached(session: AsyncSession, rows: list, model: str) -> list:
+    """Apply triage-cache hits among rows directly; returns the rows that still need a request."""
+    remaining = []
+    replayed = 0
+    resolver = EntityResolver()
+    for row in rows:
+        try:
+            result = await cached_triage(build_triage_prompt(row.text), model)
+        except json.JSONDecodeError:
+            result = None
+        if result is None:
+            remaining.append(row)
+            continue
+        try:
+            async with session.begin_nested():
+                await apply_triage_result(session, row.id, row.document_id, result, resolver)
+            replayed += 1
+        except APPLY_ERRORS as e:
+            log.error("triage_error", chunk_id=row.id, error=str(e))
+    if replayed:
+        log.info("triage_cache_replayed", chunks=replayed)
+    return remaining
+
+
+async def submit_triage_batches(limit: int | None = None) -> list[str]:
+    """Send the pending chunks of chunked documents as Message Batches; returns the batch ids.
+
+    Pending chunks are read by keyset on Chunk.id, one triage_batch_size page
+    at a time; each page's triage-cache hits are applied and the rest is
+    submitted before the next page is read. Chunks are assigned to a
+    TriageBatch row and committed before the API call, so a crash can at
+    worst leave a "pending" batch, whose chunks are released on the next run.
+    """
+    client = get_client()
+    model = settings.claude_model
+    submitted: list[str] = []
+    submitted_batches: list[str] = []
+
+    async with async_session_factory() as session:
+        stale = (
+            await session.execute(select(TriageBatch).where(TriageBatch.status == "pending"))
+        ).scalars().all()
+        for batch in stale:
+            await release_chunks(session, batch.id)
+            batch.status = "failed"
+            log.warning("triage_batch_unsubmitted", triage_batch=batch.id)
+        await session.commit()
+
+        def documents():
+            # Documents already in a batch are left to it; those this run submitted
+            # stay in scope so their chunks on later pages are still sent
+            query = (
+                select(Document.id)
+                .where(Document.status == "chunked", ~_in_batch(Document.id, submitted_batches))
+                .order_by(Document.id)
+            )
+            return query.limit(limit) if limit else query
+
+        size = max(1, settings.triage_batch_size)
+        last_id = ""
+        while True:
+            page = (
+                await session.execute(
+                    select(Chunk.id, Chunk.document_id, func.coalesce(Chunk.filtered_text, Chunk.text).label("text"))
+                    .where(
+                        Chunk.document_id.in_(documents()),
+                        Chunk.priority_score.is_(None),
+                        not_skipped(),
+                        Chunk.id > last_id,
+                    )
+                    .order_by(Chunk.id)
+                    .limit(size)
+                )
+            ).all()
+            if not page:
+                break
+            last_id = page[-1].id
+
+            group = await replay_cached(session, page, model)
+            await session.commit()
+            if not group:
+                continue
+
+            batch = TriageBatch(model=model, status="pending", request_count=len(group))
+            session.add(batch)
+            await session.flush()
+            submitted_batches.append(batch.id)
+            for ids in _slices([r.id for r in group]):
+                await session.execute(update(Chunk).where(Chunk.id.in_(ids)).values(triage_batch_id=batch.id))
+            await session.commit()
+
+            try:
+                created = await client.messages.batches.create(
+                    requests=[build_batch_request(r.id, r.text, model) for r in group]
+                )
+            except Exception as e:
+                log.error("triage_batch_submit_error", triage_batch=batch.id, error=str(e))
+                await release_chunks(session, batch.id)
+                batch.status = "failed"
+                await session.commit()
+                raise
+
+            batch.batch_id = created.id
+            batch.status = "submitted"
+            await session.commit()
+            submitted.append(created.id)
+            log.info("triage_batch_submitted", batch_id=created.id, requests=len(group))
+
+        # Documents kept whole across a re-chunk, or fully cached, have nothing left to send
+        await finalize_ready_documents(session, Document.id.in_(documents()))
+        await session.commit()
+
+    return submitted
+
+
+async def apply_batch_results(
+    session: AsyncSession, batch: TriageBatch, stats: dict, resolver: EntityResolver | None = None
+) -> None:
+    """Stream an ended batch's results through the same persistence as triage_chunk.
+
+    Only chunks still assigned to the batch and untriaged are applied, so
+    re-reading the results after a restart skips what was already committed.
+    Failed requests leave the chunk pending and its document unfinalized, so
+    the next run resubmits it.
+    """
+    client = get_client()
+    if resolver is None:
+        resolver = EntityResolver()
+    rows = (
+        await session.execute(
+            select(Chunk.id, Chunk.document_id, func.coalesce(Chunk.filtered_text, Chunk.text)).where(
+                Chunk.triage_batch_id == batch.id, Chunk.priority_score.is_(None)
+            )
+        )
+    ).all()
+    chunk_documents = {chunk_id: document_id for chunk_id, document_id, _ in rows}
+    chunk_texts = {chunk_id: text for chunk_id, _, text in rows}
+    document_ids = sorted(set(chunk_documents.values()))
+
+    processed = 0
+    results = await client.messages.batches.results(batch.batch_id)
+    async for entry in results:
+        chunk_id = entry.custom_id
+        document_id = chunk_documents.pop(chunk_id, None)
+        if document_id is None:
+            continue
+
+        result = None
+        if entry.result.type == "succeeded":
+            message = entry.result.message
+            usage = message.usage
+            cache_read = usage.cache_read_input_tokens or 0
+            cache_write = usage.cache_creation_input_tokens or 0
+            session.add(
+                Expense(
+                    service="anthropic",
+                    model=batch.model,
+                    operation="triage",
+                    input_tokens=usage.input_tokens,
+                    output_tokens=usage.output_tokens,
+                    cache_read_tokens=cache_read,
+                    cache_write_tokens=cache_write,
+                    cost_usd=calculate_cost(
+                        batch.model, usage.input_tokens, usage.output_tokens, cache_read, cache_write, batch=True
+                    ),
+                    document_id=document_id,
+                )
+            )
+            response = message.content[0].text if message.content else ""
+            try:
+                result = parse_triage_response(response)
+                await store_triage(build_triage_prompt(chunk_texts[chunk_id]), batch.model, response)
+            except json.JSONDecodeError as e:
+                log.warning("triage_json_error", chunk_id=chunk_id, error=str(e))
+        else:
+            log.warning("triage_batch_request_failed", chunk_id=chunk_id, result=entry.result.type)
+
+        applied = False
+        if result is not None:
+            try:
+                async with session.begin_nested():
+                    await apply_triage_result(session, chunk_id, document_id, result, resolver)
+                applied = True
+                stats["entities_found"] += len(result.get("entities", []))
+                stats["anomalies_found"] += len(result.get("anomalies", []))
+            except APPLY_ERRORS as e:
+                log.error("triage_error", chunk_id=chunk_id, error=str(e))
+        await release_chunks(session, batch.id, [chunk_id])
+        if applied:
+            batch.succeeded_count += 1
+            stats["chunks_analyzed"] += 1
+        else:
+            batch.failed_count += 1
+            stats["chunks_failed"] += 1
+
+        processed += 1
+        if processed % COMMIT_EVERY == 0:
+            await session.commit()
+
+    if chunk_documents:
+        # Requests the batch returned no result for
+        await release_chunks(session, batch.id, list(chunk_documents))
+        batch.failed_count += len(chunk_documents)
+        stats["chunks_failed"] += len(chunk_documents)
+    batch.status = "applied"
+    await session.commit()
+
+    priorities = []
+    for ids in _slices(document_ids):
+        priorities += await finalize_ready_documents(session, Document.id.in_(ids))
+    await session.commit()
+    stats["documents_triaged"] += len(priorities)
+    stats["max_priority"] = max([stats["max_priority"], *(p or 0.0 for p in priorities)])
+    stats["batches_applied"] += 1
+    log.info(
+        "triage_batch_applied",
+        batch_id=batch.batch_id,
+        succeeded=batch.succeeded_count,
+        failed=batch.failed_count,
+    )
+
+
+async def collect_triage_batches(stats: dict | None = None) -> dict:
+    """Apply every submitted batch that has ended; batches_pending counts the rest."""
+    stats = stats or {
+        "batches_submitted": 0,
+        "batches_applied": 0,
+        "documents_triaged": 0,
+        "chunks_analyzed": 0,
+        "chunks_failed": 0,
+        "entities_found": 0,
+        "anomalies_found": 0,
+        "max_priority": 0.0,
+    }
+    stats["batches_pending"] = 0
+    client = get_client()
+    resolver = EntityResolver()
+
+    async with async_session_factory() as session:
+        batches = (
+            await session.execute(
+                select(TriageBatch).where(TriageBatch.status == "submitted").order_by(TriageBatch.created_at)
+            )
+        ).scalars().all()
+        for batch in batches:
+            remote = await client.messages.batches.retrieve(batch.batch_id)
+            if remote.processing_status != "ended":
+                stats["batches_pending"] += 1
+                continue
+            batch.ended_at = remote.ended_at
+            await apply_batch_results(session, batch, stats, resolver)
+
+    return stats
+
+
+async def run_batch_triage(limit: int | None = None, wait: bool = True) -> dict:
+    """Triage chunked documents through the Message Batches API at half the per-token price.
+
+    Submits the pending chunks, then polls every triage_batch_poll_seconds
+    and applies batches as they end. Batch ids are stored in triage_batches,
+    so an interrupted run resumes polling where it left off when restarted.
+    """
+    submitted = await submit_triage_batches(limit)
+    stats = await collect_triage_batches()
+    stats["batches_submitted"] = len(submitted)
+    while wait and stats["batches_pending"]:
+        await asyncio.sleep(settings.triage_batch_poll_seconds)
+        stats = await collect_triage_batches(stats)
+
+    log.info("batch_triage_complete", **stats)
+    return stats
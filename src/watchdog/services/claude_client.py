@@ -1,9 +1,12 @@
+import time
+
 import anthropic
 import structlog
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from watchdog.config import settings
 from watchdog.services.cost_tracker import track_expense
+from watchdog.services.rate_limiter import estimate_tokens, get_rate_limiter
 
 log = structlog.get_logger()
 
@@ -13,13 +16,28 @@ _client: anthropic.AsyncAnthropic | None = None
 def get_client() -> anthropic.AsyncAnthropic:
     global _client
     if _client is None:
-        _client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
+        # Retries go through call_claude so they respect the shared rate limiter
+        _client = anthropic.AsyncAnthropic(
+            api_key=settings.anthropic_api_key, base_url=settings.anthropic_base_url, max_retries=0
+        )
     return _client
 
 
+def cached_system(text: str) -> list[dict]:
+    """A system prompt marked as a prompt-cache breakpoint.
+
+    Calls sharing the same system text read it from the cache at a tenth of
+    the input price. Prefixes shorter than the model's cache minimum (1024
+    tokens for Sonnet) are simply not cached.
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=30),
+    # Jittered so workers that failed together don't retry together; 429s also
+    # pause the shared rate limiter for retry-after before the next attempt
+    wait=wait_random_exponential(multiplier=1, min=2, max=30),
     reraise=True,
 )
 async def call_claude(
@@ -28,31 +46,71 @@ async def call_claude(
     document_id: str | None = None,
     max_tokens: int = 2000,
     model: str | None = None,
+    system: str | None = None,
 ) -> str:
-    """Call Claude API with retry logic and cost tracking."""
+    """Call Claude API with rate limiting, retry logic and cost tracking.
+
+    A static system prompt goes in a cached block so only prompt varies per call.
+    """
     model = model or settings.claude_model
     client = get_client()
+    limiter = get_rate_limiter()
+
+    reserved_input = estimate_tokens(prompt) + (estimate_tokens(system) if system else 0)
+    if limiter:
+        await limiter.acquire(model, reserved_input, max_tokens)
 
     log.debug("claude_api_call", operation=operation, model=model)
 
-    response = await client.messages.create(
-        model=model,
-        max_tokens=max_tokens,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    params = {"system": cached_system(system)} if system else {}
+    start = time.perf_counter()
+    usage = None
+    headers = None
+    try:
+        raw = await client.messages.with_raw_response.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            **params,
+        )
+        headers = raw.headers
+        response = await raw.parse()
+        latency_ms = round((time.perf_counter() - start) * 1000)
+        usage = response.usage
+    except anthropic.APIStatusError as e:
+        # 429s carry retry-after and the org's remaining allowance
+        headers = e.response.headers
+        raise
+    finally:
+        if limiter:
+            # Settle first so the org's reported remaining allowance has the last word.
+            # A failed call is charged nothing, so its whole reservation goes back;
+            # cache reads don't count towards the input-token rate limit.
+            used_input = used_output = 0
+            if usage:
+                used_input = usage.input_tokens + (usage.cache_creation_input_tokens or 0)
+                used_output = usage.output_tokens
+            await limiter.settle(model, reserved_input, max_tokens, used_input, used_output)
+            if headers is not None:
+                await limiter.observe(model, headers)
 
     # Extract text
     text = response.content[0].text if response.content else ""
 
+    input_tokens = usage.input_tokens
+    output_tokens = usage.output_tokens
+    cache_read_tokens = usage.cache_read_input_tokens or 0
+    cache_write_tokens = usage.cache_creation_input_tokens or 0
+
     # Track cost
-    input_tokens = response.usage.input_tokens
-    output_tokens = response.usage.output_tokens
     await track_expense(
         model=model,
         operation=operation,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         document_id=document_id,
+        cache_read_tokens=cache_read_tokens,
+        cache_write_tokens=cache_write_tokens,
     )
 
     log.info(
@@ -60,6 +118,9 @@ async def call_claude(
         operation=operation,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
+        cache_read_tokens=cache_read_tokens,
+        cache_write_tokens=cache_write_tokens,
+        latency_ms=latency_ms,
     )
 
     return text
@@ -12,11 +12,35 @@ PRICING = {
     "claude-haiku-4-5-20251001": {"input": 0.80, "output": 4.00},
 }
 
+# Prompt-cache reads and (5-minute) cache writes, as multiples of the input price
+CACHE_READ_MULTIPLIER = 0.1
+CACHE_WRITE_MULTIPLIER = 1.25
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost in USD for a Claude API call."""
+# Message Batches requests are billed at half the standard rate
+BATCH_DISCOUNT = 0.5
+
+
+def calculate_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+    batch: bool = False,
+) -> float:
+    """Calculate cost in USD for a Claude API call.
+
+    input_tokens excludes cached prompt tokens, which are priced separately.
+    """
     prices = PRICING.get(model, {"input": 3.00, "output": 15.00})
-    cost = (input_tokens / 1_000_000) * prices["input"] + (output_tokens / 1_000_000) * prices["output"]
+    billed_input = (
+        input_tokens
+        + cache_read_tokens * CACHE_READ_MULTIPLIER
+        + cache_write_tokens * CACHE_WRITE_MULTIPLIER
+    )
+    cost = (billed_input / 1_000_000) * prices["input"] + (output_tokens / 1_000_000) * prices["output"]
+    if batch:
+        cost *= BATCH_DISCOUNT
     return round(cost, 6)
 
 
@@ -26,9 +50,11 @@ async def track_expense(
     input_tokens: int,
     output_tokens: int,
     document_id: str | None = None,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
 ) -> Expense:
     """Log an API expense to the database."""
-    cost = calculate_cost(model, input_tokens, output_tokens)
+    cost = calculate_cost(model, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens)
 
     async with async_session_factory() as session:
         expense = Expense(
@@ -37,6 +63,8 @@ async def track_expense(
             operation=operation,
             input_tokens=input_tokens,
             output_tokens=output_tokens,
+            cache_read_tokens=cache_read_tokens,
+            cache_write_tokens=cache_write_tokens,
             cost_usd=cost,
             document_id=document_id,
         )
@@ -49,6 +77,8 @@ async def track_expense(
         cost_usd=cost,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
+        cache_read_tokens=cache_read_tokens,
+        cache_write_tokens=cache_write_tokens,
     )
     return expense
 
@@ -62,6 +92,8 @@ async def get_total_cost() -> dict:
                 func.sum(Expense.cost_usd).label("total_cost"),
                 func.sum(Expense.input_tokens).label("total_input"),
                 func.sum(Expense.output_tokens).label("total_output"),
+                func.sum(Expense.cache_read_tokens).label("total_cache_read"),
+                func.sum(Expense.cache_write_tokens).label("total_cache_write"),
                 func.count(Expense.id).label("call_count"),
             ).group_by(Expense.operation)
         )
@@ -74,6 +106,8 @@ async def get_total_cost() -> dict:
                 "cost_usd": round(float(row.total_cost), 4),
                 "input_tokens": int(row.total_input),
                 "output_tokens": int(row.total_output),
+                "cache_read_tokens": int(row.total_cache_read or 0),
+                "cache_write_tokens": int(row.total_cache_write or 0),
                 "calls": int(row.call_count),
             }
             total += float(row.total_cost)
@@ -1,85 +1,357 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING
+
 import numpy as np
 import structlog
-from sentence_transformers import SentenceTransformer
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 
 from watchdog.config import settings
-from watchdog.database import async_session_factory
-from watchdog.models.document import Chunk
+from watchdog.database import async_session_factory, is_sqlite
+from watchdog.models.document import Chunk, Document
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+    from watchdog.services.onnx_embedding import OnnxEncoder
 
 log = structlog.get_logger()
 
-_model: SentenceTransformer | None = None
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+_model: "SentenceTransformer | OnnxEncoder | None" = None
+_model_lock = threading.Lock()
+_encode_threads: int | None = None
+_thread_pool: ThreadPoolExecutor | None = None
 
 
-def get_model() -> SentenceTransformer:
+def set_encode_threads(threads: int) -> None:
+    """Cap the CPU threads used by the model; call before the first encode."""
+    global _encode_threads
+    _encode_threads = threads
+    if settings.embedding_backend == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def get_model() -> "SentenceTransformer | OnnxEncoder":
+    """Load the configured embedding backend. torch is only imported for the torch backend."""
     global _model
-    if _model is None:
-        log.info("loading_embedding_model", model=settings.embedding_model)
-        _model = SentenceTransformer(settings.embedding_model)
+    if _model is not None:
+        return _model
+
+    # Warmup and the first request can race to load the model; load it once
+    with _model_lock:
+        if _model is None:
+            backend = settings.embedding_backend
+            if backend not in EMBEDDING_BACKENDS:
+                raise ValueError(f"Unknown embedding backend: {backend}")
+
+            log.info("loading_embedding_model", model=settings.embedding_model, backend=backend)
+            if backend == "onnx":
+                from watchdog.services.onnx_embedding import OnnxEncoder, onnx_model_dir
+
+                _model = OnnxEncoder(
+                    onnx_model_dir(settings.embedding_model),
+                    quantized=settings.embedding_onnx_quantized,
+                    threads=_encode_threads,
+                )
+            else:
+                from sentence_transformers import SentenceTransformer
+
+                _model = SentenceTransformer(settings.embedding_model)
     return _model
 
 
-def embed_texts(texts: list[str], batch_size: int = 64) -> list[list[float]]:
-    """Encode texts into 384-dim embeddings."""
+def warm_up_model() -> None:
+    """Load the model and run one encode so the first real request doesn't pay for it."""
+    start = time.monotonic()
+    encode_array(["warmup"])
+    log.info("embedding_model_warm", seconds=round(time.monotonic() - start, 2))
+
+
+def estimate_token_length(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for callers without a count."""
+    return len(text) // 4 + 2
+
+
+def plan_batches(lengths: list[int], token_budget: int, max_batch_size: int) -> list[list[int]]:
+    """Group indices into length-sorted batches whose padded size fits a token budget.
+
+    Every batch pads to its longest member, so sorting by length keeps short
+    and long texts apart, and sizing by len(batch) * longest rather than by
+    row count lets short texts go through in much larger batches.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches: list[list[int]] = []
+    current: list[int] = []
+    longest = 0
+    for i in order:
+        if current and (len(current) >= max_batch_size or (len(current) + 1) * longest > token_budget):
+            batches.append(current)
+            current = []
+        if not current:
+            # Sorted longest first, so the first member sets the padded length
+            longest = max(lengths[i], 1)
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def encode_array(
+    texts: list[str], batch_size: int = 256, lengths: list[int] | None = None
+) -> np.ndarray:
+    """Encode texts into a (len(texts), 384) float32 array of normalized embeddings.
+
+    Texts are encoded in token-budgeted, length-bucketed batches (see
+    plan_batches) and returned in their original order. batch_size caps the
+    rows in a batch; lengths are token counts, estimated when not given.
+    """
     model = get_model()
-    embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True)
-    return embeddings.tolist()
+    if lengths is None:
+        lengths = [estimate_token_length(t) for t in texts]
+    max_seq_length = getattr(model, "max_seq_length", None) or 512
+    lengths = [min(length, max_seq_length) for length in lengths]
 
+    out = np.empty((len(texts), settings.embedding_dim), dtype=np.float32)
+    for batch in plan_batches(lengths, settings.embedding_token_budget, batch_size):
+        out[batch] = model.encode(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        )
+    return out
 
-async def run_embeddings(batch_size: int = 100) -> int:
-    """Generate embeddings for all chunks that don't have them."""
-    async with async_session_factory() as session:
-        result = await session.execute(
-            select(Chunk).where(Chunk.embedding.is_(None)).limit(10000)
+
+def embed_texts(
+    texts: list[str], batch_size: int = 256, lengths: list[int] | None = None
+) -> list[list[float]]:
+    """Encode texts into 384-dim embeddings, reusing cached vectors where possible."""
+    from watchdog.services.embedding_cache import get_embedding_cache
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return encode_array(texts, batch_size=batch_size, lengths=lengths).tolist()
+
+    length_of = dict(zip(texts, lengths)) if lengths is not None else {}
+
+    def encode_missing(missing: list[str]) -> np.ndarray:
+        missing_lengths = [length_of[t] for t in missing] if length_of else None
+        return encode_array(missing, batch_size=batch_size, lengths=missing_lengths)
+
+    return cache.embed(texts, encode_missing).tolist()
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=settings.embedding_threads, thread_name_prefix="embedding"
         )
-        chunks = result.scalars().all()
+    return _thread_pool
+
+
+async def aembed_texts(
+    texts: list[str], batch_size: int = 256, lengths: list[int] | None = None
+) -> list[list[float]]:
+    """Encode texts on the embedding thread pool so the event loop stays responsive."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_thread_pool(), partial(embed_texts, texts, batch_size, lengths)
+    )
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query string -> embedding with a TTL per entry."""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, list[float]]] = OrderedDict()
+
+    @staticmethod
+    def key(query: str) -> str:
+        return " ".join(query.split())
+
+    def get(self, query: str) -> list[float] | None:
+        key = self.key(query)
+        entry = self._entries.get(key)
+        if entry is None or self._clock() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, embedding: list[float]) -> None:
+        key = self.key(query)
+        self._entries[key] = (self._clock(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+
+query_cache = QueryEmbeddingCache(
+    max_size=settings.query_cache_size, ttl_seconds=settings.query_cache_ttl_seconds
+)
+
+
+async def embed_query(query: str) -> list[float]:
+    """Embed a search query, serving repeated queries from the in-process cache."""
+    return (await embed_queries([query]))[0]
+
+
+async def embed_queries(queries: list[str]) -> list[list[float]]:
+    """Embed many search queries, encoding all cache misses in one batched model call."""
+    embeddings = [query_cache.get(q) for q in queries]
+    missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+    if missing:
+        fresh = dict(zip(missing, await aembed_texts(missing)))
+        for query, embedding in fresh.items():
+            query_cache.put(query, embedding)
+        embeddings = [e if e is not None else fresh[q] for q, e in zip(queries, embeddings)]
+    return embeddings
+
 
-        if not chunks:
-            log.info("no_chunks_need_embeddings")
-            return 0
+async def run_embeddings(batch_size: int = settings.embedding_page_size) -> int:
+    """Generate embeddings for all chunks that don't have them.
 
-        total = 0
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i : i + batch_size]
-            texts = [c.text for c in batch]
-            embeddings = embed_texts(texts)
+    Streams pending chunks by keyset on id, loading only id, text and token
+    count, and commits every batch so memory stays bounded and a crash loses
+    at most one batch.
+    """
+    from watchdog.services.embedding_pool import EncoderPool
 
-            for chunk, emb in zip(batch, embeddings):
-                chunk.embedding = emb
+    total = 0
+    batch = 0
+    last_id = ""
 
-            total += len(batch)
-            log.info("embeddings_generated", batch=i // batch_size + 1, count=len(batch))
+    async with async_session_factory() as session, EncoderPool() as pool:
+        while True:
+            result = await session.execute(
+                select(Chunk.id, Chunk.text, Chunk.token_count)
+                .where(Chunk.embedding.is_(None), Chunk.id > last_id)
+                .order_by(Chunk.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
 
-        await session.commit()
+            embeddings = await pool.embed(
+                [row.text for row in rows], lengths=[row.token_count for row in rows]
+            )
+            await session.execute(
+                update(Chunk),
+                [{"id": row.id, "embedding": emb} for row, emb in zip(rows, embeddings)],
+            )
+            await session.commit()
 
-    log.info("embedding_complete", total=total)
+            last_id = rows[-1].id
+            total += len(rows)
+            batch += 1
+            log.info("embeddings_generated", batch=batch, count=len(rows), total=total)
+
+    documents = await run_document_embeddings()
+
+    if is_sqlite() and (total or documents):
+        # The embedded backend searches a memory-mapped copy of the vectors
+        from watchdog.services.vector_index import run_vector_index_build
+
+        await run_vector_index_build()
+
+    if not total:
+        log.info("no_chunks_need_embeddings")
+        return 0
+
+    log.info("embedding_complete", total=total, documents=documents, cache=pool.cache_stats())
     return total
 
 
-async def search_similar(query: str, session: AsyncSession, limit: int = 10) -> list[dict]:
-    """Semantic similarity search using pgvector cosine distance."""
-    query_embedding = embed_texts([query])[0]
+def document_centroid(vectors: np.ndarray, token_counts: list[int]) -> np.ndarray:
+    """Token-weighted mean of a document's chunk vectors, renormalized to unit length."""
+    weights = np.maximum(np.asarray(token_counts, dtype=np.float32), 1.0)
+    centroid = (vectors * weights[:, None]).sum(axis=0) / weights.sum()
+    norm = np.linalg.norm(centroid)
+    return centroid / norm if norm > 0 else centroid
+
 
-    # Use pgvector cosine distance operator
-    result = await session.execute(
-        select(Chunk)
-        .where(Chunk.embedding.isnot(None))
-        .order_by(Chunk.embedding.cosine_distance(query_embedding))
-        .limit(limit)
+async def run_document_embeddings(batch_size: int = 200) -> int:
+    """Fill in document embeddings for documents whose chunks are all embedded.
+
+    Re-chunking clears a document's embedding, so this also keeps centroids
+    current as chunks change.
+    """
+    has_chunks = select(Chunk.id).where(Chunk.document_id == Document.id).exists()
+    has_pending = (
+        select(Chunk.id).where(Chunk.document_id == Document.id, Chunk.embedding.is_(None)).exists()
     )
-    chunks = result.scalars().all()
-
-    return [
-        {
-            "chunk_id": c.id,
-            "document_id": c.document_id,
-            "text": c.filtered_text or c.text,
-            "token_count": c.token_count,
-            "page_start": c.page_start,
-            "page_end": c.page_end,
-            "score": float(1 - np.dot(query_embedding, c.embedding)) if c.embedding else 0,
-        }
-        for c in chunks
-    ]
+
+    total = 0
+    last_id = ""
+    async with async_session_factory() as session:
+        while True:
+            result = await session.execute(
+                select(Document.id)
+                .where(Document.embedding.is_(None), Document.id > last_id, has_chunks, ~has_pending)
+                .order_by(Document.id)
+                .limit(batch_size)
+            )
+            document_ids = result.scalars().all()
+            if not document_ids:
+                break
+
+            chunk_result = await session.execute(
+                select(Chunk.document_id, Chunk.embedding, Chunk.token_count)
+                .where(Chunk.document_id.in_(document_ids))
+            )
+            by_document: dict[str, tuple[list, list[int]]] = {}
+            for row in chunk_result.all():
+                vectors, counts = by_document.setdefault(row.document_id, ([], []))
+                vectors.append(row.embedding)
+                counts.append(row.token_count)
+
+            await session.execute(
+                update(Document),
+                [
+                    {"id": doc_id, "embedding": document_centroid(np.array(vectors), counts).tolist()}
+                    for doc_id, (vectors, counts) in by_document.items()
+                ],
+            )
+            await session.commit()
+
+            last_id = document_ids[-1]
+            total += len(by_document)
+
+    if total:
+        log.info("document_embeddings_updated", documents=total)
+    return total
@@ -0,0 +1,187 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import numpy as np
+import structlog
+
+from watchdog.config import settings
+from watchdog.utils.hashing import sha256_bytes
+
+log = structlog.get_logger()
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+_cache: "EmbeddingCache | None" = None
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC with whitespace runs collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_model_id() -> str:
+    """Identify the model and backend that produce the vectors being cached."""
+    model_id = f"{settings.embedding_model}:{settings.embedding_backend}"
+    if settings.embedding_backend == "onnx" and settings.embedding_onnx_quantized:
+        model_id += ":int8"
+    return model_id
+
+
+class EmbeddingCache:
+    """Persistent text -> embedding cache in a local SQLite file.
+
+    Keys are a hash of the normalized text plus the model id, so vectors from
+    different models never mix. When the cache grows past max_entries the
+    least recently used tenth is evicted.
+    """
+
+    def __init__(self, path: Path, model_id: str, max_entries: int, dim: int = settings.embedding_dim):
+        self.path = path
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL,"
+                " vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            self._size = conn.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def key(self, text: str) -> str:
+        return sha256_bytes(f"{self.model_id}\0{normalize_text(text)}".encode())
+
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """Look up cached vectors, returning None for each miss."""
+        keys = [self.key(t) for t in texts]
+        found: dict[str, np.ndarray] = {}
+
+        with self._lock:
+            conn = self._connect()
+            unique = list(dict.fromkeys(keys))
+            for i in range(0, len(unique), _SQL_BATCH):
+                batch = unique[i : i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            hit_keys = list(found)
+            now = time.time()
+            for i in range(0, len(hit_keys), _SQL_BATCH):
+                batch = hit_keys[i : i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *batch]
+                )
+            conn.commit()
+
+            vectors = [found.get(k) for k in keys]
+            hits = sum(v is not None for v in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts: list[str], vectors: np.ndarray) -> None:
+        now = time.time()
+        rows = [
+            (self.key(t), self.model_id, np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._size += conn.total_changes - before
+            if self._size > self.max_entries:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        target = int(self.max_entries * 0.9)
+        excess = self._size - target
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN"
+            " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._size = conn.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+        log.info("embedding_cache_evicted", evicted=excess, size=self._size)
+
+    def _merge(
+        self, texts: list[str], found: list[np.ndarray | None], missing: list[str], fresh: np.ndarray
+    ) -> np.ndarray:
+        by_text = dict(zip(missing, fresh))
+        vectors = [v if v is not None else by_text[t] for t, v in zip(texts, found)]
+        if not vectors:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def embed(self, texts: list[str], encode: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """Return vectors for texts, encoding and storing only the cache misses."""
+        found = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+        fresh = encode(missing) if missing else np.zeros((0, self.dim), dtype=np.float32)
+        if missing:
+            self.put_many(missing, fresh)
+        return self._merge(texts, found, missing, fresh)
+
+    async def aembed(
+        self, texts: list[str], encode: Callable[[list[str]], Awaitable[np.ndarray]]
+    ) -> np.ndarray:
+        """Async variant of embed(); cache I/O runs off the event loop."""
+        found = await asyncio.to_thread(self.get_many, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+        fresh = await encode(missing) if missing else np.zeros((0, self.dim), dtype=np.float32)
+        if missing:
+            await asyncio.to_thread(self.put_many, missing, fresh)
+        return self._merge(texts, found, missing, fresh)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": self._size,
+            "max_entries": self.max_entries,
+        }
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Process-wide cache for the configured model, or None when disabled."""
+    global _cache
+    if not settings.embedding_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = EmbeddingCache(
+            settings.embedding_cache_path,
+            model_id=embedding_model_id(),
+            max_entries=settings.embedding_cache_max_entries,
+        )
+    return _cache
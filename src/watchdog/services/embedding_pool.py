@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Self
+
+import numpy as np
+import structlog
+
+from watchdog.config import settings
+from watchdog.services.embedding import (
+    aembed_texts,
+    encode_array,
+    estimate_token_length,
+    get_model,
+    set_encode_threads,
+)
+from watchdog.services.embedding_cache import get_embedding_cache
+
+log = structlog.get_logger()
+
+# Smallest slice of a page worth shipping to another process
+MIN_SHARD_SIZE = 32
+
+
+def _init_worker(threads: int) -> None:
+    """Load the model once per worker process, sharing the cores between workers."""
+    set_encode_threads(threads)
+    get_model()
+
+
+def _encode_shard(texts: list[str], lengths: list[int], batch_size: int) -> np.ndarray:
+    return encode_array(texts, batch_size=batch_size, lengths=lengths)
+
+
+def split_shards(lengths: list[int], workers: int, min_shard_size: int) -> list[list[int]]:
+    """Deal indices, longest first, across at most `workers` shards of at least min_shard_size.
+
+    Dealing round-robin gives every worker a similar mix of lengths, so no
+    single worker ends up with all the long texts.
+    """
+    if not lengths:
+        return []
+    shard_count = max(1, min(workers, len(lengths) // max(min_shard_size, 1)))
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[k::shard_count] for k in range(shard_count)]
+
+
+class EncoderPool:
+    """Multi-process embedding encoder for batch jobs.
+
+    With a single worker it falls back to the in-process embedding thread
+    pool, so small runs don't pay for spawning and loading extra models.
+    """
+
+    def __init__(self, workers: int | None = None):
+        workers = settings.embedding_workers if workers is None else workers
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def __aenter__(self) -> Self:
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+            log.info("encoder_pool_started", workers=self.workers, threads_per_worker=threads)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    async def embed(
+        self, texts: list[str], batch_size: int = 256, lengths: list[int] | None = None
+    ) -> list[list[float]]:
+        """Encode texts, spreading them across the worker processes.
+
+        lengths are per-text token counts used for length-bucketed batching.
+        """
+        if self._executor is None:
+            # The thread pool path goes through embed_texts, which consults the cache
+            return await aembed_texts(texts, batch_size=batch_size, lengths=lengths)
+
+        if lengths is None:
+            lengths = [estimate_token_length(t) for t in texts]
+        cache = get_embedding_cache()
+        if cache is None:
+            return (await self._encode(texts, lengths, batch_size)).tolist()
+
+        length_of = dict(zip(texts, lengths))
+        vectors = await cache.aembed(
+            texts, lambda missing: self._encode(missing, [length_of[t] for t in missing], batch_size)
+        )
+        return vectors.tolist()
+
+    async def _encode(self, texts: list[str], lengths: list[int], batch_size: int) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        shards = split_shards(lengths, self.workers, min_shard_size=MIN_SHARD_SIZE)
+        arrays = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._executor,
+                    _encode_shard,
+                    [texts[i] for i in shard],
+                    [lengths[i] for i in shard],
+                    batch_size,
+                )
+                for shard in shards
+            )
+        )
+
+        out = np.empty((len(texts), settings.embedding_dim), dtype=np.float32)
+        for shard, array in zip(shards, arrays):
+            out[shard] = array
+        return out
+
+    def cache_stats(self) -> dict | None:
+        cache = get_embedding_cache()
+        return cache.stats() if cache else None
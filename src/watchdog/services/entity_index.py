@@ -0,0 +1,212 @@
+import asyncio
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections.abc import Callable, Iterable
+from datetime import datetime, timedelta
+
+import structlog
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from watchdog.config import settings
+from watchdog.database import is_sqlite
+from watchdog.models.document import Entity
+
+log = structlog.get_logger()
+
+# Re-read rows this far behind the newest updated_at seen, so rows committed by
+# transactions that started earlier are not skipped
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Case- and accent-insensitive form used for matching."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def name_tokens(name: str) -> list[str]:
+    return _TOKEN.findall(fold(name))
+
+
+class EntityPrefixIndex:
+    """In-process prefix index over entity name tokens for autocomplete.
+
+    Each word of a name is a key, so "max" finds "Ghislaine Maxwell"; every
+    word of a multi-word query must prefix some word of the name. The index
+    is kept current by refresh(), which only reads entities updated since the
+    last refresh.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float = settings.entity_index_refresh_seconds,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._entities: dict[str, tuple[str, str, int]] = {}  # id -> (name, type, mention_count)
+        self._tokens: dict[str, list[str]] = {}
+        self._folded: dict[str, str] = {}  # id -> folded name words joined by spaces
+        self._keys: list[tuple[str, str]] = []  # sorted (token, entity id)
+        self._watermark: datetime | None = None
+        self._checked_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def upsert(self, rows: Iterable[tuple[str, str, str, int]]) -> None:
+        """Add or replace entities given as (id, name, entity_type, mention_count)."""
+        changed = []
+        for entity_id, name, entity_type, mention_count in rows:
+            self._entities[entity_id] = (name, entity_type, mention_count)
+            words = name_tokens(name)
+            self._folded[entity_id] = " ".join(words)
+            tokens = sorted(set(words))
+            if self._tokens.get(entity_id) != tokens:
+                changed.append((entity_id, self._tokens.get(entity_id, []), tokens))
+                self._tokens[entity_id] = tokens
+
+        if len(changed) > len(self._keys) // 10:
+            # Bulk loads re-sort once instead of inserting key by key
+            self._keys = sorted((t, i) for i, tokens in self._tokens.items() for t in tokens)
+            return
+        for entity_id, old, new in changed:
+            for token in old:
+                pos = bisect_left(self._keys, (token, entity_id))
+                if pos < len(self._keys) and self._keys[pos] == (token, entity_id):
+                    del self._keys[pos]
+            for token in new:
+                insort(self._keys, (token, entity_id))
+
+    def _prefixed(self, prefix: str) -> set[str]:
+        ids = set()
+        pos = bisect_left(self._keys, (prefix, ""))
+        while pos < len(self._keys) and self._keys[pos][0].startswith(prefix):
+            ids.add(self._keys[pos][1])
+            pos += 1
+        return ids
+
+    def search(self, query: str, limit: int = 10, entity_type: str | None = None) -> list[dict]:
+        """Entities whose name words start with the query words, best first.
+
+        Exact names rank first, then names starting with the query, then by
+        mention count.
+        """
+        words = name_tokens(query)
+        if not words:
+            return []
+        folded = " ".join(words)
+        # Start from the longest word, which usually has the fewest matches
+        words.sort(key=len, reverse=True)
+        candidates = self._prefixed(words[0])
+        for word in words[1:]:
+            candidates = {
+                i for i in candidates if any(t.startswith(word) for t in self._tokens[i])
+            }
+
+        ranked = []
+        for entity_id in candidates:
+            name, etype, mention_count = self._entities[entity_id]
+            if entity_type and etype != entity_type:
+                continue
+            folded_name = self._folded[entity_id]
+            rank = 0 if folded_name == folded else 1 if folded_name.startswith(folded) else 2
+            ranked.append((rank, -mention_count, name, entity_id))
+        ranked.sort()
+
+        return [
+            {
+                "id": entity_id,
+                "name": name,
+                "entity_type": self._entities[entity_id][1],
+                "mention_count": -neg_count,
+                "match": "prefix",
+            }
+            for _, neg_count, name, entity_id in ranked[:limit]
+        ]
+
+    async def refresh(self, session: AsyncSession, force: bool = False) -> int:
+        """Load entities created or updated since the last refresh, at most every refresh_seconds."""
+        now = self._clock()
+        if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+            return 0
+
+        async with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+                return 0
+            query = select(
+                Entity.id, Entity.name, Entity.entity_type, Entity.mention_count, Entity.updated_at
+            )
+            if self._watermark is not None:
+                query = query.where(Entity.updated_at >= self._watermark - REFRESH_OVERLAP)
+            rows = (await session.execute(query)).all()
+
+            self.upsert((r.id, r.name, r.entity_type, r.mention_count) for r in rows)
+            stamps = [r.updated_at for r in rows if r.updated_at is not None]
+            if stamps:
+                self._watermark = max(stamps + ([self._watermark] if self._watermark else []))
+            self._checked_at = now
+
+        if len(rows) > 1000:
+            log.info("entity_index_refreshed", loaded=len(rows), size=len(self))
+        return len(rows)
+
+
+entity_index = EntityPrefixIndex()
+
+
+async def fuzzy_entities(
+    session: AsyncSession,
+    query: str,
+    limit: int = 10,
+    entity_type: str | None = None,
+    exclude: set[str] | None = None,
+) -> list[dict]:
+    """Trigram-similar entity names via pg_trgm (migration 009); empty on the embedded backend."""
+    if is_sqlite():
+        return []
+    similarity = func.similarity(Entity.name, query).label("similarity")
+    stmt = (
+        select(Entity.id, Entity.name, Entity.entity_type, Entity.mention_count, similarity)
+        .where(Entity.name.op("%")(query))
+        .order_by(similarity.desc(), Entity.mention_count.desc())
+        .limit(limit + len(exclude or ()))
+    )
+    if entity_type:
+        stmt = stmt.where(Entity.entity_type == entity_type)
+    rows = (await session.execute(stmt)).all()
+    return [
+        {
+            "id": r.id,
+            "name": r.name,
+            "entity_type": r.entity_type,
+            "mention_count": r.mention_count,
+            "match": "fuzzy",
+            "similarity": round(float(r.similarity), 4),
+        }
+        for r in rows
+        if not exclude or r.id not in exclude
+    ][:limit]
+
+
+async def search_entities(
+    session: AsyncSession,
+    query: str,
+    limit: int = 10,
+    entity_type: str | None = None,
+    fuzzy: bool = True,
+) -> list[dict]:
+    """Prefix matches from the in-process index, topped up with fuzzy matches when short."""
+    await entity_index.refresh(session)
+    results = entity_index.search(query, limit, entity_type)
+    if fuzzy and len(results) < limit and len(query.strip()) >= 3:
+        results += await fuzzy_entities(
+            session, query, limit - len(results), entity_type, exclude={r["id"] for r in results}
+        )
+    return results
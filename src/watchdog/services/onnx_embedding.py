@@ -0,0 +1,177 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import structlog
+
+from watchdog.config import settings
+
+log = structlog.get_logger()
+
+ONNX_FILENAME = "model.onnx"
+QUANTIZED_FILENAME = "model.int8.onnx"
+CONFIG_FILENAME = "embedding_config.json"
+
+# Minimum cosine similarity between torch and ONNX vectors for the export to pass
+PARITY_THRESHOLDS = {"fp32": 0.9999, "int8": 0.98}
+
+PARITY_TEXTS = [
+    "Deposition of the witness taken on March 5, 2005 in Palm Beach, Florida.",
+    "Flight log entries list the passengers on the aircraft.",
+    "EXHIBIT 12 — Bank wire transfer records, account ending 4471.",
+    "The court grants the motion to unseal in part and denies it in part.",
+    "Q. Did you ever meet him at the residence? A. I don't recall.",
+    "Page intentionally left blank.",
+]
+
+
+def onnx_model_dir(model_name: str = settings.embedding_model) -> Path:
+    return settings.data_dir / "onnx" / model_name.replace("/", "__")
+
+
+def export_onnx(model_name: str = settings.embedding_model, out_dir: Path | None = None) -> Path:
+    """Export the sentence-transformer's encoder to ONNX plus an int8 dynamic-quantized copy.
+
+    Only the transformer is exported; mean pooling and normalization are
+    done in NumPy by OnnxEncoder, matching the sentence-transformers pipeline.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = out_dir or onnx_model_dir(model_name)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    tokenizer = transformer.tokenizer
+    auto_model = transformer.auto_model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names + ["last_hidden_state"]}
+
+    class _Encoder(torch.nn.Module):
+        # Pins the exported signature to named inputs -> last_hidden_state
+        def __init__(self):
+            super().__init__()
+            self.model = auto_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    onnx_path = out_dir / ONNX_FILENAME
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder().eval(),
+            tuple(sample[n] for n in input_names),
+            str(onnx_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    quantize_dynamic(str(onnx_path), str(out_dir / QUANTIZED_FILENAME), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(str(out_dir))
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+    }
+    (out_dir / CONFIG_FILENAME).write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    log.info("onnx_export_complete", model=model_name, out_dir=str(out_dir))
+    return out_dir
+
+
+class OnnxEncoder:
+    """Mean-pooled, normalized sentence embeddings from an exported ONNX model.
+
+    Exposes the subset of SentenceTransformer.encode that embed_texts uses,
+    without importing torch.
+    """
+
+    def __init__(self, model_dir: Path, quantized: bool = False, threads: int | None = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        config = json.loads((model_dir / CONFIG_FILENAME).read_text(encoding="utf-8"))
+        self.dimension = config["dimension"]
+        self.max_seq_length = config["max_seq_length"]
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_path = model_dir / (QUANTIZED_FILENAME if quantized else ONNX_FILENAME)
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: list[str], batch_size: int = 64, **_: object) -> np.ndarray:
+        batches = []
+        for i in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[i : i + batch_size])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": mask,
+            }
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.concatenate(batches)
+
+
+def check_parity(
+    model_name: str = settings.embedding_model,
+    model_dir: Path | None = None,
+    texts: list[str] = PARITY_TEXTS,
+) -> dict[str, dict[str, float]]:
+    """Compare ONNX fp32 and int8 vectors against the torch model's vectors."""
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = model_dir or onnx_model_dir(model_name)
+    reference = SentenceTransformer(model_name, device="cpu").encode(
+        texts, normalize_embeddings=True, show_progress_bar=False
+    )
+
+    report = {}
+    for variant, quantized in (("fp32", False), ("int8", True)):
+        vectors = OnnxEncoder(model_dir, quantized=quantized).encode(texts)
+        cosine = (reference * vectors).sum(axis=1)
+        report[variant] = {
+            "min_cosine": round(float(cosine.min()), 6),
+            "mean_cosine": round(float(cosine.mean()), 6),
+            "max_abs_diff": round(float(np.abs(reference - vectors).max()), 6),
+            "passed": bool(cosine.min() >= PARITY_THRESHOLDS[variant]),
+        }
+    return report
+
+
+def run_onnx_export(model_name: str = settings.embedding_model) -> dict:
+    """Export the embedding model to ONNX and verify it against torch."""
+    model_dir = export_onnx(model_name)
+    report = check_parity(model_name, model_dir)
+    log.info("onnx_parity", **report)
+
+    failed = [variant for variant, r in report.items() if not r["passed"]]
+    if failed:
+        raise RuntimeError(f"ONNX parity check failed for: {', '.join(failed)}")
+    return {"onnx_dir": str(model_dir), "parity": report}
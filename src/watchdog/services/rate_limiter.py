@@ -0,0 +1,328 @@
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable, Mapping
+
+import structlog
+
+from watchdog.config import settings
+
+log = structlog.get_logger()
+
+# Bucket names as they appear in the anthropic-ratelimit-<bucket>-* response headers
+BUCKETS = ("requests", "input-tokens", "output-tokens")
+
+# Longest single sleep while waiting for capacity; the bucket is re-checked after it
+MAX_SLEEP_SECONDS = 5.0
+
+# Backoff before trying Redis again after it failed, doubling per failure up to the max
+REDIS_RETRY_SECONDS = 5.0
+REDIS_RETRY_MAX_SECONDS = 60.0
+
+# Buckets refill continuously at capacity per minute. A request takes from every
+# bucket at once or from none; a request larger than a bucket's capacity waits
+# for a full bucket and leaves it in debt.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local paused = tonumber(redis.call('GET', KEYS[1]) or '0')
+if paused > now then
+  return tostring(paused - now)
+end
+local wait = 0
+local levels = {}
+for i = 2, #KEYS do
+  local amount = tonumber(ARGV[2 * i - 2])
+  local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts', 'capacity')
+  local capacity = tonumber(state[3]) or tonumber(ARGV[2 * i - 1])
+  local tokens = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60)
+  levels[i] = {tokens, capacity, amount}
+  local need = math.min(amount, capacity)
+  if tokens < need then
+    wait = math.max(wait, (need - tokens) * 60 / capacity)
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i = 2, #KEYS do
+  redis.call('HSET', KEYS[i], 'tokens', levels[i][1] - levels[i][3], 'ts', now, 'capacity', levels[i][2])
+  redis.call('EXPIRE', KEYS[i], 3600)
+end
+return '0'
+"""
+
+ADJUST_SCRIPT = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'capacity')
+local capacity = tonumber(ARGV[4]) or tonumber(state[3]) or tonumber(ARGV[2])
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60 + tonumber(ARGV[3]))
+local ceiling = tonumber(ARGV[5])
+if ceiling then
+  tokens = math.min(tokens, ceiling)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'capacity', capacity)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(tokens)
+"""
+
+PAUSE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local until_ts = tonumber(ARGV[1])
+if until_ts > current then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', math.ceil(until_ts - tonumber(ARGV[2])) + 1)
+end
+return 0
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used to reserve input capacity before a call; settled afterwards."""
+    return len(text) // 4 + 1
+
+
+class MemoryBucketStore:
+    """Token buckets in this process only; same semantics as RedisBucketStore.
+
+    share scales every capacity and ceiling it is given, for a process that
+    stands in for its part of a limit shared with other workers.
+    """
+
+    def __init__(self, share: float = 1.0):
+        self.share = share
+        self._buckets: dict[str, dict[str, float]] = {}
+        self._paused: dict[str, float] = {}
+
+    def _level(self, key: str, now: float, default_capacity: float) -> dict[str, float]:
+        state = self._buckets.get(key)
+        if state is None:
+            default_capacity *= self.share
+            state = {"tokens": default_capacity, "ts": now, "capacity": default_capacity}
+        capacity = state["capacity"]
+        tokens = min(capacity, state["tokens"] + max(0.0, now - state["ts"]) * capacity / 60)
+        return {"tokens": tokens, "ts": now, "capacity": capacity}
+
+    async def take(self, pause_key: str, amounts: dict[str, tuple[float, float]], now: float) -> float:
+        if self._paused.get(pause_key, 0.0) > now:
+            return self._paused[pause_key] - now
+        levels = {key: self._level(key, now, capacity) for key, (_, capacity) in amounts.items()}
+        wait = 0.0
+        for key, (amount, _) in amounts.items():
+            level = levels[key]
+            need = min(amount, level["capacity"])
+            if level["tokens"] < need:
+                wait = max(wait, (need - level["tokens"]) * 60 / level["capacity"])
+        if wait > 0:
+            return wait
+        for key, (amount, _) in amounts.items():
+            levels[key]["tokens"] -= amount
+            self._buckets[key] = levels[key]
+        return 0.0
+
+    async def adjust(
+        self,
+        key: str,
+        now: float,
+        default_capacity: float,
+        delta: float = 0.0,
+        capacity: float | None = None,
+        ceiling: float | None = None,
+    ) -> float:
+        level = self._level(key, now, default_capacity)
+        if capacity is not None:
+            level["capacity"] = capacity * self.share
+        level["tokens"] = min(level["capacity"], level["tokens"] + delta)
+        if ceiling is not None:
+            level["tokens"] = min(level["tokens"], ceiling * self.share)
+        self._buckets[key] = level
+        return level["tokens"]
+
+    async def pause(self, pause_key: str, until: float, now: float) -> None:
+        self._paused[pause_key] = max(self._paused.get(pause_key, 0.0), until)
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis; updates are atomic Lua scripts."""
+
+    def __init__(self, client):
+        self.client = client
+        self._take = client.register_script(TAKE_SCRIPT)
+        self._adjust = client.register_script(ADJUST_SCRIPT)
+        self._pause = client.register_script(PAUSE_SCRIPT)
+
+    async def take(self, pause_key: str, amounts: dict[str, tuple[float, float]], now: float) -> float:
+        args: list[float] = [now]
+        for amount, capacity in amounts.values():
+            args += [amount, capacity]
+        return float(await self._take(keys=[pause_key, *amounts], args=args))
+
+    async def adjust(
+        self,
+        key: str,
+        now: float,
+        default_capacity: float,
+        delta: float = 0.0,
+        capacity: float | None = None,
+        ceiling: float | None = None,
+    ) -> float:
+        args = [now, default_capacity, delta, "" if capacity is None else capacity, "" if ceiling is None else ceiling]
+        return float(await self._adjust(keys=[key], args=args))
+
+    async def pause(self, pause_key: str, until: float, now: float) -> None:
+        await self._pause(keys=[pause_key], args=[until, now])
+
+
+class RateLimiter:
+    """Requests, input-token and output-token per-minute buckets for Claude calls.
+
+    Callers reserve capacity with acquire() before a call and report the real
+    usage with settle() after it. observe() folds the rate-limit response
+    headers back in: the org's limit becomes the bucket capacity, its remaining
+    allowance caps the bucket level, and retry-after pauses every worker
+    sharing the store until that time.
+
+    If Redis becomes unreachable, calls fall back to in-process buckets sized
+    to 1/fallback_workers of the limits, so the workers together stay within
+    them, and Redis is tried again after a backoff.
+    """
+
+    def __init__(
+        self,
+        store: MemoryBucketStore | RedisBucketStore,
+        limits: Mapping[str, float],
+        prefix: str = "watchdog:ratelimit",
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        fallback_workers: int = 1,
+    ):
+        self.store = store
+        self.limits = dict(limits)
+        self.prefix = prefix
+        self._clock = clock
+        self._sleep = sleep
+        self._fallback = MemoryBucketStore(share=1 / max(1, fallback_workers))
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _key(self, model: str, bucket: str) -> str:
+        return f"{self.prefix}:{model}:{bucket}"
+
+    async def _store_call(self, method: str, *args, **kwargs):
+        if self._failures and self._clock() < self._retry_at:
+            return await getattr(self._fallback, method)(*args, **kwargs)
+        try:
+            result = await getattr(self.store, method)(*args, **kwargs)
+        except Exception as e:
+            from redis.exceptions import ConnectionError as RedisConnectionError
+            from redis.exceptions import TimeoutError as RedisTimeoutError
+
+            if not isinstance(e, (RedisConnectionError, RedisTimeoutError, OSError)):
+                raise
+            # Keep calling Claude on this worker's share of the limits rather than failing the step
+            self._failures += 1
+            backoff = min(REDIS_RETRY_MAX_SECONDS, REDIS_RETRY_SECONDS * 2 ** (self._failures - 1))
+            self._retry_at = self._clock() + backoff
+            log.warning("rate_limiter_redis_unavailable", error=str(e), retry_in=backoff)
+            return await getattr(self._fallback, method)(*args, **kwargs)
+        if self._failures:
+            log.info("rate_limiter_redis_restored", failures=self._failures)
+            self._failures = 0
+        return result
+
+    async def acquire(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """Wait until one request and the given tokens fit in every bucket; returns seconds waited."""
+        amounts = {
+            self._key(model, "requests"): (1, self.limits["requests"]),
+            self._key(model, "input-tokens"): (input_tokens, self.limits["input-tokens"]),
+            self._key(model, "output-tokens"): (output_tokens, self.limits["output-tokens"]),
+        }
+        waited = 0.0
+        while True:
+            wait = await self._store_call("take", self._key(model, "pause"), amounts, self._clock())
+            if wait <= 0:
+                if waited:
+                    log.debug("rate_limited", model=model, waited_seconds=round(waited, 2))
+                return waited
+            # Jitter keeps workers that woke together from retrying in lockstep
+            delay = min(wait, MAX_SLEEP_SECONDS) * random.uniform(1.0, 1.2)
+            await self._sleep(delay)
+            waited += delay
+
+    async def settle(
+        self,
+        model: str,
+        reserved_input: int,
+        reserved_output: int,
+        input_tokens: int,
+        output_tokens: int,
+    ) -> None:
+        """Return over-reserved tokens to the buckets, or charge the shortfall."""
+        now = self._clock()
+        for bucket, reserved, used in (
+            ("input-tokens", reserved_input, input_tokens),
+            ("output-tokens", reserved_output, output_tokens),
+        ):
+            if reserved != used:
+                await self._store_call(
+                    "adjust", self._key(model, bucket), now, self.limits[bucket], delta=reserved - used
+                )
+
+    async def observe(self, model: str, headers: Mapping[str, str]) -> None:
+        """Adapt the buckets to the rate-limit headers of a response (including 429s)."""
+        now = self._clock()
+        for bucket in BUCKETS:
+            limit = _header_number(headers, f"anthropic-ratelimit-{bucket}-limit")
+            remaining = _header_number(headers, f"anthropic-ratelimit-{bucket}-remaining")
+            if limit is None and remaining is None:
+                continue
+            await self._store_call(
+                "adjust",
+                self._key(model, bucket),
+                now,
+                self.limits[bucket],
+                capacity=limit,
+                ceiling=remaining,
+            )
+
+        retry_after = _header_number(headers, "retry-after")
+        if retry_after:
+            await self._store_call("pause", self._key(model, "pause"), now + retry_after, now)
+            log.warning("rate_limit_pause", model=model, retry_after=retry_after)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> float | None:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Process-wide limiter for the configured backend, or None when disabled."""
+    global _limiter
+    if settings.rate_limiter_backend == "off":
+        return None
+    if _limiter is None:
+        if settings.rate_limiter_backend == "redis":
+            import redis.asyncio as redis
+
+            store = RedisBucketStore(redis.from_url(settings.redis_url))
+        else:
+            store = MemoryBucketStore()
+        _limiter = RateLimiter(
+            store,
+            limits={
+                "requests": settings.anthropic_rpm,
+                "input-tokens": settings.anthropic_itpm,
+                "output-tokens": settings.anthropic_otpm,
+            },
+            fallback_workers=settings.rate_limiter_workers,
+        )
+    return _limiter
@@ -0,0 +1,441 @@
+import asyncio
+
+import structlog
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import case, cast, func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from watchdog.config import settings
+from watchdog.database import async_session_factory, is_sqlite
+from watchdog.models.document import Anomaly, Chunk, Document, EntityMention
+from watchdog.services.embedding import embed_queries, embed_query
+from watchdog.services.snippets import HEADLINE_OPTIONS, best_windows, best_windows_batch
+from watchdog.services.vector_index import get_vector_index
+
+log = structlog.get_logger()
+
+# "exact" orders by full-precision distance (served by the ANN index from
+# migration 006); the compact modes search a smaller index first (migration
+# 004) and rerank its candidates at full precision. Only the configured
+# mode's index is built; other modes still work but scan the table.
+VECTOR_MODES = ("exact", "halfvec", "binary")
+
+# Text search configuration of the generated chunks.search_vector column (migration 007)
+FTS_CONFIG = "english"
+
+# Maintained by Postgres from filtered_text/text; not mapped on the Chunk model
+chunk_search_vector = literal_column("chunks.search_vector", type_=TSVECTOR)
+
+# Columns returned for a search hit; embeddings and the unredacted text stay in the database
+CHUNK_RESULT_COLUMNS = (
+    Chunk.id,
+    Chunk.document_id,
+    Chunk.token_count,
+    Chunk.page_start,
+    Chunk.page_end,
+    func.coalesce(Chunk.filtered_text, Chunk.text).label("text"),
+)
+
+
+def coarse_distance(mode: str, query_embedding: list[float]):
+    """Distance over the compact representation; must match the index expressions in 004."""
+    dim = settings.embedding_dim
+    if mode == "halfvec":
+        return cast(Chunk.embedding, HALFVEC(dim)).cosine_distance(cast(query_embedding, HALFVEC(dim)))
+    if mode == "binary":
+        return cast(func.binary_quantize(Chunk.embedding), BIT(dim)).hamming_distance(
+            func.binary_quantize(cast(query_embedding, Vector(dim)))
+        )
+    raise ValueError(f"Unknown vector search mode: {mode}")
+
+
+def filter_conditions(
+    status: list[str] | None = None,
+    source_type: list[str] | None = None,
+    min_priority: float | None = None,
+    max_priority: float | None = None,
+    entity_id: str | None = None,
+    anomaly_severity: list[str] | None = None,
+) -> list:
+    """WHERE clauses on Chunk for structured search filters.
+
+    Each filter is a semi-join against an indexed column (migration 008), so
+    the chunk scan stays on the vector or GIN index and only checks membership.
+    """
+    document_conditions = []
+    if status:
+        document_conditions.append(Document.status.in_(status))
+    if source_type:
+        document_conditions.append(Document.source_type.in_(source_type))
+    if min_priority is not None:
+        document_conditions.append(Document.priority_score >= min_priority)
+    if max_priority is not None:
+        document_conditions.append(Document.priority_score <= max_priority)
+    if anomaly_severity:
+        document_conditions.append(
+            Document.id.in_(select(Anomaly.document_id).where(Anomaly.severity.in_(anomaly_severity)))
+        )
+
+    conditions = []
+    if document_conditions:
+        conditions.append(Chunk.document_id.in_(select(Document.id).where(*document_conditions)))
+    if entity_id:
+        conditions.append(
+            Chunk.id.in_(select(EntityMention.chunk_id).where(EntityMention.entity_id == entity_id))
+        )
+    return conditions
+
+
+async def apply_ann_settings(
+    session: AsyncSession,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    min_candidates: int = 0,
+    filtered: bool = False,
+) -> None:
+    """Set transaction-local HNSW ef_search and IVFFlat probes for the next queries.
+
+    HNSW returns at most ef_search rows, so it is raised to min_candidates
+    when a query asks for more than that. Filtered queries also enable
+    pgvector iterative index scans, which keep walking the index until enough
+    rows pass the filters instead of returning the few survivors of ef_search.
+    """
+    ef_search = max(ef_search or settings.hnsw_ef_search, min_candidates)
+    probes = probes or settings.ivfflat_probes
+    options = [
+        func.set_config("hnsw.ef_search", str(min(ef_search, 1000)), True),
+        func.set_config("ivfflat.probes", str(probes), True),
+    ]
+    if filtered and settings.vector_iterative_scan != "off":
+        options += [
+            func.set_config("hnsw.iterative_scan", settings.vector_iterative_scan, True),
+            func.set_config("hnsw.max_scan_tuples", str(settings.hnsw_max_scan_tuples), True),
+            # IVFFlat only supports relaxed ordering
+            func.set_config("ivfflat.iterative_scan", "relaxed_order", True),
+        ]
+    await session.execute(select(*options))
+
+
+def nearest_chunks_query(
+    query_embedding: list[float],
+    limit: int,
+    mode: str = "exact",
+    *columns,
+    filters: dict | None = None,
+):
+    """Select the chunks closest to the query plus their exact cosine "distance", nearest first.
+
+    Compact modes fetch limit * vector_rerank_factor candidates from the
+    halfvec or binary index, then rerank only those at full precision.
+    Filtered exact searches also go through a candidate subquery, since an
+    iterative scan in relaxed order may return rows slightly out of order.
+    Selects whole Chunk rows unless columns are given. The distance is
+    computed once per row and the ordering refers to its label.
+    """
+    if mode not in VECTOR_MODES:
+        raise ValueError(f"Unknown vector search mode: {mode}")
+
+    columns = columns or (Chunk,)
+    distance = Chunk.embedding.cosine_distance(query_embedding).label("distance")
+    conditions = [Chunk.embedding.isnot(None), *filter_conditions(**(filters or {}))]
+    if mode == "exact" and not filters:
+        return select(*columns, distance).where(*conditions).order_by(distance).limit(limit)
+
+    if mode == "exact":
+        index_distance = Chunk.embedding.cosine_distance(query_embedding)
+        candidate_limit = limit
+    else:
+        index_distance = coarse_distance(mode, query_embedding)
+        candidate_limit = limit * settings.vector_rerank_factor
+    candidates = (
+        select(Chunk.id)
+        .where(*conditions)
+        .order_by(index_distance)
+        .limit(candidate_limit)
+        .subquery()
+    )
+    query = select(*columns, distance).join(candidates, Chunk.id == candidates.c.id)
+    return query.order_by(distance).limit(limit)
+
+
+async def search_similar(
+    query: str,
+    session: AsyncSession,
+    limit: int = 10,
+    mode: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filters: dict | None = None,
+    include_text: bool = False,
+) -> list[dict]:
+    """Semantic similarity search, nearest first by pgvector cosine distance.
+
+    ef_search (HNSW) and probes (IVFFlat) trade recall for latency on this
+    query; they default to the HNSW_EF_SEARCH and IVFFLAT_PROBES settings.
+    filters are keyword arguments of filter_conditions(). Each hit carries
+    the sentence window most similar to the query as its snippet; the full
+    chunk text is only included when include_text is set.
+    """
+    query_embedding = await embed_query(query)
+    return await search_by_embedding(
+        query, query_embedding, session, limit, mode, ef_search, probes, filters, include_text
+    )
+
+
+async def search_by_embedding(
+    query: str,
+    query_embedding: list[float],
+    session: AsyncSession,
+    limit: int = 10,
+    mode: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filters: dict | None = None,
+    include_text: bool = False,
+) -> list[dict]:
+    """Vector lookup for an already-embedded query; see search_similar().
+
+    The query text is only used to shortlist snippet windows.
+    """
+    rows = await nearest_rows(query_embedding, session, limit, mode, ef_search, probes, filters)
+    snippets = await best_windows(query, query_embedding, [row.text for row in rows])
+    return chunk_hits(rows, snippets, include_text)
+
+
+async def nearest_rows(
+    query_embedding: list[float],
+    session: AsyncSession,
+    limit: int = 10,
+    mode: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filters: dict | None = None,
+) -> list:
+    """Rows shaped like CHUNK_RESULT_COLUMNS plus "distance" for the nearest chunks, nearest first."""
+    if is_sqlite():
+        return await vector_index_rows(query_embedding, session, limit, filters)
+    mode = mode or settings.vector_search_mode
+    candidates = limit if mode == "exact" else limit * settings.vector_rerank_factor
+    await apply_ann_settings(
+        session, ef_search, probes, min_candidates=candidates, filtered=bool(filters)
+    )
+    result = await session.execute(
+        nearest_chunks_query(query_embedding, limit, mode, *CHUNK_RESULT_COLUMNS, filters=filters)
+    )
+    return result.all()
+
+
+def chunk_hits(rows: list, snippets: list[str], include_text: bool = False) -> list[dict]:
+    """Search hits for rows from nearest_rows() and their snippets."""
+    hits = []
+    for row, snippet in zip(rows, snippets):
+        hit = {
+            "chunk_id": row.id,
+            "document_id": row.document_id,
+            "snippet": snippet,
+            "token_count": row.token_count,
+            "page_start": row.page_start,
+            "page_end": row.page_end,
+            "distance": float(row.distance),
+        }
+        if include_text:
+            hit["text"] = row.text
+        hits.append(hit)
+    return hits
+
+
+async def vector_index_rows(
+    query_embedding: list[float],
+    session: AsyncSession,
+    limit: int,
+    filters: dict | None = None,
+) -> list:
+    """Embedded-backend counterpart of nearest_chunks_query, via the memory-mapped index.
+
+    Filters are resolved to a set of chunk ids in SQLite first and applied as
+    a mask during the scan. Returns rows shaped like CHUNK_RESULT_COLUMNS plus
+    "distance", nearest first.
+    """
+    allowed = None
+    if filters:
+        result = await session.execute(select(Chunk.id).where(*filter_conditions(**filters)))
+        allowed = set(result.scalars().all())
+    hits = await asyncio.to_thread(get_vector_index().search, query_embedding, limit, allowed)
+    if not hits:
+        return []
+
+    distances = dict(hits)
+    distance = case(distances, value=Chunk.id).label("distance")
+    result = await session.execute(
+        select(*CHUNK_RESULT_COLUMNS, distance)
+        .where(Chunk.id.in_(distances))
+        .order_by(distance)
+    )
+    return result.all()
+
+
+async def search_similar_batch(
+    queries: list[str],
+    limit: int = 10,
+    mode: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filters: dict | None = None,
+    include_text: bool = False,
+) -> dict[str, list[dict]]:
+    """Run many semantic searches, keyed by query.
+
+    All queries are embedded in one batched model call, then the lookups run
+    concurrently, each on its own pooled session, at most
+    batch_search_concurrency at a time. The snippet windows of every hit are
+    scored together in one more model call.
+    """
+    queries = list(dict.fromkeys(queries))
+    embeddings = await embed_queries(queries)
+    semaphore = asyncio.Semaphore(settings.batch_search_concurrency)
+
+    async def lookup(query_embedding: list[float]) -> list:
+        async with semaphore, async_session_factory() as session:
+            return await nearest_rows(query_embedding, session, limit, mode, ef_search, probes, filters)
+
+    rows = await asyncio.gather(*(lookup(e) for e in embeddings))
+    snippets = await best_windows_batch(
+        [(q, e, [row.text for row in r]) for q, e, r in zip(queries, embeddings, rows)]
+    )
+    results = [chunk_hits(r, s, include_text) for r, s in zip(rows, snippets)]
+    log.info("batch_search", queries=len(queries), limit=limit)
+    return dict(zip(queries, results))
+
+
+def hybrid_query(
+    query: str,
+    query_embedding: list[float],
+    limit: int,
+    mode: str = "exact",
+    filters: dict | None = None,
+):
+    """Fuse vector and full-text rankings with reciprocal-rank fusion in one statement.
+
+    Each branch takes its top hybrid_candidates chunks (the vector branch via
+    the ANN index, the lexical branch via the GIN index on search_vector),
+    and a chunk scores sum(1 / (rrf_k + rank)) over the branches it appears in.
+    Lexical hits also get a ts_headline "headline" with the matches marked.
+    """
+    candidates = max(limit, settings.hybrid_candidates)
+    vector_hits = nearest_chunks_query(
+        query_embedding, candidates, mode, Chunk.id, filters=filters
+    ).subquery("vector_hits")
+    vector_ranked = select(
+        vector_hits.c.id,
+        func.row_number().over(order_by=vector_hits.c.distance).label("rank"),
+    ).subquery("vector_ranked")
+
+    tsquery = func.websearch_to_tsquery(FTS_CONFIG, query)
+    lexical_score = func.ts_rank_cd(chunk_search_vector, tsquery)
+    lexical_hits = (
+        select(Chunk.id, lexical_score.label("score"))
+        .where(chunk_search_vector.op("@@")(tsquery), *filter_conditions(**(filters or {})))
+        .order_by(lexical_score.desc())
+        .limit(candidates)
+        .subquery("lexical_hits")
+    )
+    lexical_ranked = select(
+        lexical_hits.c.id,
+        func.row_number().over(order_by=lexical_hits.c.score.desc()).label("rank"),
+    ).subquery("lexical_ranked")
+
+    k = settings.rrf_k
+    rrf_score = func.coalesce(literal(1.0) / (k + vector_ranked.c.rank), 0.0) + func.coalesce(
+        literal(1.0) / (k + lexical_ranked.c.rank), 0.0
+    )
+    fused = (
+        select(
+            func.coalesce(vector_ranked.c.id, lexical_ranked.c.id).label("id"),
+            rrf_score.label("rrf_score"),
+            vector_ranked.c.rank.label("vector_rank"),
+            lexical_ranked.c.rank.label("lexical_rank"),
+        )
+        .select_from(
+            vector_ranked.join(lexical_ranked, vector_ranked.c.id == lexical_ranked.c.id, full=True)
+        )
+        .order_by(rrf_score.desc())
+        .limit(limit)
+        .subquery("fused")
+    )
+
+    # Only computed for the final rows; ts_headline re-parses the text
+    headline = case(
+        (
+            fused.c.lexical_rank.isnot(None),
+            func.ts_headline(
+                FTS_CONFIG, func.coalesce(Chunk.filtered_text, Chunk.text), tsquery, HEADLINE_OPTIONS
+            ),
+        ),
+    )
+    return (
+        select(
+            *CHUNK_RESULT_COLUMNS,
+            fused.c.rrf_score,
+            fused.c.vector_rank,
+            fused.c.lexical_rank,
+            headline.label("headline"),
+        )
+        .join(fused, Chunk.id == fused.c.id)
+        .order_by(fused.c.rrf_score.desc())
+    )
+
+
+async def search_hybrid(
+    query: str,
+    session: AsyncSession,
+    limit: int = 10,
+    mode: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filters: dict | None = None,
+    include_text: bool = False,
+) -> list[dict]:
+    """Hybrid lexical + semantic search merged with reciprocal-rank fusion.
+
+    Exact names, case numbers and Bates IDs are matched by Postgres full-text
+    search; both branches run in a single round trip. Lexical hits are
+    snippeted with their highlighted headline, vector-only hits with their
+    most similar sentence window.
+    """
+    mode = mode or settings.vector_search_mode
+    query_embedding = await embed_query(query)
+
+    candidates = max(limit, settings.hybrid_candidates)
+    if mode != "exact":
+        candidates *= settings.vector_rerank_factor
+    await apply_ann_settings(
+        session, ef_search, probes, min_candidates=candidates, filtered=bool(filters)
+    )
+    result = await session.execute(hybrid_query(query, query_embedding, limit, mode, filters))
+    rows = result.all()
+    vector_only = [row for row in rows if row.headline is None]
+    windows = dict(
+        zip(
+            (row.id for row in vector_only),
+            await best_windows(query, query_embedding, [row.text for row in vector_only]),
+        )
+    )
+
+    hits = []
+    for row in rows:
+        hit = {
+            "chunk_id": row.id,
+            "document_id": row.document_id,
+            "snippet": row.headline if row.headline is not None else windows[row.id],
+            "token_count": row.token_count,
+            "page_start": row.page_start,
+            "page_end": row.page_end,
+            "score": float(row.rrf_score),
+            "vector_rank": row.vector_rank,
+            "lexical_rank": row.lexical_rank,
+        }
+        if include_text:
+            hit["text"] = row.text
+        hits.append(hit)
+    return hits
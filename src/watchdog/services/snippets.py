@@ -0,0 +1,113 @@
+import asyncio
+import re
+
+import numpy as np
+
+from watchdog.config import settings
+from watchdog.services.embedding import encode_array, get_thread_pool
+
+# Sentence ends followed by whitespace, or paragraph breaks (common in OCR output)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+WORD = re.compile(r"\w+")
+
+# ts_headline options for lexical hits; fragments are joined with an ellipsis
+HEADLINE_OPTIONS = (
+    "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=12, "
+    'FragmentDelimiter=" … "'
+)
+
+
+def split_sentences(text: str) -> list[str]:
+    return [" ".join(s.split()) for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Cut text to at most max_chars at a word boundary, marking the cut with an ellipsis."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[: max_chars - 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def preview(text: str, max_chars: int = settings.snippet_max_chars) -> str:
+    """Leading snippet of a chunk, for listings without a query."""
+    return truncate(" ".join(text.split()), max_chars)
+
+
+def sentence_windows(text: str, max_chars: int = settings.snippet_max_chars) -> list[str]:
+    """Split text into consecutive, non-overlapping runs of whole sentences up to max_chars."""
+    windows: list[str] = []
+    current = ""
+    for sentence in split_sentences(text):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            windows.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        windows.append(current)
+    return [truncate(w, max_chars) for w in windows]
+
+
+def shortlist_windows(query: str, windows: list[str], k: int) -> list[int]:
+    """Indices of the k windows sharing most distinct terms with query; ties go to earlier ones."""
+    terms = set(WORD.findall(query.lower()))
+    overlap = [len(terms.intersection(WORD.findall(w.lower()))) for w in windows]
+    return sorted(range(len(windows)), key=lambda i: -overlap[i])[:k]
+
+
+async def best_windows(
+    query: str,
+    query_embedding: list[float],
+    texts: list[str],
+    max_chars: int = settings.snippet_max_chars,
+    max_windows: int = settings.snippet_max_windows,
+) -> list[str]:
+    """Pick the sentence window of each text that is most similar to the query.
+
+    Only the max_windows windows of a text with the most query terms are
+    embedded, all texts in one batched call; texts that fit in a single
+    window are returned whole without encoding. Window vectors are thrown
+    away, so they bypass the persistent embedding cache.
+    """
+    return (await best_windows_batch([(query, query_embedding, texts)], max_chars, max_windows))[0]
+
+
+async def best_windows_batch(
+    searches: list[tuple[str, list[float], list[str]]],
+    max_chars: int = settings.snippet_max_chars,
+    max_windows: int = settings.snippet_max_windows,
+) -> list[list[str]]:
+    """best_windows() for several (query, query_embedding, texts), with one encode call for all."""
+    candidates = []
+    for query, _, texts in searches:
+        per_text = []
+        for text in texts:
+            windows = sentence_windows(text, max_chars)
+            if len(windows) > max_windows:
+                windows = [windows[i] for i in shortlist_windows(query, windows, max_windows)]
+            per_text.append(windows)
+        candidates.append(per_text)
+
+    to_score = [w for per_text in candidates for windows in per_text if len(windows) > 1 for w in windows]
+    vectors = np.zeros((0, settings.embedding_dim), dtype=np.float32)
+    if to_score:
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(get_thread_pool(), encode_array, to_score)
+
+    results = []
+    offset = 0
+    for (_, query_embedding, _), per_text in zip(searches, candidates):
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        snippets = []
+        for windows in per_text:
+            if len(windows) <= 1:
+                snippets.append(windows[0] if windows else "")
+                continue
+            scores = vectors[offset : offset + len(windows)] @ query_vector
+            snippets.append(windows[int(np.argmax(scores))])
+            offset += len(windows)
+        results.append(snippets)
+    return results
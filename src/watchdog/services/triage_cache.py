@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import structlog
+
+from watchdog.config import settings
+from watchdog.utils.hashing import sha256_bytes
+
+log = structlog.get_logger()
+
+_cache: "TriageCache | None" = None
+
+
+class TriageCache:
+    """Persistent triage response cache in a local SQLite file.
+
+    Keys are a hash of the exact chunk text sent, the triage prompt version
+    and the model, and values are Claude's raw response. The file lives
+    outside the main database, so restoring the database or resetting
+    document statuses does not lose it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS triage_results ("
+                " key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, model TEXT NOT NULL,"
+                " response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_triage_results_prompt_version ON triage_results (prompt_version)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(text: str, prompt_version: str, model: str) -> str:
+        return sha256_bytes(f"{model}\0{prompt_version}\0{text}".encode())
+
+    def get(self, text: str, prompt_version: str, model: str) -> str | None:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT response FROM triage_results WHERE key = ?", (self.key(text, prompt_version, model),)
+            ).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, text: str, prompt_version: str, model: str, response: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO triage_results (key, prompt_version, model, response, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.key(text, prompt_version, model), prompt_version, model, response, time.time()),
+            )
+            conn.commit()
+
+    def invalidate(self, prompt_version: str | None = None) -> int:
+        """Delete cached responses for one prompt version, or all of them; returns the count."""
+        with self._lock:
+            conn = self._connect()
+            if prompt_version is None:
+                deleted = conn.execute("DELETE FROM triage_results").rowcount
+            else:
+                deleted = conn.execute(
+                    "DELETE FROM triage_results WHERE prompt_version = ?", (prompt_version,)
+                ).rowcount
+            conn.commit()
+        log.info("triage_cache_invalidated", prompt_version=prompt_version, deleted=deleted)
+        return deleted
+
+    def versions(self) -> dict[str, int]:
+        """Cached response counts per prompt version."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT prompt_version, count(*) FROM triage_results GROUP BY prompt_version"
+            ).fetchall()
+        return dict(rows)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def get_triage_cache() -> TriageCache | None:
+    """Process-wide triage cache, or None when disabled."""
+    global _cache
+    if not settings.triage_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = TriageCache(settings.triage_cache_path)
+    return _cache
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import structlog
+from sqlalchemy import func, select
+
+from watchdog.config import settings
+from watchdog.database import async_session_factory
+from watchdog.models.document import Chunk
+
+log = structlog.get_logger()
+
+VECTORS_FILENAME = "chunk_vectors.npy"
+IDS_FILENAME = "chunk_ids.npy"
+# Names the version directory readers should map; replaced in one rename per build
+CURRENT_FILENAME = "CURRENT"
+
+# Rows scored per matrix product; bounds the float32 working copy of a float16 index
+_SCAN_BLOCK = 65_536
+
+_index: "VectorIndex | None" = None
+_index_lock = threading.Lock()
+
+
+def top_k(vectors: np.ndarray, query: np.ndarray, k: int, mask: np.ndarray | None = None):
+    """Indices and cosine distances of the k rows nearest to query, nearest first.
+
+    Rows are assumed L2-normalized, so distance is 1 - dot product. Rows where
+    mask is False are never returned.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    best_idx = np.zeros(0, dtype=np.int64)
+    best_scores = np.zeros(0, dtype=np.float32)
+
+    for start in range(0, len(vectors), _SCAN_BLOCK):
+        block = np.asarray(vectors[start : start + _SCAN_BLOCK], dtype=np.float32)
+        scores = block @ query
+        if mask is not None:
+            scores[~mask[start : start + _SCAN_BLOCK]] = -np.inf
+        if len(scores) > k:
+            part = np.argpartition(-scores, k)[:k]
+        else:
+            part = np.arange(len(scores))
+        best_idx = np.concatenate([best_idx, part + start])
+        best_scores = np.concatenate([best_scores, scores[part]])
+        if len(best_scores) > k:
+            keep = np.argpartition(-best_scores, k)[:k]
+            best_idx, best_scores = best_idx[keep], best_scores[keep]
+
+    valid = np.isfinite(best_scores)
+    best_idx, best_scores = best_idx[valid], best_scores[valid]
+    order = np.argsort(-best_scores, kind="stable")
+    return best_idx[order], 1.0 - best_scores[order]
+
+
+class IndexVersion:
+    """One published version of the index: chunk ids and their memory-mapped vectors."""
+
+    def __init__(self, version: str, ids: np.ndarray, vectors: np.ndarray):
+        if len(ids) != len(vectors):
+            raise ValueError(f"Vector index {version}: {len(ids)} ids for {len(vectors)} vectors")
+        self.version = version
+        self.ids = ids
+        self.vectors = vectors
+        self.row_of = {chunk_id: i for i, chunk_id in enumerate(ids.tolist())}
+
+    @classmethod
+    def open(cls, version_dir: Path) -> "IndexVersion":
+        return cls(
+            version_dir.name,
+            np.load(version_dir / IDS_FILENAME),
+            np.load(version_dir / VECTORS_FILENAME, mmap_mode="r"),
+        )
+
+
+class VectorIndex:
+    """Exact top-k search over a memory-mapped matrix of chunk embeddings.
+
+    Used by the embedded SQLite backend in place of pgvector. The matrix is
+    contiguous float16 or float32 on disk and paged in by the OS, so the
+    process only holds the blocks being scored. Each build writes its ids and
+    vectors into a new version directory and then swaps the CURRENT pointer,
+    so a reader always maps one build's ids and vectors together.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._current: IndexVersion | None = None
+
+    @property
+    def current_path(self) -> Path:
+        return self.directory / CURRENT_FILENAME
+
+    @property
+    def ids(self) -> np.ndarray | None:
+        return self._current.ids if self._current else None
+
+    @property
+    def vectors(self) -> np.ndarray | None:
+        return self._current.vectors if self._current else None
+
+    def load(self) -> "IndexVersion | None":
+        """Map the current build, re-mapping after a rebuild; None if none exists yet.
+
+        Callers use the returned version rather than re-reading attributes,
+        which a concurrent reload may have moved on to the next build.
+        """
+        try:
+            version = self.current_path.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        current = self._current
+        if current is None or current.version != version:
+            current = IndexVersion.open(self.directory / version)
+            self._current = current
+        return current
+
+    def builder(self, rows: int, dtype: str = settings.vector_index_dtype) -> "IndexBuilder":
+        return IndexBuilder(self.directory, rows, dtype)
+
+    def write(self, ids: list[str], vectors: np.ndarray, dtype: str = settings.vector_index_dtype) -> None:
+        """Publish ids and their vectors as the current build."""
+        builder = self.builder(len(ids), dtype)
+        builder.append(ids, vectors)
+        builder.publish()
+
+    def search(
+        self, query_embedding: list[float], k: int, allowed_ids: set[str] | None = None
+    ) -> list[tuple[str, float]]:
+        """(chunk_id, cosine distance) of the k nearest chunks, optionally restricted to allowed_ids."""
+        current = self.load()
+        if current is None or not len(current.ids):
+            return []
+        mask = None
+        if allowed_ids is not None:
+            mask = np.zeros(len(current.ids), dtype=bool)
+            rows = [current.row_of[i] for i in allowed_ids if i in current.row_of]
+            mask[rows] = True
+        idx, distances = top_k(current.vectors, query_embedding, k, mask)
+        return [(str(current.ids[i]), float(d)) for i, d in zip(idx, distances)]
+
+    def __len__(self) -> int:
+        current = self.load()
+        return len(current.ids) if current else 0
+
+
+class IndexBuilder:
+    """Streams rows into a new version of a VectorIndex; publish() makes it current.
+
+    The vectors go straight into a memory-mapped file of the final size, so
+    a build holds one page of rows in memory however large the corpus is.
+    """
+
+    def __init__(self, directory: Path, rows: int, dtype: str = settings.vector_index_dtype):
+        self.directory = directory
+        self.version = f"v{time.time_ns()}"
+        self.version_dir = directory / self.version
+        self.version_dir.mkdir(parents=True)
+        self.rows = rows
+        self.ids: list[str] = []
+        self.vectors = np.lib.format.open_memmap(
+            self.version_dir / VECTORS_FILENAME,
+            mode="w+",
+            dtype=np.dtype(dtype),
+            shape=(rows, settings.embedding_dim),
+        )
+
+    def append(self, ids: list[str], vectors: np.ndarray) -> None:
+        start = len(self.ids)
+        if start + len(ids) > self.rows:
+            raise ValueError(f"Vector index build expected {self.rows} rows, got more")
+        self.vectors[start : start + len(ids)] = vectors
+        self.ids.extend(ids)
+
+    def publish(self) -> None:
+        """Swap the CURRENT pointer to this build, then drop all but it and the one before."""
+        if len(self.ids) != self.rows:
+            raise ValueError(f"Vector index build expected {self.rows} rows, got {len(self.ids)}")
+        self.vectors.flush()
+        del self.vectors
+        np.save(self.version_dir / IDS_FILENAME, np.asarray(self.ids, dtype="<U36"))
+
+        current = self.directory / CURRENT_FILENAME
+        previous = current.read_text(encoding="utf-8").strip() if current.exists() else None
+        tmp = current.with_suffix(".tmp")
+        tmp.write_text(self.version, encoding="utf-8")
+        os.replace(tmp, current)
+
+        # The previous build stays for readers that read the pointer just before the swap
+        for path in self.directory.glob("v*"):
+            if path.is_dir() and path.name not in (self.version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def get_vector_index() -> VectorIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex(settings.vector_index_dir)
+        return _index
+
+
+async def run_vector_index_build(batch_size: int = settings.embedding_page_size) -> int:
+    """Rebuild the memory-mapped chunk index from the embeddings stored in SQLite.
+
+    Pages are copied into the new index file as they are read, inside one
+    read transaction so the row count and the pages agree.
+    """
+    embedded = Chunk.embedding.isnot(None)
+    last_id = ""
+    async with async_session_factory() as session, session.begin():
+        count = (
+            await session.execute(select(func.count()).select_from(Chunk).where(embedded))
+        ).scalar_one()
+        builder = await asyncio.to_thread(get_vector_index().builder, count)
+        while True:
+            result = await session.execute(
+                select(Chunk.id, Chunk.embedding)
+                .where(embedded, Chunk.id > last_id)
+                .order_by(Chunk.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            builder.append([r.id for r in rows], np.stack([r.embedding for r in rows]))
+            last_id = rows[-1].id
+
+    await asyncio.to_thread(builder.publish)
+    log.info("vector_index_built", chunks=count, dtype=settings.vector_index_dtype)
+    return count
@@ -22,3 +22,16 @@ async def db_session():
     from unittest.mock import AsyncMock
     session = AsyncMock(spec=AsyncSession)
     yield session
+
+
+@pytest_asyncio.fixture
+async def sqlite_session_factory(tmp_path):
+    """Session factory over a throwaway database on the embedded SQLite backend."""
+    pytest.importorskip("aiosqlite")
+    from watchdog.database import create_engine
+
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
@@ -1,7 +1,10 @@
+from types import SimpleNamespace
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
 from watchdog.api.app import create_app
+from watchdog.api.routes import documents
 
 
 @pytest.fixture
@@ -38,8 +41,50 @@ class TestDocumentEndpoints:
         assert response.status_code == 404
 
 
+class TestSimilarDocuments:
+    @pytest.mark.asyncio
+    async def test_ef_search_covers_limit_and_self(self, monkeypatch):
+        calls = []
+
+        async def fake_apply_ann_settings(session, ef_search=None, probes=None, min_candidates=0, filtered=False):
+            calls.append(min_candidates)
+
+        class FakeSession:
+            async def execute(self, statement):
+                calls.append("query")
+                row = SimpleNamespace(id="d0", embedding=[0.1] * 384)
+                return SimpleNamespace(one_or_none=lambda: row, all=list)
+
+        monkeypatch.setattr(documents, "is_sqlite", lambda: False)
+        monkeypatch.setattr(documents, "apply_ann_settings", fake_apply_ann_settings)
+
+        response = await documents.similar_documents("d0", FakeSession(), limit=50)
+
+        assert response == {"document_id": "d0", "similar": []}
+        # Set before the ANN lookup, in the same session
+        assert calls == ["query", 51, "query"]
+
+
 class TestSearchEndpoint:
     @pytest.mark.asyncio
     async def test_search_requires_query(self, client):
         response = await client.post("/api/v1/search", json={})
         assert response.status_code == 422  # Validation error
+
+    @pytest.mark.asyncio
+    async def test_search_rejects_unknown_mode(self, client):
+        response = await client.post("/api/v1/search", json={"query": "maxwell", "mode": "fuzzy"})
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_search_rejects_unknown_severity_filter(self, client):
+        response = await client.post(
+            "/api/v1/search",
+            json={"query": "maxwell", "filters": {"anomaly_severity": ["urgent"]}},
+        )
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_batch_search_requires_queries(self, client):
+        response = await client.post("/api/v1/search/batch", json={"queries": []})
+        assert response.status_code == 422
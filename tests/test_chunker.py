@@ -1,6 +1,12 @@
 import pytest
 
-from watchdog.pipeline.chunker import chunk_text, count_tokens, split_into_paragraphs
+from watchdog.pipeline.chunker import (
+    chunk_text,
+    chunker_fingerprint,
+    count_tokens,
+    match_chunks,
+    split_into_paragraphs,
+)
 
 
 class TestCountTokens:
@@ -71,3 +77,43 @@ class TestChunkText:
             words_1 = set(chunks[1]["text"].split()[:20])
             # At least some overlap expected
             assert len(words_0 & words_1) >= 0  # Non-strict: overlap is best-effort
+
+
+class TestChunkerFingerprint:
+    def test_deterministic(self):
+        assert chunker_fingerprint(3000, 200) == chunker_fingerprint(3000, 200)
+
+    def test_changes_with_settings(self):
+        assert chunker_fingerprint(3000, 200) != chunker_fingerprint(2000, 200)
+        assert chunker_fingerprint(3000, 200) != chunker_fingerprint(3000, 100)
+
+
+class TestMatchChunks:
+    def _row(self, text, page_start=1, page_end=1, **extra):
+        return {"text": text, "page_start": page_start, "page_end": page_end, **extra}
+
+    def test_unchanged_chunks_kept(self):
+        existing = [self._row("a", id="c1"), self._row("b", id="c2")]
+        new_rows = [self._row("a"), self._row("b")]
+        kept, removed = match_chunks(existing, new_rows)
+        assert kept == {0: "c1", 1: "c2"}
+        assert removed == []
+
+    def test_changed_text_replaced(self):
+        existing = [self._row("a", id="c1"), self._row("b", id="c2")]
+        new_rows = [self._row("a"), self._row("b plus more")]
+        kept, removed = match_chunks(existing, new_rows)
+        assert kept == {0: "c1"}
+        assert removed == ["c2"]
+
+    def test_changed_span_replaced(self):
+        existing = [self._row("a", 1, 1, id="c1")]
+        kept, removed = match_chunks(existing, [self._row("a", 1, 2)])
+        assert kept == {}
+        assert removed == ["c1"]
+
+    def test_duplicate_text_matched_once(self):
+        existing = [self._row("a", id="c1")]
+        kept, removed = match_chunks(existing, [self._row("a"), self._row("a")])
+        assert kept == {0: "c1"}
+        assert removed == []
@@ -1,3 +1,5 @@
+import pytest
+
 from watchdog.services.cost_tracker import calculate_cost
 
 
@@ -21,3 +23,20 @@ class TestCostCalculation:
     def test_unknown_model_uses_default(self):
         cost = calculate_cost("unknown-model", input_tokens=1000, output_tokens=1000)
         assert cost > 0
+
+    def test_batch_discount(self):
+        standard = calculate_cost("claude-sonnet-4-5-20250929", input_tokens=10_000, output_tokens=1000)
+        batch = calculate_cost("claude-sonnet-4-5-20250929", input_tokens=10_000, output_tokens=1000, batch=True)
+        assert batch == pytest.approx(standard / 2)
+
+    def test_cache_tokens(self):
+        uncached = calculate_cost("claude-sonnet-4-5-20250929", input_tokens=1100, output_tokens=200)
+        write = calculate_cost(
+            "claude-sonnet-4-5-20250929", input_tokens=100, output_tokens=200, cache_write_tokens=1000
+        )
+        read = calculate_cost(
+            "claude-sonnet-4-5-20250929", input_tokens=100, output_tokens=200, cache_read_tokens=1000
+        )
+        # Writing the cache costs 25% more than plain input; reading it costs 10%
+        assert write == pytest.approx(uncached + 1000 / 1_000_000 * 3.0 * 0.25)
+        assert read == pytest.approx(uncached - 1000 / 1_000_000 * 3.0 * 0.9)
@@ -0,0 +1,199 @@
+from typing import ClassVar
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from watchdog.config import settings
+from watchdog.models.document import Chunk, Document
+from watchdog.services import embedding, embedding_pool
+from watchdog.services.embedding import QueryEmbeddingCache, document_centroid, plan_batches
+from watchdog.services.embedding_pool import split_shards
+
+
+class TestPlanBatches:
+    def test_every_index_once(self):
+        lengths = [5, 300, 12, 40, 40, 7, 256, 1]
+        batches = plan_batches(lengths, token_budget=512, max_batch_size=4)
+        assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+
+    def test_batches_respect_budget(self):
+        lengths = [10, 200, 30, 30, 200, 10, 10, 60]
+        for batch in plan_batches(lengths, token_budget=400, max_batch_size=64):
+            assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 400
+
+    def test_short_texts_share_larger_batches(self):
+        lengths = [256] * 4 + [16] * 32
+        batches = plan_batches(lengths, token_budget=1024, max_batch_size=64)
+        assert [len(b) for b in batches] == [4, 32]
+
+    def test_max_batch_size(self):
+        batches = plan_batches([1] * 10, token_budget=10_000, max_batch_size=3)
+        assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+    def test_oversized_text_gets_own_batch(self):
+        assert plan_batches([5000, 10], token_budget=100, max_batch_size=8) == [[0], [1]]
+
+    def test_empty(self):
+        assert plan_batches([], token_budget=100, max_batch_size=8) == []
+
+
+class TestSplitShards:
+    def test_balanced_mix_of_lengths(self):
+        lengths = [100, 1, 90, 2, 80, 3, 70, 4]
+        shards = split_shards(lengths, workers=2, min_shard_size=1)
+        assert len(shards) == 2
+        assert sorted(i for shard in shards for i in shard) == list(range(8))
+        for shard in shards:
+            assert sum(lengths[i] > 50 for i in shard) == 2
+
+    def test_small_input_single_shard(self):
+        assert split_shards([1, 2, 3], workers=4, min_shard_size=32) == [[2, 1, 0]]
+
+    def test_empty(self):
+        assert split_shards([], workers=4, min_shard_size=1) == []
+
+
+class TestDocumentCentroid:
+    def test_unit_length(self):
+        vectors = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        centroid = document_centroid(vectors, [10, 30])
+        assert abs(np.linalg.norm(centroid) - 1.0) < 1e-6
+
+    def test_weighted_by_tokens(self):
+        vectors = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        centroid = document_centroid(vectors, [10, 30])
+        assert centroid[1] > centroid[0]
+
+    def test_single_chunk_is_itself(self):
+        vectors = np.array([[0.6, 0.8]], dtype=np.float32)
+        np.testing.assert_allclose(document_centroid(vectors, [100]), vectors[0], rtol=1e-6)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestQueryEmbeddingCache:
+    def test_hit_after_put(self):
+        cache = QueryEmbeddingCache(max_size=10, ttl_seconds=60)
+        assert cache.get("maxwell") is None
+        cache.put("maxwell", [0.1, 0.2])
+        assert cache.get("maxwell") == [0.1, 0.2]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_whitespace_insensitive(self):
+        cache = QueryEmbeddingCache(max_size=10, ttl_seconds=60)
+        cache.put("flight  logs ", [1.0])
+        assert cache.get("flight logs") == [1.0]
+
+    def test_evicts_least_recently_used(self):
+        cache = QueryEmbeddingCache(max_size=2, ttl_seconds=60)
+        cache.put("a", [1.0])
+        cache.put("b", [2.0])
+        cache.get("a")
+        cache.put("c", [3.0])
+        assert cache.get("b") is None
+        assert cache.get("a") == [1.0]
+        assert cache.stats()["size"] == 2
+
+    def test_expires_after_ttl(self):
+        clock = FakeClock()
+        cache = QueryEmbeddingCache(max_size=10, ttl_seconds=60, clock=clock)
+        cache.put("a", [1.0])
+        clock.now = 61.0
+        assert cache.get("a") is None
+        assert cache.stats()["size"] == 0
+
+
+class TestEmbedQueries:
+    @pytest.mark.asyncio
+    async def test_misses_encoded_in_one_call(self, monkeypatch):
+        calls = []
+
+        async def fake_aembed(texts):
+            calls.append(list(texts))
+            return [[float(len(t))] for t in texts]
+
+        monkeypatch.setattr(embedding, "aembed_texts", fake_aembed)
+        monkeypatch.setattr(embedding, "query_cache", QueryEmbeddingCache(max_size=10, ttl_seconds=60))
+        embedding.query_cache.put("cached", [-1.0])
+
+        vectors = await embedding.embed_queries(["ab", "cached", "abc", "ab"])
+
+        assert vectors == [[2.0], [-1.0], [3.0], [2.0]]
+        assert calls == [["ab", "abc"]]
+
+
+class FakeEncoderPool:
+    """Stands in for EncoderPool; the call numbered fail_on raises."""
+
+    calls: ClassVar[list[list[str]]] = []
+    fail_on: ClassVar[int | None] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def embed(self, texts, lengths=None):
+        FakeEncoderPool.calls.append(list(texts))
+        if len(FakeEncoderPool.calls) == FakeEncoderPool.fail_on:
+            raise RuntimeError("encoder crashed")
+        return np.ones((len(texts), settings.embedding_dim), dtype=np.float32)
+
+    def cache_stats(self):
+        return {}
+
+
+class TestRunEmbeddings:
+    @pytest.fixture
+    async def seeded(self, sqlite_session_factory, monkeypatch):
+        monkeypatch.setattr(embedding, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(embedding, "is_sqlite", lambda: False)
+        monkeypatch.setattr(embedding_pool, "EncoderPool", FakeEncoderPool)
+        monkeypatch.setattr(FakeEncoderPool, "calls", [])
+        monkeypatch.setattr(FakeEncoderPool, "fail_on", None)
+        async with sqlite_session_factory() as session:
+            session.add(Document(id="d", source_type="doj", filename="d.pdf", sha256="h"))
+            for i in range(10):
+                # c00 is already embedded and must not be fetched again
+                embedded = np.zeros(settings.embedding_dim, dtype=np.float32) if i == 0 else None
+                session.add(
+                    Chunk(id=f"c{i:02}", document_id="d", chunk_index=i, text=f"t{i}", token_count=1, embedding=embedded)
+                )
+            await session.commit()
+        return sqlite_session_factory
+
+    @staticmethod
+    async def pending(factory) -> list[str]:
+        async with factory() as session:
+            return (
+                await session.execute(select(Chunk.id).where(Chunk.embedding.is_(None)).order_by(Chunk.id))
+            ).scalars().all()
+
+    @pytest.mark.asyncio
+    async def test_pages_by_keyset(self, seeded):
+        assert await embedding.run_embeddings(batch_size=4) == 9
+
+        assert FakeEncoderPool.calls == [["t1", "t2", "t3", "t4"], ["t5", "t6", "t7", "t8"], ["t9"]]
+        assert await self.pending(seeded) == []
+
+    @pytest.mark.asyncio
+    async def test_failure_keeps_committed_pages(self, seeded):
+        FakeEncoderPool.fail_on = 2
+        with pytest.raises(RuntimeError):
+            await embedding.run_embeddings(batch_size=4)
+        assert await self.pending(seeded) == ["c05", "c06", "c07", "c08", "c09"]
+
+        # A rerun picks up after the committed page
+        FakeEncoderPool.calls.clear()
+        FakeEncoderPool.fail_on = None
+        assert await embedding.run_embeddings(batch_size=4) == 5
+        assert FakeEncoderPool.calls == [["t5", "t6", "t7", "t8"], ["t9"]]
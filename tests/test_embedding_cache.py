@@ -0,0 +1,77 @@
+import numpy as np
+
+from watchdog.services.embedding_cache import EmbeddingCache, normalize_text
+
+
+class FakeEncoder:
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls: list[list[str]] = []
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        return np.array([[float(len(t))] * self.dim for t in texts], dtype=np.float32)
+
+
+def make_cache(tmp_path, model_id="model-a", max_entries=100):
+    return EmbeddingCache(tmp_path / "cache.sqlite3", model_id=model_id, max_entries=max_entries, dim=4)
+
+
+class TestNormalizeText:
+    def test_collapses_whitespace(self):
+        assert normalize_text("  flight \n\n log\t") == "flight log"
+
+    def test_preserves_case(self):
+        assert normalize_text("Bates EPS-0001") == "Bates EPS-0001"
+
+
+class TestEmbeddingCache:
+    def test_miss_then_hit(self, tmp_path):
+        cache = make_cache(tmp_path)
+        encode = FakeEncoder()
+        first = cache.embed(["alpha", "beta"], encode)
+        second = cache.embed(["beta", "alpha"], encode)
+        assert encode.calls == [["alpha", "beta"]]
+        np.testing.assert_array_equal(first[::-1], second)
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 2
+
+    def test_only_misses_encoded(self, tmp_path):
+        cache = make_cache(tmp_path)
+        encode = FakeEncoder()
+        cache.embed(["alpha"], encode)
+        cache.embed(["alpha", "gamma", "gamma"], encode)
+        assert encode.calls == [["alpha"], ["gamma"]]
+
+    def test_normalized_text_shares_entry(self, tmp_path):
+        cache = make_cache(tmp_path)
+        encode = FakeEncoder()
+        cache.embed(["flight log"], encode)
+        cache.embed(["flight   log\n"], encode)
+        assert len(encode.calls) == 1
+
+    def test_models_do_not_mix(self, tmp_path):
+        encode = FakeEncoder()
+        make_cache(tmp_path, model_id="model-a").embed(["alpha"], encode)
+        make_cache(tmp_path, model_id="model-b").embed(["alpha"], encode)
+        assert len(encode.calls) == 2
+
+    def test_persists_across_instances(self, tmp_path):
+        encode = FakeEncoder()
+        make_cache(tmp_path).embed(["alpha"], encode)
+        make_cache(tmp_path).embed(["alpha"], encode)
+        assert len(encode.calls) == 1
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = make_cache(tmp_path, max_entries=10)
+        encode = FakeEncoder()
+        cache.embed([f"text {i}" for i in range(10)], encode)
+        cache.embed(["text 0"], encode)  # refresh so it survives eviction
+        cache.embed(["new text"], encode)
+        assert cache.stats()["size"] <= 10
+        encode.calls.clear()
+        cache.embed(["text 0"], encode)
+        assert encode.calls == []
+
+    def test_empty_input(self, tmp_path):
+        assert make_cache(tmp_path).embed([], FakeEncoder()).shape == (0, 4)
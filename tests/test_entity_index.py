@@ -0,0 +1,46 @@
+from watchdog.services.entity_index import EntityPrefixIndex, name_tokens
+
+
+def build(*rows):
+    index = EntityPrefixIndex()
+    index.upsert(rows)
+    return index
+
+
+class TestNameTokens:
+    def test_case_and_accent_folding(self):
+        assert name_tokens("Jean-Luc BRUNEL") == ["jean", "luc", "brunel"]
+        assert name_tokens("Zoë Ångström") == ["zoe", "angstrom"]
+
+
+class TestEntityPrefixIndex:
+    def test_matches_any_word_prefix(self):
+        index = build(("1", "Ghislaine Maxwell", "person", 10), ("2", "Max Planck Institute", "organization", 1))
+        assert [r["id"] for r in index.search("max")] == ["2", "1"]  # leading word first
+        assert [r["id"] for r in index.search("maxw")] == ["1"]
+
+    def test_all_query_words_must_match(self):
+        index = build(("1", "Ghislaine Maxwell", "person", 10), ("2", "Robert Maxwell", "person", 5))
+        assert [r["id"] for r in index.search("max gh")] == ["1"]
+
+    def test_exact_and_leading_matches_rank_first(self):
+        index = build(
+            ("1", "Palm Beach Police", "organization", 50),
+            ("2", "Palm Beach", "location", 3),
+            ("3", "West Palm Beach", "location", 90),
+        )
+        assert [r["id"] for r in index.search("palm beach")] == ["2", "1", "3"]
+
+    def test_filters_by_type(self):
+        index = build(("1", "Maxwell", "person", 1), ("2", "Maxwell Corp", "organization", 1))
+        assert [r["id"] for r in index.search("maxwell", entity_type="organization")] == ["2"]
+
+    def test_incremental_rename(self):
+        index = build(*[(str(i), f"Entity {i}", "person", i) for i in range(50)])
+        index.upsert([("7", "Renamed Person", "person", 7)])
+        assert index.search("renamed")[0]["id"] == "7"
+        assert "7" not in {r["id"] for r in index.search("entity", limit=100)}
+        assert len(index.search("entity", limit=100)) == 49
+
+    def test_empty_query(self):
+        assert build(("1", "Someone", "person", 1)).search("  -- ") == []
@@ -0,0 +1,107 @@
+from collections import Counter
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql
+
+from watchdog.models.document import Chunk, Document, Entity, EntityMention, EntityRelationship
+from watchdog.pipeline.entity_resolver import EntityResolver, entity_upsert
+from watchdog.pipeline.triage import apply_triage_result
+
+RESULT = {
+    "priority_score": 0.4,
+    "entities": [
+        {"name": "jane roe", "type": "person", "context": "met with"},
+        {"name": "Jane Roe ", "type": "person", "context": "again"},
+        {"name": "Acme Corp", "type": "organization"},
+    ],
+    "relationships": [{"source": "jane roe", "target": "acme corp", "type": "employed_by"}],
+}
+
+
+def count_statements(factory) -> list[str]:
+    statements: list[str] = []
+    event.listen(
+        factory.kw["bind"].sync_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement.split()[0]),
+    )
+    return statements
+
+
+async def seed(factory) -> None:
+    async with factory() as session:
+        session.add(Document(id="d0", source_type="doj", filename="0.pdf", sha256="h0", status="chunked"))
+        for c in range(2):
+            session.add(Chunk(id=f"c{c}", document_id="d0", chunk_index=c, text="x", token_count=1))
+        await session.commit()
+
+
+class TestEntityResolver:
+    @pytest.mark.asyncio
+    async def test_bulk_upsert_counts_mentions(self, sqlite_session_factory):
+        await seed(sqlite_session_factory)
+        statements = count_statements(sqlite_session_factory)
+        resolver = EntityResolver()
+
+        async with sqlite_session_factory() as session:
+            await apply_triage_result(session, "c0", "d0", RESULT, resolver)
+            await session.commit()
+        # chunk priority, entity upsert, mentions, relationships
+        assert statements.count("INSERT") == 3
+        assert statements.count("SELECT") == 0
+
+        statements.clear()
+        async with sqlite_session_factory() as session:
+            await apply_triage_result(session, "c1", "d0", RESULT, resolver)
+            await session.commit()
+        # Entities seen earlier in the run are incremented by id in one UPDATE
+        assert statements.count("UPDATE") == 2
+        assert statements.count("INSERT") == 2
+
+        async with sqlite_session_factory() as session:
+            counts = {
+                (e.name, e.entity_type): e.mention_count
+                for e in (await session.execute(select(Entity))).scalars()
+            }
+            assert counts == {
+                ("Jane Roe", "person"): 4,
+                ("Acme Corp", "organization"): 2,
+                ("Jane Roe", "unknown"): 2,
+                ("Acme Corp", "unknown"): 2,
+            }
+            assert len((await session.execute(select(EntityMention))).scalars().all()) == 6
+            assert len((await session.execute(select(EntityRelationship))).scalars().all()) == 2
+
+    @pytest.mark.asyncio
+    async def test_separate_runs_converge_on_one_row(self, sqlite_session_factory):
+        key = ("Jane Roe", "person")
+        async with sqlite_session_factory() as session:
+            first, _ = await EntityResolver().resolve(session, Counter({key: 2}), {key: "first"})
+            second, _ = await EntityResolver().resolve(session, Counter({key: 3}), {key: "second"})
+            await session.commit()
+            entity = (await session.execute(select(Entity))).scalar_one()
+        assert first[key] == second[key] == entity.id
+        assert (entity.mention_count, entity.description) == (5, "first")
+
+    @pytest.mark.asyncio
+    async def test_forgets_ids_rolled_back(self, sqlite_session_factory):
+        key = ("Jane Roe", "person")
+        resolver = EntityResolver()
+        async with sqlite_session_factory() as session:
+            async with session.begin_nested() as savepoint:
+                _, learned = await resolver.resolve(session, Counter({key: 1}))
+                await savepoint.rollback()
+            resolver.forget(learned)
+            assert len(resolver) == 0
+
+            ids, _ = await resolver.resolve(session, Counter({key: 1}))
+            await session.commit()
+            assert (await session.get(Entity, ids[key])).mention_count == 1
+
+    def test_postgres_upsert_sql(self):
+        rows = [{"name": "Jane Roe", "entity_type": "person", "description": None, "mention_count": 2}]
+        sql = str(entity_upsert(postgresql.insert, rows).compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (name, entity_type) DO UPDATE SET" in sql
+        assert "mention_count = (entities.mention_count + excluded.mention_count)" in sql
+        assert sql.endswith("RETURNING entities.id, entities.name, entities.entity_type")
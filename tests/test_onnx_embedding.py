@@ -0,0 +1,68 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from watchdog.config import settings
+from watchdog.services import embedding, onnx_embedding
+
+
+def reference_vectors(texts: list[str]) -> np.ndarray:
+    vectors = np.stack([np.random.default_rng(len(t)).standard_normal(8) for t in texts])
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name, device=None):
+        self.model_name = model_name
+
+    def encode(self, texts, **_):
+        return reference_vectors(texts)
+
+
+class FakeOnnxEncoder:
+    """fp32 reproduces the reference; int8 is degraded by a large perturbation."""
+
+    def __init__(self, model_dir, quantized=False, threads=None):
+        self.quantized = quantized
+
+    def encode(self, texts, **_):
+        vectors = reference_vectors(texts)
+        if self.quantized:
+            vectors = vectors + 0.5 * np.random.default_rng(0).standard_normal(vectors.shape)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32)
+
+
+@pytest.fixture
+def fake_backends(monkeypatch):
+    fake_module = types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake_module)
+    monkeypatch.setattr(onnx_embedding, "OnnxEncoder", FakeOnnxEncoder)
+
+
+class TestCheckParity:
+    def test_rejects_degraded_encoder(self, fake_backends, tmp_path):
+        report = onnx_embedding.check_parity("test-model", tmp_path)
+
+        assert report["fp32"]["passed"]
+        assert report["fp32"]["min_cosine"] == pytest.approx(1.0)
+        assert not report["int8"]["passed"]
+        assert report["int8"]["min_cosine"] < onnx_embedding.PARITY_THRESHOLDS["int8"]
+
+    def test_export_fails_on_parity(self, fake_backends, monkeypatch, tmp_path):
+        monkeypatch.setattr(onnx_embedding, "export_onnx", lambda model_name: tmp_path)
+
+        with pytest.raises(RuntimeError, match="int8"):
+            onnx_embedding.run_onnx_export("test-model")
+
+
+class TestGetModel:
+    def test_unknown_backend(self, monkeypatch):
+        monkeypatch.setattr(embedding, "_model", None)
+        monkeypatch.setattr(settings, "embedding_backend", "tensorflow")
+
+        with pytest.raises(ValueError, match="tensorflow"):
+            embedding.get_model()
+        assert embedding._model is None
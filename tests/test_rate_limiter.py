@@ -0,0 +1,162 @@
+from types import SimpleNamespace
+
+import pytest
+
+from watchdog.services.rate_limiter import MemoryBucketStore, RateLimiter, RedisBucketStore
+
+LIMITS = {"requests": 60, "input-tokens": 6000, "output-tokens": 1200}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def limiter(store, clock):
+    return RateLimiter(store, LIMITS, clock=clock, sleep=clock.sleep)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        return MemoryBucketStore()
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisBucketStore(fakeredis.FakeAsyncRedis())
+
+
+class TestRateLimiter:
+    @pytest.mark.asyncio
+    async def test_waits_when_output_budget_is_spent(self, store):
+        clock = FakeClock()
+        rl = limiter(store, clock)
+        assert await rl.acquire("m", 100, 1000) == 0
+        waited = await rl.acquire("m", 100, 1000)
+        # 800 output tokens short at 1200/minute
+        assert 40 <= waited <= 48
+        assert all(s <= 6 for s in clock.sleeps)
+
+    @pytest.mark.asyncio
+    async def test_settle_refunds_unused_reservation(self, store):
+        clock = FakeClock()
+        rl = limiter(store, clock)
+        await rl.acquire("m", 100, 1000)
+        await rl.settle("m", 100, 1000, 90, 100)
+        assert await rl.acquire("m", 100, 1000) == 0
+
+    @pytest.mark.asyncio
+    async def test_headers_cap_remaining_capacity(self, store):
+        clock = FakeClock()
+        rl = limiter(store, clock)
+        await rl.observe(
+            "m",
+            {"anthropic-ratelimit-input-tokens-limit": "6000", "anthropic-ratelimit-input-tokens-remaining": "0"},
+        )
+        waited = await rl.acquire("m", 600, 10)
+        assert 6 <= waited <= 8
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_all_callers(self, store):
+        clock = FakeClock()
+        first, second = limiter(store, clock), limiter(store, clock)
+        await first.observe("m", {"retry-after": "12"})
+        waited = await second.acquire("m", 10, 10)
+        assert 12 <= waited <= 15
+
+    @pytest.mark.asyncio
+    async def test_models_have_separate_buckets(self, store):
+        clock = FakeClock()
+        rl = limiter(store, clock)
+        await rl.acquire("a", 6000, 10)
+        assert await rl.acquire("b", 6000, 10) == 0
+
+
+class FlakyStore:
+    """Delegates to in-memory buckets, or raises like an unreachable Redis while down."""
+
+    def __init__(self):
+        self.down = True
+        self.calls = 0
+        self._store = MemoryBucketStore()
+
+    def __getattr__(self, method):
+        async def call(*args, **kwargs):
+            from redis.exceptions import ConnectionError as RedisConnectionError
+
+            self.calls += 1
+            if self.down:
+                raise RedisConnectionError("Connection refused")
+            return await getattr(self._store, method)(*args, **kwargs)
+
+        return call
+
+
+class TestRedisFallback:
+    @pytest.mark.asyncio
+    async def test_fallback_keeps_worker_share(self):
+        pytest.importorskip("redis")
+        clock = FakeClock()
+        rl = RateLimiter(FlakyStore(), LIMITS, clock=clock, sleep=clock.sleep, fallback_workers=4)
+        assert await rl.acquire("m", 10, 300) == 0
+        # A quarter of 1200 output tokens/minute: the next 300 take about a minute
+        waited = await rl.acquire("m", 10, 300)
+        assert 60 <= waited <= 75
+
+    @pytest.mark.asyncio
+    async def test_redis_retried_after_backoff(self):
+        pytest.importorskip("redis")
+        clock = FakeClock()
+        store = FlakyStore()
+        rl = RateLimiter(store, LIMITS, clock=clock, sleep=clock.sleep, fallback_workers=4)
+        await rl.acquire("m", 10, 10)
+        assert store.calls == 1
+
+        clock.now += 1
+        await rl.acquire("m", 10, 10)
+        assert store.calls == 1
+
+        store.down = False
+        clock.now += 5
+        await rl.acquire("m", 10, 10)
+        assert store.calls == 2
+        await rl.acquire("m", 10, 10)
+        assert store.calls == 3
+
+
+class TestCallClaude:
+    @pytest.mark.asyncio
+    async def test_failed_call_returns_reservation(self, monkeypatch):
+        import anthropic
+        import httpx
+
+        from watchdog.services import claude_client
+
+        clock = FakeClock()
+        rl = limiter(MemoryBucketStore(), clock)
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+        class FailingMessages:
+            async def create(self, **_):
+                response = httpx.Response(429, headers={"retry-after": "3"}, request=request)
+                raise anthropic.RateLimitError("rate limited", response=response, body=None)
+
+        fake_client = SimpleNamespace(messages=SimpleNamespace(with_raw_response=FailingMessages()))
+        monkeypatch.setattr(claude_client, "get_client", lambda: fake_client)
+        monkeypatch.setattr(claude_client, "get_rate_limiter", lambda: rl)
+
+        for _ in range(3):
+            with pytest.raises(anthropic.RateLimitError):
+                # Unwrapped: one attempt, without the retry decorator's sleeps
+                await claude_client.call_claude.__wrapped__("x" * 400, "triage", max_tokens=1000)
+
+        # Every reservation came back; only the last retry-after pause delays the next call
+        waited = await rl.acquire(claude_client.settings.claude_model, 100, 1000)
+        assert 3 <= waited <= 4
@@ -0,0 +1,308 @@
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from watchdog.config import settings
+from watchdog.models.document import Chunk, Document, Entity, EntityMention
+from watchdog.services import search, snippets
+from watchdog.services.search import (
+    apply_ann_settings,
+    coarse_distance,
+    filter_conditions,
+    hybrid_query,
+    nearest_chunks_query,
+    vector_index_rows,
+)
+from watchdog.services.vector_index import VectorIndex
+
+QUERY = [0.1] * 384
+
+# The expressions of the compact indexes in migration 004
+INDEX_ORDER = {
+    "halfvec": "CAST(chunks.embedding AS HALFVEC(384)) <=> CAST(%(param_1)s AS HALFVEC(384))",
+    "binary": (
+        "CAST(binary_quantize(chunks.embedding) AS BIT(384)) <~> "
+        "binary_quantize(CAST(%(param_1)s AS VECTOR(384)))"
+    ),
+}
+
+
+def compile_pg(statement):
+    compiled = statement.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def limits(sql, params):
+    """Bound LIMIT values in the order they appear in sql."""
+    return [params[name] for name in re.findall(r"LIMIT %\((\w+)\)s", sql)]
+
+
+class TestNearestChunksQuery:
+    @pytest.mark.parametrize("mode", ["halfvec", "binary"])
+    def test_compact_modes_rerank_candidates(self, monkeypatch, mode):
+        monkeypatch.setattr(settings, "vector_rerank_factor", 7)
+
+        sql, params = compile_pg(nearest_chunks_query(QUERY, 5, mode, Chunk.id))
+        candidates, rerank = sql.split(") AS anon_1")
+
+        # The compact index orders the candidate subquery...
+        assert f"ORDER BY {INDEX_ORDER[mode]}" in candidates
+        assert candidates.rstrip().endswith("LIMIT %(param_2)s::INTEGER")
+        assert params["param_2"] == 5 * 7
+        # ...and only those candidates are reordered by exact cosine distance
+        assert sql.startswith("SELECT chunks.id, chunks.embedding <=> %(embedding_1)s AS distance")
+        assert "ON chunks.id = anon_1.id ORDER BY distance" in rerank
+        assert rerank.rstrip().endswith("LIMIT %(param_3)s::INTEGER")
+        assert params["param_3"] == 5
+
+    def test_filters_apply_to_candidates(self):
+        query = nearest_chunks_query(QUERY, 5, "binary", Chunk.id, filters={"status": ["triaged"]})
+        sql, _ = compile_pg(query)
+        candidates, rerank = sql.split(") AS anon_1")
+        assert "documents.status IN" in candidates
+        assert "documents" not in rerank
+
+    def test_exact_unfiltered_has_no_rerank(self):
+        sql, params = compile_pg(nearest_chunks_query(QUERY, 5, "exact", Chunk.id))
+        assert "JOIN" not in sql
+        assert sql.endswith("ORDER BY distance \n LIMIT %(param_1)s::INTEGER")
+        assert params["param_1"] == 5
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            nearest_chunks_query(QUERY, 5, "pq")
+        with pytest.raises(ValueError):
+            coarse_distance("exact", QUERY)
+
+
+class TestFilterConditions:
+    @pytest.mark.parametrize(
+        ("filters", "semi_join", "params"),
+        [
+            (
+                {"status": ["triaged"]},
+                (
+                    "chunks.document_id IN (SELECT documents.id FROM documents "
+                    "WHERE documents.status IN (__[POSTCOMPILE_status_1]))"
+                ),
+                {"status_1": ["triaged"]},
+            ),
+            (
+                {"source_type": ["doj"]},
+                (
+                    "chunks.document_id IN (SELECT documents.id FROM documents "
+                    "WHERE documents.source_type IN (__[POSTCOMPILE_source_type_1]))"
+                ),
+                {"source_type_1": ["doj"]},
+            ),
+            (
+                {"min_priority": 0.5, "max_priority": 0.9},
+                (
+                    "chunks.document_id IN (SELECT documents.id FROM documents "
+                    "WHERE documents.priority_score >= %(priority_score_1)s "
+                    "AND documents.priority_score <= %(priority_score_2)s)"
+                ),
+                {"priority_score_1": 0.5, "priority_score_2": 0.9},
+            ),
+            (
+                {"entity_id": "e1"},
+                (
+                    "chunks.id IN (SELECT entity_mentions.chunk_id FROM entity_mentions "
+                    "WHERE entity_mentions.entity_id = %(entity_id_1)s::VARCHAR)"
+                ),
+                {"entity_id_1": "e1"},
+            ),
+            (
+                {"anomaly_severity": ["high"]},
+                (
+                    "chunks.document_id IN (SELECT documents.id FROM documents "
+                    "WHERE documents.id IN (SELECT anomalies.document_id FROM anomalies "
+                    "WHERE anomalies.severity IN (__[POSTCOMPILE_severity_1])))"
+                ),
+                {"severity_1": ["high"]},
+            ),
+        ],
+    )
+    def test_each_filter_is_a_semi_join(self, filters, semi_join, params):
+        (condition,) = filter_conditions(**filters)
+        sql, bound = compile_pg(condition)
+        assert " ".join(sql.split()) == semi_join
+        assert bound == params
+
+    def test_document_filters_share_one_semi_join(self):
+        conditions = filter_conditions(status=["triaged"], source_type=["doj"], min_priority=0.5, entity_id="e1")
+        document_filter, entity_filter = (compile_pg(c)[0] for c in conditions)
+        assert document_filter.count("SELECT documents.id") == 1
+        assert "entity_mentions" in entity_filter
+        assert filter_conditions() == []
+
+
+class TestVectorIndexRows:
+    @pytest.mark.asyncio
+    async def test_filters_mask_the_scan(self, sqlite_session_factory, monkeypatch, tmp_path):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(6, settings.embedding_dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"c{i}" for i in range(6)]
+        index = VectorIndex(tmp_path / "index")
+        index.write(ids, vectors, dtype="float32")
+        monkeypatch.setattr(search, "get_vector_index", lambda: index)
+
+        async with sqlite_session_factory() as session:
+            for d, status in (("d0", "triaged"), ("d1", "chunked")):
+                session.add(Document(id=d, source_type="doj", filename=f"{d}.pdf", sha256=d, status=status))
+            session.add(Entity(id="e1", name="jane roe", entity_type="person"))
+            await session.flush()
+            for i, chunk_id in enumerate(ids):
+                session.add(
+                    Chunk(
+                        id=chunk_id, document_id=f"d{i % 2}", chunk_index=i, text=chunk_id, token_count=1,
+                        embedding=vectors[i],
+                    )
+                )
+            await session.flush()
+            session.add(EntityMention(entity_id="e1", chunk_id="c4"))
+            await session.commit()
+
+        async with sqlite_session_factory() as session:
+            # The query is c1's own vector, but c1 belongs to a chunked document
+            rows = await vector_index_rows(vectors[1].tolist(), session, 10, {"status": ["triaged"]})
+            assert sorted(r.id for r in rows) == ["c0", "c2", "c4"]
+            assert [r.distance for r in rows] == sorted(r.distance for r in rows)
+
+            rows = await vector_index_rows(vectors[1].tolist(), session, 10, {"entity_id": "e1"})
+            assert [r.id for r in rows] == ["c4"]
+
+            rows = await vector_index_rows(vectors[1].tolist(), session, 2)
+            assert rows[0].id == "c1"
+            assert len(rows) == 2
+
+            assert await vector_index_rows(vectors[1].tolist(), session, 10, {"source_type": ["none"]}) == []
+
+
+class RecordingSession:
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+
+
+async def ann_settings(**kwargs) -> dict[str, str]:
+    """The (name, value) pairs apply_ann_settings sends with set_config."""
+    session = RecordingSession()
+    await apply_ann_settings(session, **kwargs)
+    (statement,) = session.statements
+    values = list(compile_pg(statement)[1].values())
+    # set_config(name, value, is_local) binds three parameters per setting
+    assert all(values[i + 2] is True for i in range(0, len(values), 3))
+    return {values[i]: values[i + 1] for i in range(0, len(values), 3)}
+
+
+class TestApplyAnnSettings:
+    @pytest.mark.asyncio
+    async def test_defaults(self, monkeypatch):
+        monkeypatch.setattr(settings, "hnsw_ef_search", 40)
+        monkeypatch.setattr(settings, "ivfflat_probes", 10)
+        assert await ann_settings() == {"hnsw.ef_search": "40", "ivfflat.probes": "10"}
+        assert (await ann_settings(ef_search=64, probes=3))["ivfflat.probes"] == "3"
+
+    @pytest.mark.asyncio
+    async def test_ef_search_covers_candidates_up_to_cap(self, monkeypatch):
+        monkeypatch.setattr(settings, "hnsw_ef_search", 40)
+        assert (await ann_settings(min_candidates=30))["hnsw.ef_search"] == "40"
+        assert (await ann_settings(min_candidates=350))["hnsw.ef_search"] == "350"
+        assert (await ann_settings(ef_search=500, min_candidates=350))["hnsw.ef_search"] == "500"
+        assert (await ann_settings(min_candidates=5000))["hnsw.ef_search"] == "1000"
+
+    @pytest.mark.asyncio
+    async def test_iterative_scan_only_for_filtered_queries(self, monkeypatch):
+        monkeypatch.setattr(settings, "vector_iterative_scan", "strict_order")
+        monkeypatch.setattr(settings, "hnsw_max_scan_tuples", 12345)
+
+        assert "hnsw.iterative_scan" not in await ann_settings()
+        filtered = await ann_settings(filtered=True)
+        assert filtered["hnsw.iterative_scan"] == "strict_order"
+        assert filtered["hnsw.max_scan_tuples"] == "12345"
+        assert filtered["ivfflat.iterative_scan"] == "relaxed_order"
+
+        monkeypatch.setattr(settings, "vector_iterative_scan", "off")
+        assert set(await ann_settings(filtered=True)) == {"hnsw.ef_search", "ivfflat.probes"}
+
+
+class TestHybridQuery:
+    def compile(self, monkeypatch, filters=None):
+        monkeypatch.setattr(settings, "rrf_k", 42)
+        monkeypatch.setattr(settings, "hybrid_candidates", 30)
+        sql, params = compile_pg(hybrid_query("flight log", QUERY, 5, "exact", filters))
+        select_list, rest = sql.split("\nFROM", 1)
+        fused, outer = rest.split(") AS fused")
+        return select_list, fused, outer, params
+
+    def test_fuses_both_branches_by_rrf(self, monkeypatch):
+        _, fused, outer, params = self.compile(monkeypatch)
+
+        # Vector branch by cosine distance, lexical branch by full-text match, each capped
+        vector, lexical = fused.split("FULL OUTER JOIN")
+        assert "chunks.embedding <=> %(embedding_1)s" in vector and "AS vector_hits" in vector
+        assert "chunks.search_vector @@ websearch_to_tsquery" in lexical and "AS lexical_hits" in lexical
+        assert limits(vector, params) == [30]
+        assert limits(lexical, params)[0] == 30
+        assert params["websearch_to_tsquery_2"] == "flight log"
+
+        # Each branch contributes 1 / (rrf_k + rank); the sum orders the fused rows
+        assert (params["rank_1"], params["rank_2"]) == (42, 42)
+        assert "ON vector_ranked.id = lexical_ranked.id ORDER BY coalesce(" in lexical
+        assert re.search(r"DESC \n LIMIT %\(\w+\)s::INTEGER$", lexical.rstrip())
+        assert limits(lexical, params)[-1] == 5
+        assert outer.rstrip().endswith("ORDER BY fused.rrf_score DESC")
+
+    def test_headline_only_for_lexical_hits(self, monkeypatch):
+        select_list, fused, _, _ = self.compile(monkeypatch)
+        assert "CASE WHEN (fused.lexical_rank IS NOT NULL) THEN ts_headline(" in select_list
+        # Not computed while ranking candidates
+        assert "ts_headline" not in fused
+
+    def test_filters_apply_to_both_branches(self, monkeypatch):
+        _, fused, outer, _ = self.compile(monkeypatch, filters={"status": ["triaged"]})
+        vector, lexical = fused.split("FULL OUTER JOIN")
+        assert "documents.status IN" in vector
+        assert "documents.status IN" in lexical
+        assert "documents" not in outer
+
+
+class TestSearchSimilarBatch:
+    @pytest.mark.asyncio
+    async def test_snippets_of_all_queries_in_one_encode(self, monkeypatch, sqlite_session_factory):
+        encoded: list[int] = []
+        text = " ".join(f"Exhibit {i} was entered into the record." for i in range(20))
+
+        def fake_encode(texts):
+            encoded.append(len(texts))
+            return np.ones((len(texts), 2), dtype=np.float32)
+
+        async def fake_embed_queries(queries):
+            return [[1.0, 0.0] for _ in queries]
+
+        async def fake_nearest_rows(query_embedding, session, limit, *args):
+            return [
+                SimpleNamespace(
+                    id=f"c{i}", document_id="d", token_count=1, page_start=None, page_end=None, distance=0.1, text=text
+                )
+                for i in range(limit)
+            ]
+
+        monkeypatch.setattr(snippets, "encode_array", fake_encode)
+        monkeypatch.setattr(search, "embed_queries", fake_embed_queries)
+        monkeypatch.setattr(search, "nearest_rows", fake_nearest_rows)
+        monkeypatch.setattr(search, "async_session_factory", sqlite_session_factory)
+
+        results = await search.search_similar_batch(["a", "b", "c", "a"], limit=2)
+
+        assert list(results) == ["a", "b", "c"]
+        assert all(len(hits) == 2 and hits[0]["snippet"] for hits in results.values())
+        # 3 queries x 2 hits x snippet_max_windows (3) windows, scored together
+        assert encoded == [18]
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from watchdog.services import snippets
+from watchdog.services.snippets import (
+    best_windows,
+    best_windows_batch,
+    preview,
+    sentence_windows,
+    shortlist_windows,
+    split_sentences,
+    truncate,
+)
+
+
+class TestSentenceWindows:
+    def test_split_sentences(self):
+        text = "First one.  Second\nline? Third!\n\nNew paragraph without stop"
+        assert split_sentences(text) == ["First one.", "Second line?", "Third!", "New paragraph without stop"]
+
+    def test_windows_keep_whole_sentences(self):
+        text = "Alpha beta. Gamma delta. Epsilon zeta. Eta theta."
+        assert sentence_windows(text, max_chars=25) == ["Alpha beta. Gamma delta.", "Epsilon zeta. Eta theta."]
+
+    def test_long_sentence_truncated(self):
+        windows = sentence_windows("word " * 100, max_chars=40)
+        assert len(windows) == 1
+        assert len(windows[0]) <= 40
+        assert windows[0].endswith("…")
+
+    def test_empty(self):
+        assert sentence_windows("   ") == []
+
+
+class TestTruncate:
+    def test_short_text_unchanged(self):
+        assert truncate("short text", 50) == "short text"
+
+    def test_cuts_at_word_boundary(self):
+        assert truncate("the quick brown fox", 12) == "the quick…"
+
+    def test_preview_collapses_whitespace(self):
+        assert preview("a\n\n  b   c", max_chars=50) == "a b c"
+
+
+class TestBestWindows:
+    @pytest.fixture
+    def encoded(self, monkeypatch):
+        calls: list[list[str]] = []
+
+        def fake_encode(texts):
+            calls.append(list(texts))
+            vectors = [[1.0, 0.0] if "flight" in t else [0.0, 1.0] for t in texts]
+            return np.array(vectors, dtype=np.float32)
+
+        monkeypatch.setattr(snippets, "encode_array", fake_encode)
+        return calls
+
+    @pytest.mark.asyncio
+    async def test_picks_most_similar_window(self, encoded):
+        text = "The court met in the morning. Counsel argued. The flight log lists passengers."
+        result = await best_windows("passengers", [1.0, 0.0], [text, "Short chunk."], max_chars=35)
+        assert result == ["The flight log lists passengers.", "Short chunk."]
+        # Three windows fit under the default shortlist size; the single-window chunk is not encoded
+        assert len(encoded) == 1 and len(encoded[0]) == 3
+
+    @pytest.mark.asyncio
+    async def test_encodes_only_shortlisted_windows(self, encoded):
+        # 40 one-sentence windows per hit; only the one naming the query terms is relevant
+        filler = " ".join(f"Exhibit {i} was entered into the record." for i in range(39))
+        texts = [f"{filler} The flight log for hit {n} lists passengers." for n in range(5)]
+        texts.append("Short chunk.")
+
+        result = await best_windows(
+            "flight log passengers", [1.0, 0.0], texts, max_chars=60, max_windows=2
+        )
+
+        assert len(encoded) == 1
+        assert len(encoded[0]) == 5 * 2
+        assert result[:5] == [f"The flight log for hit {n} lists passengers." for n in range(5)]
+        assert result[5] == "Short chunk."
+
+    @pytest.mark.asyncio
+    async def test_batch_scores_each_query_in_one_call(self, encoded):
+        text = "The flight log lists passengers. The court met in the morning."
+
+        result = await best_windows_batch(
+            [("flight", [1.0, 0.0], [text]), ("court", [0.0, 1.0], [text, "Short chunk."]), ("none", [1.0, 0.0], [])],
+            max_chars=35,
+        )
+
+        assert result == [
+            ["The flight log lists passengers."],
+            ["The court met in the morning.", "Short chunk."],
+            [],
+        ]
+        assert len(encoded) == 1 and len(encoded[0]) == 4
+
+
+class TestShortlistWindows:
+    def test_ranks_by_term_overlap(self):
+        windows = ["nothing here", "Flight records", "the flight log", "log only"]
+        assert shortlist_windows("flight log", windows, 2) == [2, 1]
+
+    def test_no_overlap_keeps_leading_windows(self):
+        assert shortlist_windows("maxwell", ["a", "b", "c"], 2) == [0, 1]
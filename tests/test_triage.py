@@ -0,0 +1,230 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import select, update
+
+from watchdog.config import settings
+from watchdog.models.document import Anomaly, Chunk, Document, Entity
+from watchdog.pipeline import triage
+from watchdog.services.triage_cache import TriageCache
+
+
+@pytest.fixture(autouse=True)
+def triage_cache(tmp_path, monkeypatch):
+    cache = TriageCache(tmp_path / "triage.sqlite3")
+    monkeypatch.setattr(triage, "get_triage_cache", lambda: cache)
+    return cache
+
+
+async def seed(factory, documents: int, chunks_per_document: int) -> None:
+    async with factory() as session:
+        for d in range(documents):
+            session.add(Document(id=f"d{d}", source_type="doj", filename=f"{d}.pdf", sha256=f"h{d}", status="chunked"))
+            for c in range(chunks_per_document):
+                session.add(
+                    Chunk(id=f"d{d}-c{c}", document_id=f"d{d}", chunk_index=c, text=f"score {c / 10}", token_count=3)
+                )
+        await session.commit()
+
+
+class TestConcurrentTriage:
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency_and_document_priority(self, sqlite_session_factory, monkeypatch):
+        in_flight = 0
+        peak = 0
+
+        async def fake_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            score = float(prompt.rsplit("score ", 1)[1].split()[0])
+            return json.dumps({
+                "priority_score": score,
+                "entities": [{"name": "john doe", "type": "person", "context": "named"}],
+                "relationships": [],
+                "anomalies": [{"type": "timeline", "severity": "high"}] if score >= 0.3 else [],
+            })
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", fake_call_claude)
+        monkeypatch.setattr(settings, "max_concurrent_api_calls", 3)
+        await seed(sqlite_session_factory, documents=3, chunks_per_document=4)
+
+        stats = await triage.run_triage()
+
+        assert peak == 3
+        assert stats["documents_triaged"] == 3
+        assert stats["chunks_analyzed"] == 12
+        assert stats["anomalies_found"] == 3
+        async with sqlite_session_factory() as session:
+            docs = (await session.execute(select(Document))).scalars().all()
+            assert {d.status for d in docs} == {"triaged"}
+            assert {d.priority_score for d in docs} == {0.3}
+            entity = (await session.execute(select(Entity))).scalar_one()
+            assert entity.mention_count == 12
+            assert len((await session.execute(select(Anomaly))).scalars().all()) == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_call_leaves_chunk_pending(self, sqlite_session_factory, monkeypatch):
+        async def flaky_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            if "score 0.1" in prompt:
+                raise RuntimeError("overloaded")
+            return json.dumps({"priority_score": 0.5})
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", flaky_call_claude)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=2)
+
+        stats = await triage.run_triage()
+
+        assert (stats["chunks_analyzed"], stats["chunks_failed"]) == (1, 1)
+        assert (stats["documents_triaged"], stats["documents_incomplete"]) == (0, 1)
+        async with sqlite_session_factory() as session:
+            pending = (
+                await session.execute(select(Chunk.id).where(Chunk.priority_score.is_(None)))
+            ).scalars().all()
+            assert pending == ["d0-c1"]
+            assert (await session.get(Document, "d0")).status == "chunked"
+
+    @pytest.mark.asyncio
+    async def test_writer_failure_stops_workers(self, sqlite_session_factory, monkeypatch):
+        calls = 0
+
+        async def fake_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return json.dumps({"priority_score": 0.5})
+
+        async def broken_finalize(session, document_id):
+            raise RuntimeError("database went away")
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", fake_call_claude)
+        monkeypatch.setattr(triage, "finalize_document", broken_finalize)
+        monkeypatch.setattr(settings, "max_concurrent_api_calls", 2)
+        await seed(sqlite_session_factory, documents=10, chunks_per_document=3)
+        async with sqlite_session_factory() as session:
+            # Distinct texts, so no chunk is answered from the triage cache
+            await session.execute(update(Chunk).values(text=Chunk.id))
+            await session.commit()
+
+        with pytest.raises(RuntimeError, match="database went away"):
+            await triage.run_triage()
+
+        # Only the chunks already in flight when the first document failed were sent
+        assert calls < 10
+
+
+class TestTriageCacheReplay:
+    @pytest.mark.asyncio
+    async def test_rerun_replays_cached_results(self, sqlite_session_factory, monkeypatch, triage_cache):
+        calls = 0
+
+        async def fake_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            nonlocal calls
+            calls += 1
+            return json.dumps({"priority_score": 0.6, "anomalies": [{"type": "timeline", "severity": "high"}]})
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", fake_call_claude)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=2)
+        await triage.run_triage()
+        assert calls == 2
+
+        # Simulate a status reset: the same chunks come back for triage
+        async with sqlite_session_factory() as session:
+            await session.execute(update(Chunk).values(priority_score=None))
+            await session.execute(update(Document).values(status="chunked"))
+            await session.commit()
+        stats = await triage.run_triage()
+
+        assert calls == 2
+        assert stats["anomalies_found"] == 2
+        async with sqlite_session_factory() as session:
+            assert (await session.get(Document, "d0")).priority_score == 0.6
+            assert len((await session.execute(select(Anomaly))).scalars().all()) == 4
+
+    def test_invalidate_stale_prompt_versions(self, triage_cache):
+        triage_cache.put("DOCUMENT CHUNK:\nx", "old", settings.claude_model, "{}")
+        triage_cache.put("DOCUMENT CHUNK:\nx", triage.triage_prompt_version(), settings.claude_model, "{}")
+
+        assert triage.invalidate_triage_cache() == {"deleted": 1, "prompt_versions": ["old"]}
+        assert triage_cache.versions() == {triage.triage_prompt_version(): 1}
+
+
+class TestCascadeTriage:
+    @pytest.mark.asyncio
+    async def test_escalates_only_significant_chunks(self, sqlite_session_factory, monkeypatch):
+        calls: list[tuple[str, str]] = []
+
+        async def fake_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            calls.append((model, operation))
+            score = float(prompt.rsplit("score ", 1)[1].split()[0])
+            if model == settings.claude_screening_model:
+                anomalies = [{"type": "timeline", "severity": "low"}] if score == 0.1 else []
+                return json.dumps({"priority_score": score, "anomalies": anomalies})
+            return json.dumps({"priority_score": 0.9, "anomalies": [{"type": "timeline", "severity": "high"}]})
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", fake_call_claude)
+        monkeypatch.setattr(settings, "cascade_escalation_threshold", 0.3)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=4)
+
+        stats = await triage.run_triage(cascade=True)
+
+        # Every chunk is screened; 0.1 (anomaly) and 0.3 (threshold) are escalated
+        assert calls.count((settings.claude_screening_model, "triage_screen")) == 4
+        assert calls.count((settings.claude_model, "triage")) == 2
+        assert stats["chunks_escalated"] == 2
+        assert stats["escalation_rate"] == 0.5
+        async with sqlite_session_factory() as session:
+            scores = dict((await session.execute(select(Chunk.id, Chunk.priority_score))).all())
+            assert scores == {"d0-c0": 0.0, "d0-c1": 0.9, "d0-c2": 0.2, "d0-c3": 0.9}
+            assert (await session.get(Document, "d0")).priority_score == 0.9
+            assert {a.severity for a in (await session.execute(select(Anomaly))).scalars()} == {"high"}
+
+    @pytest.mark.asyncio
+    async def test_failed_escalation_is_retried(self, sqlite_session_factory, monkeypatch):
+        calls: list[str] = []
+        escalation_up = False
+
+        async def fake_call_claude(prompt, operation, document_id=None, max_tokens=2000, model=None, system=None):
+            calls.append(model)
+            if model == settings.claude_screening_model:
+                score = float(prompt.rsplit("score ", 1)[1].split()[0])
+                return json.dumps({"priority_score": score})
+            if not escalation_up:
+                raise RuntimeError("overloaded")
+            return json.dumps({"priority_score": 0.8})
+
+        monkeypatch.setattr(triage, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(triage, "call_claude", fake_call_claude)
+        monkeypatch.setattr(settings, "cascade_escalation_threshold", 0.1)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=2)
+
+        stats = await triage.run_triage(cascade=True)
+
+        assert (stats["chunks_analyzed"], stats["chunks_failed"]) == (1, 1)
+        assert (stats["chunks_escalated"], stats["escalations_failed"]) == (0, 1)
+        assert stats["escalation_rate"] == 0.0
+        assert stats["documents_incomplete"] == 1
+        async with sqlite_session_factory() as session:
+            doc = await session.get(Document, "d0")
+            assert (doc.status, doc.priority_score) == ("chunked", None)
+            assert (await session.get(Chunk, "d0-c1")).priority_score is None
+
+        # The screening result is replayed from the cache; only the escalation is called again
+        calls.clear()
+        escalation_up = True
+        stats = await triage.run_triage(cascade=True)
+
+        assert calls == [settings.claude_model]
+        assert (stats["chunks_analyzed"], stats["chunks_escalated"], stats["escalations_failed"]) == (1, 1, 0)
+        assert stats["documents_triaged"] == 1
+        async with sqlite_session_factory() as session:
+            doc = await session.get(Document, "d0")
+            assert (doc.status, doc.priority_score) == ("triaged", 0.8)
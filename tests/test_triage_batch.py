@@ -0,0 +1,232 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import select
+
+from watchdog.config import settings
+from watchdog.models.document import Chunk, Document, Entity, Expense, TriageBatch
+from watchdog.pipeline import triage, triage_batch
+from watchdog.services import claude_client
+from watchdog.services.cost_tracker import calculate_cost
+from watchdog.services.triage_cache import TriageCache
+
+
+class StubBatchesHandler(BaseHTTPRequestHandler):
+    """Minimal Message Batches endpoints: create, retrieve and a JSONL results file."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: str, content_type: str = "application/json") -> None:
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch(self, batch_id: str) -> dict:
+        ended = self.server.ended
+        port = self.server.server_address[1]
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2026-10-19T00:00:00Z",
+            "expires_at": "2026-10-20T00:00:00Z",
+            "ended_at": "2026-10-19T01:00:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://127.0.0.1:{port}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        batch_id = f"msgbatch_{len(self.server.batches)}"
+        self.server.batches[batch_id] = body["requests"]
+        self._send(json.dumps(self._batch(batch_id)))
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/(\w+)(/results)?", self.path)
+        batch_id = match.group(1)
+        if not match.group(2):
+            self._send(json.dumps(self._batch(batch_id)))
+            return
+        lines = []
+        for request in self.server.batches[batch_id]:
+            prompt = request["params"]["messages"][0]["content"]
+            if "score 0.1" in prompt and request["custom_id"] not in self.server.errored:
+                # Transient: fails the first time each chunk is sent
+                self.server.errored.add(request["custom_id"])
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "overloaded"}}}
+            else:
+                score = float(prompt.rsplit("score ", 1)[1].split()[0])
+                text = json.dumps({"priority_score": score, "entities": [{"name": "jane roe", "type": "person"}]})
+                result = {
+                    "type": "succeeded",
+                    "message": {
+                        "id": "msg_1",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": request["params"]["model"],
+                        "content": [{"type": "text", "text": text}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 1000, "output_tokens": 100},
+                    },
+                }
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        self._send("\n".join(lines) + "\n", "application/binary")
+
+
+@pytest.fixture(autouse=True)
+def triage_cache(tmp_path, monkeypatch):
+    cache = TriageCache(tmp_path / "triage.sqlite3")
+    monkeypatch.setattr(triage, "get_triage_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBatchesHandler)
+    server.batches = {}
+    server.errored = set()
+    server.ended = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "anthropic_api_key", "test-key")
+    monkeypatch.setattr(settings, "anthropic_base_url", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(claude_client, "_client", None)
+    yield server
+    server.shutdown()
+
+
+async def seed(factory, documents: int, chunks_per_document: int) -> None:
+    async with factory() as session:
+        for d in range(documents):
+            session.add(Document(id=f"d{d}", source_type="doj", filename=f"{d}.pdf", sha256=f"h{d}", status="chunked"))
+            for c in range(chunks_per_document):
+                session.add(
+                    Chunk(id=f"d{d}-c{c}", document_id=f"d{d}", chunk_index=c, text=f"score {c / 10}", token_count=3)
+                )
+        await session.commit()
+
+
+class TestBatchTriage:
+    @pytest.mark.asyncio
+    async def test_round_trip(self, sqlite_session_factory, stub_api, monkeypatch, triage_cache):
+        monkeypatch.setattr(triage_batch, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(settings, "triage_batch_size", 4)
+        monkeypatch.setattr(settings, "triage_batch_poll_seconds", 0.01)
+        stub_api.ended = True
+        await seed(sqlite_session_factory, documents=2, chunks_per_document=3)
+
+        stats = await triage_batch.run_batch_triage()
+
+        assert stats["batches_submitted"] == 2
+        # Pages follow chunk ids, so d1 is split across both batches and still sent whole
+        assert [r["custom_id"] for r in stub_api.batches["msgbatch_0"]] == ["d0-c0", "d0-c1", "d0-c2", "d1-c0"]
+        assert [r["custom_id"] for r in stub_api.batches["msgbatch_1"]] == ["d1-c1", "d1-c2"]
+        assert (stats["chunks_analyzed"], stats["chunks_failed"]) == (4, 2)
+        # Each document has an errored request, so neither is finalized yet
+        assert stats["documents_triaged"] == 0
+        async with sqlite_session_factory() as session:
+            docs = (await session.execute(select(Document))).scalars().all()
+            assert {d.status for d in docs} == {"chunked"}
+            chunks = (await session.execute(select(Chunk).order_by(Chunk.id))).scalars().all()
+            assert all(c.triage_batch_id is None for c in chunks)
+            assert [c.id for c in chunks if c.priority_score is None] == ["d0-c1", "d1-c1"]
+            batches = (await session.execute(select(TriageBatch))).scalars().all()
+            assert sum(b.failed_count for b in batches) == 2
+
+        # The next run resubmits only the chunks whose requests failed
+        stats = await triage_batch.run_batch_triage()
+
+        assert stats["batches_submitted"] == 1
+        assert len(stub_api.batches["msgbatch_2"]) == 2
+        assert (stats["chunks_analyzed"], stats["chunks_failed"]) == (2, 0)
+        assert stats["documents_triaged"] == 2
+        assert stats["max_priority"] == 0.2
+        async with sqlite_session_factory() as session:
+            docs = (await session.execute(select(Document))).scalars().all()
+            assert {(d.status, d.priority_score) for d in docs} == {("triaged", 0.2)}
+            chunks = (await session.execute(select(Chunk))).scalars().all()
+            assert all(c.priority_score is not None for c in chunks)
+            expenses = (await session.execute(select(Expense))).scalars().all()
+            assert len(expenses) == 6
+            assert expenses[0].cost_usd == calculate_cost(settings.claude_model, 1000, 100, batch=True)
+            batches = (await session.execute(select(TriageBatch))).scalars().all()
+            assert {b.status for b in batches} == {"applied"}
+        # Both documents share chunk texts, so six results fill three cache entries
+        assert sum(triage_cache.versions().values()) == 3
+
+    @pytest.mark.asyncio
+    async def test_cached_chunks_are_not_submitted(self, sqlite_session_factory, stub_api, monkeypatch, triage_cache):
+        monkeypatch.setattr(triage_batch, "async_session_factory", sqlite_session_factory)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=1)
+        triage_cache.put(
+            triage.build_triage_prompt("score 0.0"),
+            triage.triage_prompt_version(),
+            settings.claude_model,
+            '{"priority_score": 0.7}',
+        )
+
+        assert await triage_batch.submit_triage_batches() == []
+        assert stub_api.batches == {}
+        async with sqlite_session_factory() as session:
+            document = await session.get(Document, "d0")
+            assert (document.status, document.priority_score) == ("triaged", 0.7)
+
+    @pytest.mark.asyncio
+    async def test_limit_pages_within_documents(self, sqlite_session_factory, stub_api, monkeypatch, triage_cache):
+        monkeypatch.setattr(triage_batch, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(settings, "triage_batch_size", 2)
+        await seed(sqlite_session_factory, documents=3, chunks_per_document=3)
+        # d0-c0 is a cache hit, so the first page sends one request
+        triage_cache.put(
+            triage.build_triage_prompt("score 0.0"),
+            triage.triage_prompt_version(),
+            settings.claude_model,
+            '{"priority_score": 0.7}',
+        )
+
+        assert await triage_batch.submit_triage_batches(limit=2) == ["msgbatch_0", "msgbatch_1", "msgbatch_2"]
+        sent = [r["custom_id"] for batch in stub_api.batches.values() for r in batch]
+        assert sent == ["d0-c1", "d0-c2", "d1-c1", "d1-c2"]
+        async with sqlite_session_factory() as session:
+            assert (await session.get(Chunk, "d1-c0")).priority_score == 0.7
+            pending = (await session.execute(select(Chunk.id).where(Chunk.triage_batch_id.isnot(None)))).scalars().all()
+            assert sorted(pending) == sent
+
+    @pytest.mark.asyncio
+    async def test_resumes_after_restart(self, sqlite_session_factory, stub_api, monkeypatch):
+        monkeypatch.setattr(triage_batch, "async_session_factory", sqlite_session_factory)
+        await seed(sqlite_session_factory, documents=1, chunks_per_document=3)
+        async with sqlite_session_factory() as session:
+            # Left behind by a run that died between reserving chunks and submitting them
+            session.add(TriageBatch(id="orphan", model=settings.claude_model, status="pending"))
+            await session.flush()
+            (await session.get(Chunk, "d0-c2")).triage_batch_id = "orphan"
+            await session.commit()
+
+        assert await triage_batch.submit_triage_batches() == ["msgbatch_0"]
+        assert len(stub_api.batches["msgbatch_0"]) == 3
+        assert (await triage_batch.collect_triage_batches())["batches_pending"] == 1
+
+        # A fresh process finds the submitted batch and applies it exactly once
+        monkeypatch.setattr(claude_client, "_client", None)
+        stub_api.ended = True
+        stats = await triage_batch.collect_triage_batches()
+        assert stats["batches_applied"] == 1
+        assert (await triage_batch.collect_triage_batches())["batches_applied"] == 0
+
+        async with sqlite_session_factory() as session:
+            assert (await session.get(TriageBatch, "orphan")).status == "failed"
+            # d0-c1's request errored, so d0 waits for the next submission
+            assert (await session.get(Document, "d0")).status == "chunked"
+            entity = (await session.execute(select(Entity))).scalar_one()
+            assert entity.mention_count == 2
@@ -0,0 +1,36 @@
+from watchdog.services.triage_cache import TriageCache
+
+
+def make_cache(tmp_path):
+    return TriageCache(tmp_path / "triage.sqlite3")
+
+
+class TestTriageCache:
+    def test_miss_then_hit(self, tmp_path):
+        cache = make_cache(tmp_path)
+        assert cache.get("chunk", "v1", "model-a") is None
+        cache.put("chunk", "v1", "model-a", '{"priority_score": 0.4}')
+        assert cache.get("chunk", "v1", "model-a") == '{"priority_score": 0.4}'
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_keyed_by_prompt_version_and_model(self, tmp_path):
+        cache = make_cache(tmp_path)
+        cache.put("chunk", "v1", "model-a", "{}")
+        assert cache.get("chunk", "v2", "model-a") is None
+        assert cache.get("chunk", "v1", "model-b") is None
+        assert cache.get("chunk ", "v1", "model-a") is None
+
+    def test_persists_across_instances(self, tmp_path):
+        make_cache(tmp_path).put("chunk", "v1", "model-a", "{}")
+        assert make_cache(tmp_path).get("chunk", "v1", "model-a") == "{}"
+
+    def test_invalidate_by_prompt_version(self, tmp_path):
+        cache = make_cache(tmp_path)
+        cache.put("a", "v1", "model-a", "{}")
+        cache.put("b", "v1", "model-b", "{}")
+        cache.put("a", "v2", "model-a", "{}")
+        assert cache.versions() == {"v1": 2, "v2": 1}
+        assert cache.invalidate("v1") == 2
+        assert cache.get("a", "v1", "model-a") is None
+        assert cache.get("a", "v2", "model-a") == "{}"
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from watchdog.config import settings
+from watchdog.database import engine_options, is_sqlite
+from watchdog.models.base import VectorBlob
+from watchdog.models.document import Chunk, Document
+from watchdog.services import vector_index
+from watchdog.services.vector_index import IndexVersion, VectorIndex, top_k
+
+
+def unit_rows(n: int, dim: int = 384, seed: int = 0) -> np.ndarray:
+    rows = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+class TestTopK:
+    def test_matches_brute_force_across_blocks(self, monkeypatch):
+        monkeypatch.setattr(vector_index, "_SCAN_BLOCK", 64)
+        vectors = unit_rows(500)
+        query = vectors[123]
+        idx, distances = top_k(vectors, query, 10)
+        expected = np.argsort(-(vectors @ query))[:10]
+        assert idx.tolist() == expected.tolist()
+        assert distances[0] < 1e-5
+        assert np.all(np.diff(distances) >= 0)
+
+    def test_mask_excludes_rows(self):
+        vectors = unit_rows(50)
+        mask = np.zeros(50, dtype=bool)
+        mask[[3, 7]] = True
+        idx, _ = top_k(vectors, vectors[0], 10, mask)
+        assert sorted(idx.tolist()) == [3, 7]
+
+    def test_k_larger_than_rows(self):
+        idx, _ = top_k(unit_rows(4), unit_rows(1, seed=1)[0], 10)
+        assert sorted(idx.tolist()) == [0, 1, 2, 3]
+
+
+class TestVectorIndex:
+    def test_write_and_search(self, tmp_path):
+        vectors = unit_rows(100)
+        ids = [f"chunk-{i}" for i in range(100)]
+        index = VectorIndex(tmp_path)
+        index.write(ids, vectors, dtype="float16")
+
+        hits = index.search(vectors[42].tolist(), 3)
+        assert hits[0][0] == "chunk-42"
+        assert hits[0][1] < 1e-3
+        assert index.vectors.dtype == np.float16
+
+    def test_allowed_ids(self, tmp_path):
+        vectors = unit_rows(20)
+        index = VectorIndex(tmp_path)
+        index.write([f"c{i}" for i in range(20)], vectors)
+        hits = index.search(vectors[0].tolist(), 5, allowed_ids={"c5", "c6", "missing"})
+        assert {chunk_id for chunk_id, _ in hits} == {"c5", "c6"}
+
+    def test_missing_index_returns_nothing(self, tmp_path):
+        assert VectorIndex(tmp_path / "none").search([0.0] * 384, 5) == []
+
+    def test_rebuild_swaps_ids_and_vectors_together(self, tmp_path):
+        reader = VectorIndex(tmp_path)
+        VectorIndex(tmp_path).write([f"a{i}" for i in range(10)], unit_rows(10))
+        old = reader.load()
+
+        for n, seed in ((20, 1), (30, 2)):
+            VectorIndex(tmp_path).write([f"b{i}" for i in range(n)], unit_rows(n, seed=seed))
+
+        # A reader keeps the build it mapped until it loads again, then sees the new one whole
+        assert (len(old.ids), len(old.vectors)) == (10, 10)
+        assert len(reader) == 30
+        assert (len(reader.ids), len(reader.vectors)) == (30, 30)
+        # Only the current build and the one before it stay on disk
+        assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2
+
+    def test_mismatched_build_rejected(self):
+        with pytest.raises(ValueError):
+            IndexVersion("v1", np.array(["a", "b"]), unit_rows(3))
+
+    def test_builder_checks_row_count(self, tmp_path):
+        builder = VectorIndex(tmp_path).builder(3)
+        builder.append(["a", "b"], unit_rows(2))
+        with pytest.raises(ValueError):
+            builder.publish()
+        assert not VectorIndex(tmp_path).load()
+
+
+class TestVectorIndexBuild:
+    @pytest.mark.asyncio
+    async def test_streams_pages_into_index(self, sqlite_session_factory, monkeypatch, tmp_path):
+        monkeypatch.setattr(vector_index, "async_session_factory", sqlite_session_factory)
+        monkeypatch.setattr(settings, "data_dir", tmp_path)
+        monkeypatch.setattr(vector_index, "_index", None)
+        vectors = unit_rows(25)
+        async with sqlite_session_factory() as session:
+            session.add(Document(id="d", source_type="doj", filename="d.pdf", sha256="h"))
+            for i in range(26):
+                session.add(
+                    Chunk(
+                        id=f"c{i:02}", document_id="d", chunk_index=i, text="x", token_count=1,
+                        embedding=vectors[i] if i < 25 else None,
+                    )
+                )
+            await session.commit()
+
+        assert await vector_index.run_vector_index_build(batch_size=4) == 25
+
+        index = vector_index.get_vector_index()
+        assert index.load().ids.tolist() == [f"c{i:02}" for i in range(25)]
+        assert index.search(vectors[7].tolist(), 1)[0][0] == "c07"
+
+
+class TestEmbeddedBackend:
+    def test_backend_detection(self):
+        assert is_sqlite("sqlite+aiosqlite:///data/watchdog.db")
+        assert not is_sqlite("postgresql+asyncpg://u:p@localhost/watchdog")
+        assert "pool_size" not in engine_options("sqlite+aiosqlite:///data/watchdog.db")
+
+    def test_vector_blob_round_trip(self):
+        blob_type = VectorBlob(3)
+        stored = blob_type.process_bind_param([0.5, -1.0, 2.0], None)
+        assert isinstance(stored, bytes)
+        assert blob_type.process_result_value(stored, None).tolist() == [0.5, -1.0, 2.0]